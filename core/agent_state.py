@@ -6,6 +6,8 @@ from typing import TypedDict, Annotated, List, Union, Literal, TYPE_CHECKING, Se
 from langchain_core.messages import BaseMessage
 from plotly.graph_objects import Figure as PlotlyFigure
 
+from core.connectivity.parquet_adapter import QueryResultStream
+
 import core  # Adicionado para garantir que 'core' esteja no escopo global para avaliação de tipos em string
 # Importar RouteDecision diretamente para uso em anotações de tipo
 RouteDecision = Literal["tool", "code"]
@@ -19,7 +21,7 @@ if TYPE_CHECKING:
 
 class AgentState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], operator.add]
-    retrieved_data: Optional[List[Dict[str, Any]]]
+    retrieved_data: Optional[Union[List[Dict[str, Any]], QueryResultStream]]
     chart_code: Optional[str]
     plotly_fig: Optional[PlotlyFigure]
     plotly_spec: Optional[Dict[str, Any]]
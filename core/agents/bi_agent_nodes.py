@@ -14,7 +14,7 @@ from core.agent_state import AgentState
 from core.llm_base import BaseLLMAdapter
 from core.agents.code_gen_agent import CodeGenAgent
 from core.tools.data_tools import fetch_data_from_query
-from core.connectivity.parquet_adapter import ParquetAdapter
+from core.connectivity.parquet_adapter import ParquetAdapter, QueryResultStream
 
 
 from core.utils.json_utils import _clean_json_values # Import the cleaning function
@@ -22,6 +22,10 @@ from core.utils.json_utils import _clean_json_values # Import the cleaning funct
 
 logger = logging.getLogger(__name__)
 
+# Linhas materializadas a partir do stream de resultados para cada consumidor
+DATA_RESPONSE_ROW_LIMIT = 1000   # tabela exibida ao usuário
+CHART_DATA_ROW_LIMIT = 5000      # dados entregues ao CodeGenAgent
+
 def classify_intent(state: AgentState, llm_adapter: BaseLLMAdapter) -> Dict[str, Any]:
     """
     Classifica a intenção do utilizador usando um LLM e extrai entidades.
@@ -221,7 +225,10 @@ def execute_query(state: AgentState, parquet_adapter: ParquetAdapter) -> Dict[st
         retrieved_data = fetch_data_from_query.invoke({"query_filters": parquet_filters, "parquet_adapter": parquet_adapter})
 
     # ✅ LOG DETALHADO DOS RESULTADOS
-    if isinstance(retrieved_data, list):
+    if isinstance(retrieved_data, QueryResultStream):
+        logger.info(f"✅ QUERY SUCCESS: {retrieved_data.total_rows} rows available (streaming)")
+        logger.info(f"📋 DATA COLUMNS: {retrieved_data.columns}")
+    elif isinstance(retrieved_data, list):
         if retrieved_data and "error" in retrieved_data[0]:
             logger.error(f"❌ QUERY ERROR: {retrieved_data[0]}")
         else:
@@ -239,6 +246,9 @@ def generate_plotly_spec(state: AgentState, llm_adapter: BaseLLMAdapter, code_ge
     """
     logger.info("Nó: generate_plotly_spec")
     raw_data = state.get("retrieved_data")
+    if isinstance(raw_data, QueryResultStream):
+        # Materializar apenas as linhas que o gráfico vai usar
+        raw_data = raw_data.to_records(limit=CHART_DATA_ROW_LIMIT)
     user_query = state['messages'][-1].content
     plan = state.get("plan", {})
     intent = plan.get("intent")
@@ -353,8 +363,15 @@ def format_final_response(state: AgentState) -> Dict[str, Any]:
         response = {"type": "chart", "content": chart_content}
         logger.info(f"📈 CHART RESPONSE for query: '{user_query}'")
     elif state.get("retrieved_data"):
-        response = {"type": "data", "content": _clean_json_values(state.get("retrieved_data"))}
-        logger.info(f"📊 DATA RESPONSE for query: '{user_query}' - {len(state.get('retrieved_data', []))} rows")
+        retrieved_data = state.get("retrieved_data")
+        if isinstance(retrieved_data, QueryResultStream):
+            # Ler apenas as linhas que serão exibidas; o total vem da contagem
+            total_rows = retrieved_data.total_rows
+            retrieved_data = retrieved_data.to_records(limit=DATA_RESPONSE_ROW_LIMIT)
+        else:
+            total_rows = len(retrieved_data)
+        response = {"type": "data", "content": _clean_json_values(retrieved_data), "total_rows": total_rows}
+        logger.info(f"📊 DATA RESPONSE for query: '{user_query}' - {len(retrieved_data)} of {total_rows} rows")
     else:
         response = {"type": "text", "content": "Não consegui processar a sua solicitação."}
         logger.warning(f"❓ DEFAULT RESPONSE for query: '{user_query}' - No specific response type matched")
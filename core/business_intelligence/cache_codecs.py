@@ -0,0 +1,292 @@
+"""
+Codecs do SmartCache - Serialização e compressão das entradas em disco
+Um codec é um serializador (pickle, orjson, msgpack) combinado com um compressor
+(gzip, zstd, lz4 ou nenhum), com nome "serializador+compressor". Cada entrada leva
+no cabeçalho o codec que a gravou, então entradas de codecs diferentes convivem no
+mesmo diretório e a troca de codec não invalida o cache. Arquivos antigos (pickle
+com gzip, sem cabeçalho) continuam legíveis.
+
+Os serializadores JSON/msgpack não executam código ao ler e não dependem das classes
+do Python que gravou. Datas e figuras plotly vão marcadas e são reconstruídas na
+leitura; arrays numpy viram listas, tuplas viram listas e NaN vira null no JSON.
+Uma entrada que o serializador não representa (ex.: DataFrame, chaves não-texto)
+é gravada com pickle e o mesmo compressor, e o cabeçalho registra isso.
+"""
+
+import gzip
+import logging
+import os
+import pickle
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+try:
+    import lz4.frame
+    LZ4_AVAILABLE = True
+except ImportError:
+    LZ4_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Cabeçalho: MAGIC + 1 byte com o tamanho do nome do codec + nome (ascii)
+MAGIC = b"SCC1"
+GZIP_MAGIC = b"\x1f\x8b"
+LEGACY_CODEC = "pickle+gzip"
+
+# Codec das novas entradas: orjson+zstd (dependências do requirements.txt); pickle+gzip
+# só num ambiente sem elas
+DEFAULT_CODEC = os.getenv("SMART_CACHE_CODEC") or (
+    "orjson+zstd" if ORJSON_AVAILABLE and ZSTD_AVAILABLE else LEGACY_CODEC)
+if DEFAULT_CODEC == LEGACY_CODEC and not os.getenv("SMART_CACHE_CODEC"):
+    logger.warning("orjson/zstandard não instalados (ver requirements.txt) - SmartCache gravando com pickle+gzip")
+
+# Marcas dos objetos reconstruídos pelos serializadores sem pickle
+TAG_DATETIME = "__datetime__"
+TAG_PLOTLY = "__plotly__"
+
+
+def _to_plain(obj: Any) -> Any:
+    """default dos serializadores: tipos fora do JSON/msgpack viram valores simples ou marcados."""
+    if isinstance(obj, datetime):
+        return {TAG_DATETIME: obj.isoformat()}
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, "to_plotly_json"):
+        return {TAG_PLOTLY: obj.to_plotly_json()}
+    raise TypeError(f"Tipo não serializável sem pickle: {type(obj).__name__}")
+
+
+def _from_plain(obj: Dict[str, Any]) -> Any:
+    """Reconstrói um dict marcado (object_hook)."""
+    if len(obj) == 1:
+        if TAG_DATETIME in obj:
+            return datetime.fromisoformat(obj[TAG_DATETIME])
+        if TAG_PLOTLY in obj:
+            import plotly.graph_objects as go
+            return go.Figure(obj[TAG_PLOTLY])
+    return obj
+
+
+def _revive(obj: Any) -> Any:
+    """
+    Aplica _from_plain de baixo para cima (para o orjson, que não tem object_hook),
+    no lugar: só contêineres são visitados, escalares ficam como vieram.
+    """
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if isinstance(value, (dict, list)):
+                obj[key] = _revive(value)
+        return _from_plain(obj)
+    for i, value in enumerate(obj):
+        if isinstance(value, (dict, list)):
+            obj[i] = _revive(value)
+    return obj
+
+
+class Serializer(ABC):
+    """Objeto <-> bytes. dumps levanta TypeError/ValueError se não representa o objeto."""
+
+    name = "base"
+
+    @abstractmethod
+    def dumps(self, obj: Any) -> bytes:
+        """Serializa o objeto."""
+        pass
+
+    @abstractmethod
+    def loads(self, data: bytes) -> Any:
+        """Reconstrói o objeto serializado por dumps."""
+        pass
+
+
+class PickleSerializer(Serializer):
+    name = "pickle"
+
+    def dumps(self, obj: Any) -> bytes:
+        return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data: bytes) -> Any:
+        return pickle.loads(data)
+
+
+class OrjsonSerializer(Serializer):
+    name = "orjson"
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_to_plain,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME)
+
+    def loads(self, data: bytes) -> Any:
+        obj = orjson.loads(data)
+        # Só percorre a estrutura se há marcas a reconstruir
+        return _revive(obj) if b'"__' in data and isinstance(obj, (dict, list)) else obj
+
+
+class MsgpackSerializer(Serializer):
+    name = "msgpack"
+
+    def dumps(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, default=_to_plain, datetime=False, strict_types=False)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, object_hook=_from_plain, strict_map_key=False)
+
+
+class Compressor:
+    name = "none"
+
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        return data
+
+
+class GzipCompressor(Compressor):
+    name = "gzip"
+
+    def __init__(self, level: int = 6):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return gzip.compress(data, compresslevel=self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return gzip.decompress(data)
+
+
+class ZstdCompressor(Compressor):
+    name = "zstd"
+
+    def __init__(self, level: int = 3):
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        # Um (de)compressor por chamada: os objetos do zstandard não são thread-safe
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+class Lz4Compressor(Compressor):
+    name = "lz4"
+
+    def compress(self, data: bytes) -> bytes:
+        return lz4.frame.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return lz4.frame.decompress(data)
+
+
+SERIALIZERS = {"pickle": PickleSerializer}
+if ORJSON_AVAILABLE:
+    SERIALIZERS["orjson"] = OrjsonSerializer
+if MSGPACK_AVAILABLE:
+    SERIALIZERS["msgpack"] = MsgpackSerializer
+
+COMPRESSORS = {"none": Compressor, "gzip": GzipCompressor}
+if ZSTD_AVAILABLE:
+    COMPRESSORS["zstd"] = ZstdCompressor
+if LZ4_AVAILABLE:
+    COMPRESSORS["lz4"] = Lz4Compressor
+
+# Todos os nomes conhecidos, instalados ou não (para distinguir "desconhecido" de "indisponível")
+KNOWN_SERIALIZERS = ("pickle", "orjson", "msgpack")
+KNOWN_COMPRESSORS = ("none", "gzip", "zstd", "lz4")
+
+
+class Codec:
+    """Serializador + compressor; encode/decode trabalham com o payload sem cabeçalho."""
+
+    def __init__(self, serializer: Serializer, compressor: Compressor):
+        self.serializer = serializer
+        self.compressor = compressor
+        self.name = f"{serializer.name}+{compressor.name}"
+
+    def encode(self, obj: Any) -> bytes:
+        return self.compressor.compress(self.serializer.dumps(obj))
+
+    def decode(self, payload: bytes) -> Any:
+        return self.serializer.loads(self.compressor.decompress(payload))
+
+
+_codecs: Dict[str, Codec] = {}
+
+
+def get_codec(name: str) -> Codec:
+    """
+    Codec pelo nome "serializador+compressor". ValueError se o nome é desconhecido;
+    ImportError se a biblioteca dele não está instalada.
+    """
+    codec = _codecs.get(name)
+    if codec is not None:
+        return codec
+    serializer, _, compressor = name.partition("+")
+    compressor = compressor or "none"
+    if serializer not in KNOWN_SERIALIZERS or compressor not in KNOWN_COMPRESSORS:
+        raise ValueError(f"Codec desconhecido: {name!r} (disponíveis: {', '.join(available_codecs())})")
+    if serializer not in SERIALIZERS or compressor not in COMPRESSORS:
+        raise ImportError(f"Codec {name!r} indisponível: biblioteca não instalada")
+    codec = _codecs[name] = Codec(SERIALIZERS[serializer](), COMPRESSORS[compressor]())
+    return codec
+
+
+def available_codecs() -> List[str]:
+    """Combinações serializador+compressor com as bibliotecas instaladas."""
+    return [f"{s}+{c}" for s in SERIALIZERS for c in COMPRESSORS]
+
+
+def encode_entry(obj: Any, codec: Codec) -> Tuple[bytes, str]:
+    """
+    Cabeçalho + payload da entrada. Se o serializador do codec não representa o
+    objeto, usa pickle com o mesmo compressor. Retorna os bytes e o codec usado.
+    """
+    try:
+        payload = codec.encode(obj)
+    except (TypeError, ValueError, OverflowError) as e:
+        if codec.serializer.name == "pickle":
+            raise
+        logger.debug(f"Codec {codec.name} não representa a entrada ({e}) - usando pickle")
+        codec = get_codec(f"pickle+{codec.compressor.name}")
+        payload = codec.encode(obj)
+    name = codec.name.encode("ascii")
+    return MAGIC + bytes([len(name)]) + name + payload, codec.name
+
+
+def decode_entry(data: bytes) -> Tuple[Any, str]:
+    """Objeto e nome do codec de uma entrada (com cabeçalho, ou pickle+gzip antigo)."""
+    if data[:len(MAGIC)] == MAGIC:
+        size = data[len(MAGIC)]
+        start = len(MAGIC) + 1
+        name = data[start:start + size].decode("ascii")
+        return get_codec(name).decode(data[start + size:]), name
+    if data[:2] == GZIP_MAGIC:
+        return get_codec(LEGACY_CODEC).decode(data), LEGACY_CODEC
+    raise ValueError("Entrada de cache sem cabeçalho de codec reconhecível")
@@ -0,0 +1,629 @@
+"""
+Camadas do SmartCache - Memória com orçamento em bytes e disco com manifesto
+A camada em memória guarda os resultados mais quentes dentro de um orçamento de
+bytes (tamanho estimado de cada entrada) e, ao passar dele, despeja pela política
+escolhida: LRU (menos recentemente usada) ou LFU (menos usada; empate pela mais
+antiga). Despejar uma entrada da memória não a tira do disco.
+
+A camada em disco mantém um manifesto (chave, bytes, último acesso, expiração e
+etiquetas, ex.: versão do dataset e colunas usadas) num journal append-only ao lado dos arquivos: gravar, ler e despejar custam O(1),
+sem listar o diretório. O diretório só é varrido quando o manifesto não existe.
+
+A fila write-behind tira a serialização e a gravação do caminho da resposta: um
+thread em segundo plano persiste as entradas, gravações repetidas da mesma chave
+pendente viram uma só, a fila é limitada (quem grava espera quando ela enche) e é
+esvaziada no encerramento do processo.
+"""
+
+import atexit
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# Orçamento e política padrão da camada em memória
+DEFAULT_MEMORY_BUDGET_MB = float(os.getenv("SMART_CACHE_MEMORY_MB", "64"))
+DEFAULT_MEMORY_POLICY = os.getenv("SMART_CACHE_MEMORY_POLICY", "lru")
+
+# Persistência em segundo plano e tamanho máximo da fila de gravações pendentes
+DEFAULT_WRITE_BEHIND = os.getenv("SMART_CACHE_WRITE_BEHIND", "1") == "1"
+DEFAULT_WRITE_QUEUE = int(os.getenv("SMART_CACHE_WRITE_QUEUE", "256"))
+
+EVICTION_POLICIES = ("lru", "lfu")
+
+# Journal do manifesto da camada em disco
+MANIFEST_FILE = "manifest.jsonl"
+
+# Compacta o journal quando ele passa de N linhas por entrada viva (e do mínimo)
+COMPACT_RATIO = 4
+COMPACT_MIN_LINES = 1024
+
+logger = logging.getLogger(__name__)
+
+
+# Sequências maiores que isso são estimadas por amostra (tamanho médio dos primeiros itens)
+SIZE_SAMPLE = 32
+
+
+def estimate_size(obj: Any, _seen: Optional[set] = None) -> int:
+    """
+    Bytes aproximados de um resultado: contêineres, strings, arrays/DataFrames,
+    figuras plotly (dados e layout) e, para outros objetos, os atributos. Objetos
+    compartilhados contam uma vez; sequências longas são extrapoladas de uma amostra.
+    """
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return sys.getsizeof(obj)
+    if isinstance(obj, np.ndarray):
+        if obj.dtype != object:
+            return obj.nbytes + sys.getsizeof(obj)
+        return sys.getsizeof(obj) + _sequence_size(obj.ravel(), seen)
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(np.sum(obj.memory_usage(deep=True)))
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(k, seen) + estimate_size(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + _sequence_size(obj, seen)
+    if isinstance(obj, (set, frozenset)):
+        return sys.getsizeof(obj) + sum(estimate_size(item, seen) for item in obj)
+    if hasattr(obj, "to_plotly_json") and hasattr(obj, "_data"):
+        # Figura plotly: traços e layout. Validadores e o tema (layout.template, ~50KB
+        # de dicts pequenos, igual em todas as figuras) ficam fora: percorrê-los custaria
+        # mais que o resto do set
+        layout = {k: v for k, v in (getattr(obj, "_layout", None) or {}).items() if k != "template"}
+        return sys.getsizeof(obj) + estimate_size(obj._data, seen) + estimate_size(layout, seen)
+    if hasattr(obj, "__dict__"):
+        return sys.getsizeof(obj) + estimate_size(vars(obj), seen)
+    return sys.getsizeof(obj)
+
+
+def _sequence_size(items, seen: set) -> int:
+    if len(items) <= SIZE_SAMPLE:
+        return sum(estimate_size(item, seen) for item in items)
+    sample = sum(estimate_size(items[i], seen) for i in range(SIZE_SAMPLE))
+    return sample * len(items) // SIZE_SAMPLE
+
+
+class MemoryTier:
+    """
+    Mapa chave -> entrada limitado a max_bytes, com despejo LRU ou LFU em O(1).
+
+    Args:
+        max_bytes: Orçamento em bytes (entradas maiores que ele não entram)
+        policy: "lru" ou "lfu"
+    """
+
+    def __init__(self, max_bytes: int, policy: str = "lru"):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Política de despejo desconhecida: {policy!r} (use {' ou '.join(EVICTION_POLICIES)})")
+        self.max_bytes = int(max_bytes)
+        self.policy = policy
+        self.bytes = 0
+        self._lock = threading.Lock()
+        # chave -> (entrada, bytes, frequência); na LRU a ordem do dict é a de uso
+        self._entries: "OrderedDict[Hashable, list]" = OrderedDict()
+        # LFU: frequência -> chaves com essa frequência (em ordem de uso) e a menor frequência
+        self._buckets: Dict[int, OrderedDict] = defaultdict(OrderedDict)
+        self._min_freq = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "rejected": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Entrada da chave (marcando o uso) ou None."""
+        with self._lock:
+            slot = self._entries.get(key)
+            if slot is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._touch(key, slot)
+            return slot[0]
+
+    def put(self, key: Hashable, item: Any, size: Optional[int] = None) -> bool:
+        """
+        Guarda a entrada (size estimado se não for dado) e despeja até caber no
+        orçamento. Retorna False se a entrada sozinha não cabe.
+        """
+        size = estimate_size(item) if size is None else int(size)
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                self._stats["rejected"] += 1
+                return False
+            while self._entries and self.bytes + size > self.max_bytes:
+                self._evict()
+            self._entries[key] = [item, size, 1]
+            self.bytes += size
+            if self.policy == "lfu":
+                self._buckets[1][key] = None
+                self._min_freq = 1
+            return True
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """Remove a chave; retorna a entrada (ou None)."""
+        with self._lock:
+            slot = self._remove(key)
+            return None if slot is None else slot[0]
+
+    def items(self) -> List[tuple]:
+        """Pares (chave, entrada), sem marcar uso."""
+        with self._lock:
+            return [(key, slot[0]) for key, slot in self._entries.items()]
+
+    def discard_where(self, predicate: Callable[[Hashable, Any], bool]) -> List[Hashable]:
+        """Remove as entradas em que predicate(chave, entrada) é verdadeiro; retorna as chaves."""
+        with self._lock:
+            keys = [key for key, slot in self._entries.items() if predicate(key, slot[0])]
+            for key in keys:
+                self._remove(key)
+            return keys
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._min_freq = 0
+            self.bytes = 0
+
+    def _touch(self, key: Hashable, slot: list) -> None:
+        if self.policy == "lru":
+            self._entries.move_to_end(key)
+            return
+        freq = slot[2]
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+            if self._min_freq == freq:
+                self._min_freq = freq + 1
+        slot[2] = freq + 1
+        self._buckets[freq + 1][key] = None
+
+    def _remove(self, key: Hashable) -> Optional[list]:
+        slot = self._entries.pop(key, None)
+        if slot is None:
+            return None
+        self.bytes -= slot[1]
+        if self.policy == "lfu":
+            bucket = self._buckets[slot[2]]
+            del bucket[key]
+            if not bucket:
+                del self._buckets[slot[2]]
+                if self._min_freq == slot[2]:
+                    self._min_freq = min(self._buckets, default=0)
+        return slot
+
+    def _evict(self) -> None:
+        if self.policy == "lru":
+            key = next(iter(self._entries))
+        else:
+            key = next(iter(self._buckets[self._min_freq]))
+        self._remove(key)
+        self._stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Política, ocupação e contadores de acerto, falta e despejo."""
+        return {
+            "policy": self.policy,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            **self._stats,
+        }
+
+
+class DiskTier:
+    """
+    Arquivos key + suffix em directory, limitados a max_bytes, com despejo LRU.
+
+    O manifesto em memória é um OrderedDict chave -> [bytes, último acesso, expiração,
+    etiquetas] na ordem de uso; cada mudança vira uma linha do journal (put/touch/del), que é
+    reescrito compacto quando cresce demais. Ao passar de max_bytes, as entradas
+    menos usadas saem até sobrar a margem (low_water) do orçamento.
+
+    Args:
+        directory: Diretório dos arquivos (e do manifesto)
+        max_bytes: Orçamento em bytes dos arquivos
+        suffix: Extensão dos arquivos de entrada
+        low_water: Fração do orçamento ocupada depois de um despejo
+    """
+
+    def __init__(self, directory: Union[str, Path], max_bytes: int, suffix: str = ".cache.gz",
+                 low_water: float = 0.8):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.suffix = suffix
+        self.low_water = low_water
+        self.bytes = 0
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self._journal_path = self.directory / MANIFEST_FILE
+        self._journal_lines = 0
+        self._stats = {"evictions": 0, "expired": 0, "compactions": 0, "rebuilt": False}
+
+        if self._journal_path.exists():
+            self._replay()
+        else:
+            self._rebuild()
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}{self.suffix}"
+
+    def keys(self) -> List[str]:
+        """Chaves do manifesto, da menos para a mais recentemente usada."""
+        with self._lock:
+            return list(self._entries)
+
+    def tags(self, key: str) -> Optional[Dict[str, Any]]:
+        """Etiquetas gravadas com a entrada (None se ausente)."""
+        entry = self._entries.get(key)
+        return None if entry is None else entry[3]
+
+    def write(self, key: str, data: bytes, expires: Optional[float] = None,
+              tags: Optional[Dict[str, Any]] = None) -> List[str]:
+        """
+        Grava a entrada (arquivo temporário + rename: leitores nunca veem meio arquivo)
+        e despeja as menos usadas se passar do orçamento. Retorna as chaves despejadas.
+        """
+        path = self.path(key)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._forget(key)
+            self._put(key, len(data), time.time(), expires, tags)
+            evicted = self._evict_if_needed()
+        return evicted
+
+    def read(self, key: str) -> Optional[bytes]:
+        """Bytes da entrada (marcando o acesso) ou None se ausente ou expirada."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.time():
+                self._stats["expired"] += 1
+                self._discard(key)
+                return None
+        try:
+            data = self.path(key).read_bytes()
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key, log=True)
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._entries[key][1] = time.time()
+                self._log({"op": "touch", "key": key, "atime": self._entries[key][1]})
+            else:
+                # Gravado por outro processo depois da carga do manifesto
+                self._put(key, len(data), time.time(), None, None)
+                self._evict_if_needed()
+        return data
+
+    def discard(self, key: str) -> None:
+        """Remove o arquivo e a entrada do manifesto."""
+        with self._lock:
+            self._discard(key)
+
+    def retag(self, key: str, tags: Optional[Dict[str, Any]]) -> None:
+        """Troca as etiquetas da entrada (sem regravar o arquivo)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[3] = tags
+                self._log({"op": "tag", "key": key, "tags": tags})
+
+    def items(self) -> List[tuple]:
+        """Pares (chave, etiquetas) do manifesto."""
+        with self._lock:
+            return [(key, entry[3]) for key, entry in self._entries.items()]
+
+    def discard_where(self, predicate: Callable[[str, Optional[Dict[str, Any]]], bool]) -> List[str]:
+        """
+        Remove as entradas em que predicate(chave, etiquetas) é verdadeiro, consultando
+        só o manifesto. Retorna as chaves.
+        """
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if predicate(key, entry[3])]
+            for key in keys:
+                self._discard(key)
+            return keys
+
+    def clear(self) -> None:
+        """Remove todas as entradas e recomeça o manifesto."""
+        with self._lock:
+            for key in list(self._entries):
+                self.path(key).unlink(missing_ok=True)
+            for orphan in self.directory.glob(f"*{self.suffix}"):
+                orphan.unlink(missing_ok=True)
+            self._entries.clear()
+            self.bytes = 0
+            self._compact()
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._journal.closed:
+                self._journal.close()
+
+    def _put(self, key: str, size: int, atime: float, expires: Optional[float],
+             tags: Optional[Dict[str, Any]]) -> None:
+        self._entries[key] = [size, atime, expires, tags]
+        self.bytes += size
+        self._log({"op": "put", "key": key, "size": size, "atime": atime, "expires": expires, "tags": tags})
+
+    def _forget(self, key: str, log: bool = False) -> Optional[list]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[0]
+            if log:
+                self._log({"op": "del", "key": key})
+        return entry
+
+    def _discard(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+        self._forget(key, log=True)
+
+    def _evict_if_needed(self) -> List[str]:
+        evicted = []
+        if self.bytes <= self.max_bytes:
+            return evicted
+        target = self.max_bytes * self.low_water
+        while self._entries and self.bytes > target:
+            key = next(iter(self._entries))
+            self._discard(key)
+            evicted.append(key)
+        self._stats["evictions"] += len(evicted)
+        logger.info(f"Cache em disco excedeu o limite - {len(evicted)} entradas menos usadas removidas "
+                    f"({self.bytes / 1024 / 1024:.1f}MB)")
+        return evicted
+
+    def _log(self, record: Dict[str, Any]) -> None:
+        self._journal.write(json.dumps(record) + "\n")
+        self._journal.flush()
+        self._journal_lines += 1
+        if self._journal_lines > max(COMPACT_MIN_LINES, COMPACT_RATIO * len(self._entries)):
+            self._compact()
+
+    def _replay(self) -> None:
+        """Reconstrói o manifesto em memória a partir do journal."""
+        entries: Dict[str, list] = {}
+        lines = 0
+        with open(self._journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                lines += 1
+                try:
+                    record = json.loads(line)
+                    op, key = record["op"], record["key"]
+                except (ValueError, KeyError, TypeError):
+                    continue  # linha truncada (processo interrompido no meio da escrita)
+                if op == "put":
+                    entries.pop(key, None)
+                    entries[key] = [record["size"], record["atime"], record.get("expires"), record.get("tags")]
+                elif op == "touch" and key in entries:
+                    entries[key][1] = record["atime"]
+                elif op == "tag" and key in entries:
+                    entries[key][3] = record.get("tags")
+                elif op == "del":
+                    entries.pop(key, None)
+        for key, entry in sorted(entries.items(), key=lambda item: item[1][1]):
+            self._entries[key] = entry
+            self.bytes += entry[0]
+        self._journal_lines = lines
+
+    def _rebuild(self) -> None:
+        """Sem manifesto: varre o diretório uma vez (último acesso = mtime) e grava um."""
+        files = []
+        for path in self.directory.glob(f"*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, path.name[:-len(self.suffix)], stat.st_size))
+        for mtime, key, size in sorted(files):
+            self._entries[key] = [size, mtime, None, None]
+            self.bytes += size
+        self._stats["rebuilt"] = True
+        if files:
+            logger.info(f"Manifesto do cache reconstruído: {len(files)} arquivos ({self.bytes / 1024 / 1024:.1f}MB)")
+        self._write_snapshot()
+
+    def _compact(self) -> None:
+        """Reescreve o journal só com as entradas vivas."""
+        self._journal.close()
+        self._write_snapshot()
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+        self._stats["compactions"] += 1
+
+    def _write_snapshot(self) -> None:
+        tmp = self._journal_path.with_name(f"{MANIFEST_FILE}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for key, (size, atime, expires, tags) in self._entries.items():
+                f.write(json.dumps({"op": "put", "key": key, "size": size, "atime": atime,
+                                    "expires": expires, "tags": tags}) + "\n")
+        os.replace(tmp, self._journal_path)
+        self._journal_lines = len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Ocupação, despejos, expirações e manutenção do manifesto."""
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "journal_lines": self._journal_lines,
+            **self._stats,
+        }
+
+
+# Filas abertas, esvaziadas no encerramento do processo
+_open_queues: "weakref.WeakSet[WriteBehindQueue]" = weakref.WeakSet()
+
+
+def _drain_open_queues() -> None:
+    for queue in list(_open_queues):
+        queue.close()
+
+
+atexit.register(_drain_open_queues)
+
+
+class WriteBehindQueue:
+    """
+    Gravações chave -> valor feitas por write(chave, valor) num thread em segundo
+    plano, na ordem de chegada. Uma chave ainda pendente é sobrescrita no lugar
+    (coalescência). Com max_pending chaves pendentes, submit espera o writer abrir
+    espaço (contabilizado em waits/wait_ms); depois de close, grava na hora.
+
+    Args:
+        write: Função que persiste um valor (exceções são registradas e contadas)
+        max_pending: Limite de chaves pendentes
+        name: Nome do thread
+    """
+
+    def __init__(self, write: Callable[[Hashable, Any], None], max_pending: int = DEFAULT_WRITE_QUEUE,
+                 name: str = "cache-writer"):
+        self._write = write
+        self.max_pending = max(1, int(max_pending))
+        self.name = name
+        self._pending: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._in_flight: Optional[tuple] = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._stats = {"queued": 0, "coalesced": 0, "written": 0, "failed": 0,
+                       "waits": 0, "wait_ms": 0.0, "max_depth": 0}
+        _open_queues.add(self)
+
+    def submit(self, key: Hashable, value: Any) -> None:
+        """Agenda a gravação (substitui a pendente da mesma chave)."""
+        with self._cond:
+            if not self._closed:
+                if key in self._pending:
+                    self._pending[key] = value
+                    self._stats["coalesced"] += 1
+                    return
+                if len(self._pending) >= self.max_pending:
+                    # Backpressure: o writer não está dando conta
+                    self._stats["waits"] += 1
+                    start = time.perf_counter()
+                    self._cond.wait_for(lambda: len(self._pending) < self.max_pending or self._closed)
+                    self._stats["wait_ms"] += (time.perf_counter() - start) * 1000
+                if not self._closed:
+                    self._pending[key] = value
+                    self._stats["queued"] += 1
+                    self._stats["max_depth"] = max(self._stats["max_depth"], len(self._pending))
+                    self._ensure_thread()
+                    self._cond.notify_all()
+                    return
+        self._write_one(key, value)
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Valor ainda não persistido da chave (pendente ou sendo gravado), ou None."""
+        with self._cond:
+            if key in self._pending:
+                return self._pending[key]
+            if self._in_flight is not None and self._in_flight[0] == key:
+                return self._in_flight[1]
+            return None
+
+    def items(self) -> List[tuple]:
+        """Pares (chave, valor) pendentes, na ordem de gravação."""
+        with self._cond:
+            return list(self._pending.items())
+
+    def discard_where(self, predicate: Callable[[Hashable, Any], bool]) -> List[Hashable]:
+        """
+        Cancela as gravações pendentes em que predicate(chave, valor) é verdadeiro. Se a
+        gravação em andamento também satisfaz, espera ela terminar (e a inclui): ao
+        retornar, nenhuma das chaves é gravada depois, e o chamador remove a já gravada.
+        """
+        with self._cond:
+            keys = [key for key, value in self._pending.items() if predicate(key, value)]
+            for key in keys:
+                del self._pending[key]
+            in_flight = self._in_flight
+            if in_flight is not None and predicate(*in_flight):
+                keys.append(in_flight[0])
+                if threading.current_thread() is not self._thread:
+                    self._cond.wait_for(lambda: self._in_flight is not in_flight)
+            self._cond.notify_all()
+            return keys
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera as gravações pendentes terminarem. Retorna False se o timeout venceu antes."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and self._in_flight is None, timeout)
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """Grava o que está pendente e encerra o thread."""
+        drained = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        return drained
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                self._in_flight = self._pending.popitem(last=False)
+                self._cond.notify_all()
+            try:
+                self._write_one(*self._in_flight)
+            finally:
+                with self._cond:
+                    self._in_flight = None
+                    self._cond.notify_all()
+
+    def _write_one(self, key: Hashable, value: Any) -> None:
+        try:
+            self._write(key, value)
+            self._stats["written"] += 1
+        except Exception as e:
+            self._stats["failed"] += 1
+            logger.error(f"Erro na gravação em segundo plano ({self.name}): {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Profundidade atual, coalescências, gravações, falhas e esperas por fila cheia."""
+        with self._cond:
+            return {
+                "depth": len(self._pending) + (self._in_flight is not None),
+                "max_pending": self.max_pending,
+                **self._stats,
+                "wait_ms": round(self._stats["wait_ms"], 3),
+            }
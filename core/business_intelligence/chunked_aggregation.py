@@ -0,0 +1,351 @@
+"""
+Agregação em Blocos (Out-of-Core) - Rankings e totais sem o dataset inteiro em memória
+O parquet é lido em blocos de linhas dimensionados por um teto de memória; cada bloco
+alimenta agregados parciais mescláveis (somas por grupo, contagem/soma/mín/máx e
+candidatos ao top-k), combinados ao final. A memória usada depende do tamanho do
+bloco e do número de grupos, não do número de linhas do dataset.
+"""
+
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from core.connectivity.derived_measures import DERIVED_COLUMNS, MONTH_COLUMNS, add_derived_measures
+from .rollup_cubes import KEY_ATTRIBUTES, ROLLUP_MEASURES, FilterValue, apply_filters
+
+logger = logging.getLogger(__name__)
+
+# Teto padrão de memória do modo em blocos
+DEFAULT_MEMORY_LIMIT_MB = 256
+
+# Fração do teto para o bloco decodificado em pandas; a leitura Arrow ocupa outro tanto,
+# e o restante fica para o estado dos parciais
+CHUNK_MEMORY_FRACTION = 0.25
+STATE_MEMORY_FRACTION = 0.5
+
+# Linhas lidas para estimar o tamanho de uma linha, e menor bloco aceito
+SAMPLE_ROWS = 2048
+MIN_BATCH_ROWS = 1024
+
+# Filtro de linhas de um parcial: bloco -> máscara booleana
+RowPredicate = Callable[[pd.DataFrame], pd.Series]
+
+
+class MemoryLimitExceeded(MemoryError):
+    """O estado dos agregados parciais não cabe no teto de memória configurado."""
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _mask(frame: pd.DataFrame, where: Optional[RowPredicate]) -> Optional[np.ndarray]:
+    return None if where is None else np.asarray(where(frame), dtype=bool)
+
+
+class GroupPartial:
+    """
+    Soma das medidas por grupo (e primeiro valor dos atributos de cada chave),
+    acumulada bloco a bloco. O resultado tem as mesmas colunas e a mesma ordem
+    de grupos (ordem de primeira aparição) que aggregate_frame sobre as linhas todas.
+
+    Os atributos descritivos (ex.: nome_produto) ficam num estado à parte, por chave:
+    num grão (une, codigo) o estado das somas não repete o nome em cada UNE. Nesses
+    grãos o atributo é o primeiro valor da chave, não do grupo (um preco_38_percent
+    que varie por UNE vem da primeira UNE lida).
+    """
+
+    def __init__(self, group_by: Sequence[str], measures: Optional[Sequence[str]] = None,
+                 filters: Optional[Dict[str, FilterValue]] = None):
+        self.group_by = list(group_by)
+        self.measures = list(measures) if measures is not None else None
+        self.filters = filters
+        self._sums = _MergeableFrame(self.group_by, "sum")
+        self._attributes = {key: _MergeableFrame([key], "first")
+                            for key in self.group_by if KEY_ATTRIBUTES.get(key)}
+
+    def update(self, frame: pd.DataFrame, offset: int = 0) -> None:
+        """Acumula as somas (e os atributos) de um bloco."""
+        measures = [m for m in (self.measures or ROLLUP_MEASURES) if m in frame.columns]
+        attributes = {key: [attr for attr in KEY_ATTRIBUTES[key] if attr in frame.columns and attr not in self.group_by]
+                      for key in self._attributes}
+        columns = self.group_by + measures + [attr for attrs in attributes.values() for attr in attrs]
+        frame = apply_filters(frame, self.filters, None, list(dict.fromkeys(columns + list(self.filters or {}))))
+        if not len(frame):
+            return
+
+        self._sums.add(frame.groupby(self.group_by, observed=True, sort=False)[measures].sum().reset_index())
+        for key, attrs in attributes.items():
+            if attrs:
+                self._attributes[key].add(frame.groupby(key, observed=True, sort=False)[attrs].first().reset_index())
+
+    def merge(self, other: "GroupPartial") -> None:
+        """Incorpora o estado de outro parcial (ex.: de outra partição)."""
+        self._sums.merge(other._sums)
+        for key, attributes in self._attributes.items():
+            attributes.merge(other._attributes[key])
+
+    def memory_bytes(self) -> int:
+        """Memória ocupada pelos estados e pelos parciais pendentes."""
+        return self._sums.memory_bytes() + sum(attrs.memory_bytes() for attrs in self._attributes.values())
+
+    def result(self) -> pd.DataFrame:
+        result = self._sums.result()
+        if result is None:
+            return pd.DataFrame(columns=self.group_by + list(self.measures or []))
+        result = result.copy()
+        for key, attributes in self._attributes.items():
+            state = attributes.result()
+            if state is not None:
+                state = state.set_index(key)
+                for attr in state.columns:
+                    if attr not in result.columns:
+                        result[attr] = result[key].map(state[attr])
+        return result
+
+
+class _MergeableFrame:
+    """
+    Estado agregado por chave que recebe parciais e os combina (soma ou primeiro valor).
+    Os parciais ficam pendentes e são combinados quando superam o estado, de modo
+    que o custo total é linear no número de linhas parciais.
+    """
+
+    def __init__(self, keys: List[str], how: str):
+        self.keys = keys
+        self.how = how
+        self._state: Optional[pd.DataFrame] = None
+        self._pending: List[pd.DataFrame] = []
+        self._pending_rows = 0
+
+    def add(self, partial: pd.DataFrame) -> None:
+        self._pending.append(partial)
+        self._pending_rows += len(partial)
+        if self._pending_rows >= max(len(self._state) if self._state is not None else 0, 1):
+            self._compact()
+
+    def merge(self, other: "_MergeableFrame") -> None:
+        other._compact()
+        if other._state is not None:
+            self.add(other._state)
+        self._compact()
+
+    def _compact(self) -> None:
+        if not self._pending:
+            return
+        parts = ([self._state] if self._state is not None else []) + self._pending
+        combined = pd.concat(parts, ignore_index=True)
+        values = [col for col in combined.columns if col not in self.keys]
+        self._state = combined.groupby(self.keys, observed=True, sort=False)[values].agg(self.how).reset_index()
+        self._pending = []
+        self._pending_rows = 0
+
+    def memory_bytes(self) -> int:
+        return sum(_frame_bytes(df) for df in ([self._state] if self._state is not None else []) + self._pending)
+
+    def result(self) -> Optional[pd.DataFrame]:
+        self._compact()
+        return self._state
+
+
+class MeasureTotals:
+    """Totais mescláveis: linhas lidas, linhas que atendem where e soma/contagem/mín/máx das medidas."""
+
+    def __init__(self, measures: Sequence[str] = (), where: Optional[RowPredicate] = None):
+        self.measures = list(measures)
+        self.where = where
+        self.rows = 0
+        self.matched = 0
+        self.sums = {m: 0.0 for m in self.measures}
+        self.counts = {m: 0 for m in self.measures}
+        self.mins: Dict[str, Optional[float]] = {m: None for m in self.measures}
+        self.maxs: Dict[str, Optional[float]] = {m: None for m in self.measures}
+
+    def update(self, frame: pd.DataFrame, offset: int = 0) -> None:
+        self.rows += len(frame)
+        mask = _mask(frame, self.where)
+        self.matched += len(frame) if mask is None else int(mask.sum())
+        for m in self.measures:
+            values = frame[m].to_numpy(dtype=np.float64, na_value=np.nan)
+            if mask is not None:
+                values = values[mask]
+            values = values[~np.isnan(values)]
+            if values.size:
+                self._add(m, float(values.sum()), int(values.size), float(values.min()), float(values.max()))
+
+    def _add(self, measure: str, total: float, count: int, low: Optional[float], high: Optional[float]) -> None:
+        self.sums[measure] += total
+        self.counts[measure] += count
+        if low is not None:
+            self.mins[measure] = low if self.mins[measure] is None else min(self.mins[measure], low)
+            self.maxs[measure] = high if self.maxs[measure] is None else max(self.maxs[measure], high)
+
+    def merge(self, other: "MeasureTotals") -> None:
+        self.rows += other.rows
+        self.matched += other.matched
+        for m in self.measures:
+            self._add(m, other.sums[m], other.counts[m], other.mins[m], other.maxs[m])
+
+    def mean(self, measure: str) -> float:
+        """Média das linhas não nulas (NaN se não houver nenhuma)."""
+        return self.sums[measure] / self.counts[measure] if self.counts[measure] else float("nan")
+
+    def memory_bytes(self) -> int:
+        return 0
+
+
+class TopKPartial:
+    """
+    Candidatos mescláveis às k maiores linhas por uma coluna (empates pela ordem das
+    linhas, como nlargest). Sem coluna, guarda as k primeiras linhas (como head).
+    O top-k da união é o top-k dos candidatos de cada bloco, então o resultado é exato.
+    """
+
+    def __init__(self, k: int, column: Optional[str], columns: Sequence[str],
+                 where: Optional[RowPredicate] = None):
+        self.k = k
+        self.column = column
+        self.columns = list(dict.fromkeys(list(columns) + ([column] if column else [])))
+        self.where = where
+        self._candidates = pd.DataFrame(columns=self.columns + ["_posicao"])
+
+    def update(self, frame: pd.DataFrame, offset: int = 0) -> None:
+        mask = _mask(frame, self.where)
+        positions = np.arange(offset, offset + len(frame))
+        if mask is not None:
+            frame, positions = frame[mask], positions[mask]
+        if self.column is not None:
+            top = frame[self.column].reset_index(drop=True).nlargest(self.k).index.to_numpy()
+        else:
+            top = np.arange(min(self.k, len(frame)))
+        candidates = frame.iloc[top][self.columns].reset_index(drop=True)
+        candidates["_posicao"] = positions[top]
+        self._merge_candidates(candidates)
+
+    def merge(self, other: "TopKPartial") -> None:
+        self._merge_candidates(other._candidates)
+
+    def _merge_candidates(self, candidates: pd.DataFrame) -> None:
+        if not len(candidates):
+            return
+        combined = pd.concat([df for df in (self._candidates, candidates) if len(df)], ignore_index=True)
+        positions = combined["_posicao"].to_numpy(dtype=np.int64)
+        if self.column is not None:
+            order = np.lexsort((positions, -combined[self.column].to_numpy(dtype=np.float64)))
+        else:
+            order = np.argsort(positions, kind="stable")
+        self._candidates = combined.iloc[order[:self.k]].reset_index(drop=True)
+
+    def memory_bytes(self) -> int:
+        return _frame_bytes(self._candidates)
+
+    def result(self) -> pd.DataFrame:
+        """As k linhas, da maior para a menor (ou na ordem original, sem coluna)."""
+        return self._candidates[self.columns]
+
+
+class ChunkedAggregator:
+    """
+    Lê o parquet do adapter em blocos dimensionados pelo teto de memória e alimenta
+    agregados parciais. Os blocos trazem as medidas derivadas calculadas na hora.
+
+    Args:
+        parquet_adapter: Adapter do dataset (arquivo ou diretório particionado)
+        memory_limit_mb: Teto de memória do bloco em leitura mais o estado dos parciais
+    """
+
+    def __init__(self, parquet_adapter, memory_limit_mb: float = DEFAULT_MEMORY_LIMIT_MB):
+        self.parquet_adapter = parquet_adapter
+        self.memory_limit_mb = memory_limit_mb
+        self._row_bytes: Dict[tuple, float] = {}
+        self._stats = {"scans": 0, "chunks": 0, "rows": 0, "last_batch_rows": 0, "peak_state_mb": 0.0}
+
+    @property
+    def memory_limit_bytes(self) -> int:
+        return int(self.memory_limit_mb * 1024 ** 2)
+
+    def _source_columns(self, columns: Iterable[str]) -> List[str]:
+        """Colunas a ler do arquivo: medidas derivadas são calculadas a partir dos meses (e do preço)."""
+        columns = list(dict.fromkeys(columns))
+        if any(col in DERIVED_COLUMNS for col in columns):
+            columns += MONTH_COLUMNS + ["preco_38_percent"]
+        names = set(self.parquet_adapter._get_dataset().schema.names)
+        return [col for col in dict.fromkeys(columns) if col in names]
+
+    def _iter_batches(self, columns: List[str], batch_rows: int) -> Iterator[pd.DataFrame]:
+        """
+        Lotes de cada arquivo do dataset, lidos com ParquetFile.iter_batches: decodifica
+        só o lote pedido (o scanner de dataset lê row groups inteiros e à frente).
+        Colunas de partição (une=<codigo>/) entram como constantes do arquivo.
+        """
+        for fragment in self.parquet_adapter._get_dataset().get_fragments():
+            partition = ds.get_partition_keys(fragment.partition_expression)
+            file_columns = [col for col in columns if col not in partition]
+            for batch in pq.ParquetFile(fragment.path).iter_batches(batch_size=batch_rows, columns=file_columns):
+                frame = batch.to_pandas()
+                for col, value in partition.items():
+                    if col in columns:
+                        frame[col] = value
+                yield add_derived_measures(frame)
+
+    def batch_rows(self, columns: Sequence[str]) -> int:
+        """Linhas por bloco para caber na fração do teto reservada ao bloco."""
+        key = tuple(columns)
+        if key not in self._row_bytes:
+            sample = next(self._iter_batches(list(columns), SAMPLE_ROWS), pd.DataFrame())
+            self._row_bytes[key] = _frame_bytes(sample) / max(len(sample), 1)
+        rows = int(self.memory_limit_bytes * CHUNK_MEMORY_FRACTION / max(self._row_bytes[key], 1.0))
+        return max(rows, MIN_BATCH_ROWS)
+
+    def iter_chunks(self, columns: Iterable[str]) -> Iterator[pd.DataFrame]:
+        """Blocos do dataset inteiro com as colunas pedidas (e as necessárias às medidas derivadas)."""
+        source_columns = self._source_columns(columns)
+        batch_rows = self.batch_rows(source_columns)
+        self._stats["last_batch_rows"] = batch_rows
+        yield from self._iter_batches(source_columns, batch_rows)
+
+    def scan(self, partials: Sequence[Any], columns: Iterable[str]) -> Sequence[Any]:
+        """
+        Alimenta os parciais com todos os blocos. Levanta MemoryLimitExceeded se o
+        estado dos parciais passar da fração do teto reservada a ele.
+        """
+        start = time.perf_counter()
+        state_limit = self.memory_limit_bytes * STATE_MEMORY_FRACTION
+        offset = chunks = 0
+        for chunk in self.iter_chunks(columns):
+            for partial in partials:
+                partial.update(chunk, offset)
+            offset += len(chunk)
+            chunks += 1
+
+            state_bytes = sum(partial.memory_bytes() for partial in partials)
+            self._stats["peak_state_mb"] = max(self._stats["peak_state_mb"], round(state_bytes / 1024 ** 2, 2))
+            if state_bytes > state_limit:
+                raise MemoryLimitExceeded(
+                    f"Agregados parciais ocupam {state_bytes / 1024 ** 2:.2f} MB, acima de "
+                    f"{state_limit / 1024 ** 2:.2f} MB do teto de {self.memory_limit_mb} MB"
+                )
+
+        self._stats["scans"] += 1
+        self._stats["chunks"] += chunks
+        self._stats["rows"] += offset
+        logger.info(f"Varredura em blocos: {offset} linhas em {chunks} blocos, {time.perf_counter() - start:.3f}s")
+        return partials
+
+    def aggregate(self, group_by: Sequence[str], measures: Optional[Sequence[str]] = None,
+                  filters: Optional[Dict[str, FilterValue]] = None) -> pd.DataFrame:
+        """Equivalente a aggregate_frame sobre o dataset inteiro, lido em blocos."""
+        attributes = [attr for key in group_by for attr in KEY_ATTRIBUTES.get(key, [])]
+        columns = list(group_by) + list(measures or ROLLUP_MEASURES) + attributes + list(filters or {})
+        partial = GroupPartial(group_by, measures, filters)
+        self.scan([partial], columns)
+        return partial.result()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Teto, tamanho do último bloco e volume lido."""
+        return {"memory_limit_mb": self.memory_limit_mb, **self._stats}
@@ -0,0 +1,103 @@
+"""
+Índice Secundário do Dataset - Buscas pontuais sem varrer 1.1M linhas
+Mapeia codigo, une e une_nome para as posições das linhas (tabela de offsets por hash),
+construído uma vez por versão do DataFrame base.
+"""
+
+import logging
+from typing import Dict, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Colunas indexadas (as usadas em filtros de igualdade pelos métodos _query_*)
+INDEXED_COLUMNS = ("codigo", "une", "une_nome")
+
+_EMPTY_POSITIONS = np.empty(0, dtype=np.intp)
+
+
+class DatasetIndex:
+    """
+    Índice de igualdade para um DataFrame específico.
+
+    Para cada coluna indexada guarda {valor: posições}, de modo que um filtro
+    df[df['codigo'] == x] vira uma consulta O(1) no dicionário + iloc nas
+    poucas linhas encontradas. Filtros compostos (ex.: codigo + une) partem da
+    menor lista de posições e aplicam os demais filtros só nesse subconjunto.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.source = df
+        self.num_rows = len(df)
+        self._positions: Dict[str, Dict[Any, np.ndarray]] = {}
+
+        start = pd.Timestamp.now()
+        for column in INDEXED_COLUMNS:
+            if column in df.columns:
+                self._positions[column] = df.groupby(column, observed=True, sort=False).indices
+        elapsed = (pd.Timestamp.now() - start).total_seconds()
+        logger.info(f"DatasetIndex construído para {self.num_rows} linhas em {elapsed:.3f}s - colunas: {list(self._positions)}")
+
+    def aligned_with(self, df: pd.DataFrame) -> bool:
+        """
+        Indica se as posições do índice valem para df: a própria fonte ou uma projeção
+        de colunas dela (mesmas linhas, mesmos buffers). Cópias, filtros e
+        reordenações não compartilham o buffer e ficam de fora.
+        """
+        if df is self.source:
+            return True
+        if len(df) != self.num_rows:
+            return False
+        for column in self._positions:
+            if column in df.columns and isinstance(df[column].dtype, np.dtype):
+                values = df[column].to_numpy()
+                source_values = self.source[column].to_numpy()
+                return (values.__array_interface__["data"][0] == source_values.__array_interface__["data"][0]
+                        and values.strides == source_values.strides)
+        return False
+
+    def covers(self, column: str) -> bool:
+        """Indica se a coluna está indexada."""
+        return column in self._positions
+
+    def positions(self, column: str, value: Any) -> np.ndarray:
+        """Posições (ordenadas) das linhas onde column == value."""
+        return self._positions[column].get(value, _EMPTY_POSITIONS)
+
+    def select(self, df: pd.DataFrame, **filters: Any) -> pd.DataFrame:
+        """
+        Equivalente a df[(df[c1] == v1) & (df[c2] == v2) ...], preservando a ordem original.
+        Colunas não indexadas são filtradas por máscara sobre o subconjunto já reduzido.
+        """
+        indexed = {col: val for col, val in filters.items() if self.covers(col)}
+        remaining = {col: val for col, val in filters.items() if not self.covers(col)}
+
+        if not indexed:
+            return _mask_select(df, **filters)
+
+        ordered = sorted(indexed.items(), key=lambda item: len(self.positions(*item)))
+        first_col, first_val = ordered[0]
+        subset = df.iloc[self.positions(first_col, first_val)]
+        for col, val in ordered[1:] + list(remaining.items()):
+            if len(subset) == 0:
+                break
+            subset = subset[subset[col] == val]
+        return subset
+
+
+def _mask_select(df: pd.DataFrame, **filters: Any) -> pd.DataFrame:
+    """Filtro por máscara booleana (caminho sem índice)."""
+    mask = None
+    for col, val in filters.items():
+        col_mask = df[col] == val
+        mask = col_mask if mask is None else mask & col_mask
+    return df if mask is None else df[mask]
+
+
+def select_rows(df: pd.DataFrame, index: Optional[DatasetIndex], **filters: Any) -> pd.DataFrame:
+    """Seleciona linhas por igualdade usando o índice quando ele vale para este DataFrame."""
+    if index is not None and index.aligned_with(df):
+        return index.select(df, **filters)
+    return _mask_select(df, **filters)
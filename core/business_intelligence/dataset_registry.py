@@ -0,0 +1,150 @@
+"""
+Registro de Datasets Compartilhados - Um adapter e um engine por arquivo
+Todos os chamadores (Streamlit, SmartCache, HybridQueryEngine) recebem a mesma
+instância aquecida, evitando reler o parquet e recarregar os templates a cada pergunta.
+Quando o arquivo é atualizado, a entrada continua a mesma: o adapter recarrega em
+segundo plano e troca a versão atomicamente.
+"""
+
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+from core.connectivity.parquet_adapter import ParquetAdapter
+from .direct_query_engine import DirectQueryEngine
+
+logger = logging.getLogger(__name__)
+
+
+class RegistryEntry:
+    """Adapter e engine compartilhados para um arquivo."""
+
+    def __init__(self, file_path: str, adapter: ParquetAdapter):
+        self.file_path = file_path
+        self.adapter = adapter
+        self.ref_count = 0
+        self._engine = None
+        self._engine_lock = threading.Lock()
+
+    @property
+    def engine(self) -> DirectQueryEngine:
+        """DirectQueryEngine criado sob demanda e reutilizado por todos."""
+        if self._engine is None:
+            with self._engine_lock:
+                if self._engine is None:
+                    self._engine = DirectQueryEngine(self.adapter)
+        return self._engine
+
+    @property
+    def fingerprint(self) -> str:
+        """Versão dos dados servida no momento."""
+        return self.adapter.data_version
+
+
+class DatasetRegistry:
+    """
+    Registro process-wide de adapters/engines, chaveado por caminho.
+
+    - acquire/release fazem contagem de referências (donos de longa duração, como o
+      HybridQueryEngine, guardam a entrada e chamam release ao fechar);
+    - acquire verifica se o arquivo mudou e, se sim, dispara a recarga em segundo
+      plano (sem bloquear: até a troca, a versão antiga continua servindo);
+    - evict remove explicitamente uma entrada e libera o DataFrame da memória.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, RegistryEntry] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _normalize_path(file_path: str) -> str:
+        """Chave da entrada: o caminho absoluto. A versão do arquivo não entra na chave;
+        uma atualização é recarregada na mesma entrada (adapter.check_for_update)."""
+        return os.path.abspath(file_path)
+
+    def acquire(self, file_path: str, adapter: Optional[ParquetAdapter] = None) -> RegistryEntry:
+        """
+        Retorna a entrada compartilhada do arquivo, criando-a se necessário.
+
+        Args:
+            file_path: Caminho do parquet
+            adapter: Adapter já existente para registrar caso ainda não haja entrada
+        """
+        key = self._normalize_path(file_path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if adapter is None:
+                    adapter = ParquetAdapter(file_path)
+                entry = RegistryEntry(key, adapter)
+                self._entries[key] = entry
+                logger.info(f"DatasetRegistry: nova entrada para {key}")
+            entry.ref_count += 1
+
+        entry.adapter.check_for_update()
+        return entry
+
+    def release(self, entry: RegistryEntry) -> None:
+        """Decrementa a contagem de referências (a entrada continua aquecida)."""
+        with self._lock:
+            entry.ref_count = max(0, entry.ref_count - 1)
+
+    @contextmanager
+    def lease(self, file_path: str, adapter: Optional[ParquetAdapter] = None):
+        """Context manager: acquire na entrada e release na saída."""
+        entry = self.acquire(file_path, adapter)
+        try:
+            yield entry
+        finally:
+            self.release(entry)
+
+    def evict(self, file_path: str, force: bool = False) -> bool:
+        """
+        Remove a entrada do registro.
+
+        Args:
+            force: Se False, não remove entradas com referências ativas
+
+        Returns:
+            True se a entrada foi removida
+        """
+        key = self._normalize_path(file_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            if entry.ref_count > 0 and not force:
+                logger.warning(f"DatasetRegistry: {key} tem {entry.ref_count} referências - evict ignorado")
+                return False
+            self._drop(key, entry)
+            return True
+
+    def _drop(self, key: str, entry: RegistryEntry) -> None:
+        del self._entries[key]
+        # Só libera memória se ninguém mais estiver usando
+        if entry.ref_count == 0:
+            if entry._engine is not None:
+                entry._engine.close()
+            entry.adapter.disconnect()
+        logger.info(f"DatasetRegistry: entrada removida para {key}")
+
+    def clear(self) -> None:
+        """Remove todas as entradas."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                self._drop(key, entry)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Retorna as entradas ativas e suas referências."""
+        with self._lock:
+            return {
+                key: {"fingerprint": entry.fingerprint, "ref_count": entry.ref_count}
+                for key, entry in self._entries.items()
+            }
+
+
+# Instância única do processo
+dataset_registry = DatasetRegistry()
@@ -6,14 +6,25 @@ Sistema que executa consultas pré-definidas sem usar tokens da LLM.
 import pandas as pd
 import json
 import logging
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Sequence, Tuple
 from datetime import datetime
 import re
 from pathlib import Path
 import traceback
 
-from core.connectivity.parquet_adapter import ParquetAdapter
+from core.connectivity.derived_measures import DERIVED_COLUMNS
+from core.connectivity.parquet_adapter import ParquetAdapter, ESSENTIAL_COLUMNS
+from .dataset_index import DatasetIndex, select_rows
+from .query_planner import QUERY_COLUMNS, DataPlan, plan_query_data, project_view, shared_row_views
+from .intent_matcher import IntentMatcher
+from .query_plan import QueryPlan, normalize_query
+from .chunked_aggregation import ChunkedAggregator, MeasureTotals, TopKPartial
+from .execution_backends import DEFAULT_BACKEND, PandasBackend, create_backend
+from .parallel_aggregation import DEFAULT_WORKERS, ParallelAggregator
+from .rollup_cubes import RollupCubes, aggregate_frame, rollup_path
+from .result_builders import bar_chart_data, top_per_group, to_records, truncate_labels
 from core.visualization.advanced_charts import AdvancedChartGenerator
+from core.utils.query_profiler import profiled, query_profiler
 from core.utils.logger_config import (
     get_logger,
     log_query_attempt,
@@ -23,20 +34,77 @@ from core.utils.logger_config import (
 
 logger = get_logger('agent_bi.direct_query')
 
+# Consultas restritas a uma única UNE -> parâmetro que identifica a UNE.
+# Em datasets particionados por UNE, essas consultas leem apenas a partição.
+UNE_SCOPED_QUERIES = {
+    "top_produtos_une_especifica": "une_nome",
+    "vendas_une_mes_especifico": "une_nome",
+    "preco_produto_une_especifica": "une_nome",
+    "produto_vendas_une_barras": "une_codigo",
+}
+
+# Rankings e totais que o modo em blocos responde sem carregar o dataset inteiro
+STREAMABLE_QUERIES = {
+    "produto_mais_vendido",
+    "filial_mais_vendeu",
+    "segmento_campao",
+    "produtos_sem_vendas",
+    "estoque_parado",
+    "ranking_vendas_unes",
+    "produto_mais_vendido_cada_une",
+    "top_produtos_por_segmento",
+}
+
 class DirectQueryEngine:
     """Motor de consultas diretas que NÃO usa LLM para economizar tokens."""
 
-    def __init__(self, parquet_adapter: ParquetAdapter):
-        """Inicializa o motor com o adapter do parquet."""
+    def __init__(self, parquet_adapter: ParquetAdapter, memory_limit_mb: Optional[float] = None,
+                 backend: str = DEFAULT_BACKEND, workers: int = DEFAULT_WORKERS):
+        """Inicializa o motor com o adapter do parquet.
+
+        Args:
+            memory_limit_mb: Ativa o modo em blocos com este teto de memória: enquanto o
+                dataset não estiver em memória, rankings e totais leem o parquet em blocos.
+            backend: Backend de execução ("pandas", a referência em memória, ou "duckdb":
+                rankings e agrupamentos em SQL multi-thread direto sobre o parquet enquanto
+                o dataset não estiver em memória).
+            workers: Com mais de 1, os groupbys do dataset completo (e a construção dos
+                cubos) rodam em fatias num pool persistente de processos.
+        """
         self.parquet_adapter = parquet_adapter
         self.chart_generator = AdvancedChartGenerator()
         self.query_cache = {}
         self.templates = self._load_query_templates()
-        self.keywords_map = self._build_keywords_map()
+        self.intent_matcher = IntentMatcher.from_templates(self.templates, fallback_keywords=self._build_keywords_map())
+        self.keywords_map = self.intent_matcher.keywords_map()
 
-        # Cache de dados frequentes
+        # Cache de dados frequentes, válido para uma versão (fingerprint) do dataset
         self._cached_data = {}
-        self._cache_timestamp = None
+        self._data_version = None
+
+        # Índice secundário (codigo/une/une_nome) do dataset completo em cache
+        self._dataset_index = None
+
+        # Cubos de agregação da versão atual (rankings sem groupby no dataset completo)
+        self._rollups = None
+
+        # Agregações compartilhadas pelas consultas de um lote (só durante execute_many)
+        self._batch_aggregates = None
+
+        # Modo em blocos (out-of-core): agregador e o DataFrame vazio, só com o esquema,
+        # entregue aos _query_* no lugar dos dados
+        self.chunked = ChunkedAggregator(parquet_adapter, memory_limit_mb) if memory_limit_mb else None
+        self._stream_frame = None
+
+        # Backend de execução; sem a biblioteca do backend pedido, fica o pandas
+        try:
+            self.backend = create_backend(backend, parquet_adapter)
+        except ImportError as e:
+            logger.warning(f"{e} - usando o backend pandas")
+            self.backend = PandasBackend(parquet_adapter)
+
+        # Agregação paralela por fatias do snapshot compartilhado (pool criado sob demanda)
+        self.parallel = ParallelAggregator(parquet_adapter, workers) if workers > 1 else None
 
         logger.info("DirectQueryEngine inicializado - ZERO LLM tokens usados")
 
@@ -76,7 +144,7 @@ class DirectQueryEngine:
         }
 
     def _build_keywords_map(self) -> Dict[str, str]:
-        """Mapeia palavras-chave para queries diretas - SEM LLM."""
+        """Palavras-chave padrão - usadas apenas quando os templates não trazem 'intent_rules'."""
         return {
             # Produtos
             "produto mais vendido": "produto_mais_vendido",
@@ -128,181 +196,221 @@ class DirectQueryEngine:
             "variação mensal": "variacao_mensal"
         }
 
-    def _get_cached_base_data(self, full_dataset: bool = False) -> pd.DataFrame:
-        """Obtém dados base do cache ou carrega se necessário.
+    @profiled("load_data")
+    def _get_cached_base_data(self, extra_columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Obtém o dataset completo da versão atual (o DataFrame do adapter, sem cópia).
 
         Args:
-            full_dataset: Se True, carrega dataset completo. Se False, carrega amostra (500 registros).
+            extra_columns: Colunas além das essenciais (ex.: estoque_atual), carregadas sob demanda.
         """
-        cache_key = "full_data" if full_dataset else "base_data"
-        current_time = datetime.now()
+        extra_columns = extra_columns or []
+        self._check_data_version()
 
-        # Cache por 5 minutos
-        if (self._cache_timestamp is None or
-            (current_time - self._cache_timestamp).seconds > 300 or
-            cache_key not in self._cached_data):
+        df = self._cached_data.get("full_data")
+        if df is None:
+            logger.info("Carregando dataset COMPLETO - cache vazio para a versão atual")
+            self.parquet_adapter.connect()
 
-            if full_dataset:
-                logger.info("Carregando dataset COMPLETO - necessário para consulta específica")
-            else:
-                logger.info("Carregando dados base - cache expirado")
+            # As consultas só leem (via visões projetadas); as medidas derivadas já vêm materializadas
+            self.parquet_adapter._load_dataframe()
+            df = self.parquet_adapter._dataframe
+            if df is None:
+                logger.error("Falha ao carregar dataset completo")
+                return pd.DataFrame()
 
-            self.parquet_adapter.connect()
+            self._cached_data["full_data"] = df
+            logger.info(f"Cache atualizado: {len(df)} registros")
 
-            if full_dataset:
-                # Para dataset completo, carregar diretamente do parquet
+        # Colunas sob demanda: o adapter publica um novo DataFrame com elas (o anterior,
+        # ainda em uso por outras consultas, não é alterado) e ele passa a ser o do cache
+        missing = [col for col in extra_columns if col not in df.columns]
+        if missing:
+            df = self.parquet_adapter.load_columns(missing)
+            # A carga pode ter esperado a troca de versão do arquivo
+            self._check_data_version()
+            self._cached_data["full_data"] = df
+            logger.info(f"Colunas sob demanda carregadas: {missing}")
+
+        return df
+
+    def _get_query_data(self, plan: DataPlan) -> pd.DataFrame:
+        """Visão projetada (colunas e linhas do plano) do dataset completo, sem copiar colunas."""
+        df = self._get_cached_base_data()
+        if df.empty:
+            return df
+        lazy_columns = plan.lazy_columns(df.columns)
+        if lazy_columns:
+            df = self._get_cached_base_data(extra_columns=lazy_columns)
+        with query_profiler.span("select"):
+            return project_view(df, plan, self._get_dataset_index(df))
+
+    def _check_data_version(self) -> None:
+        """Invalida dados em cache e índices quando o adapter passa a servir outra versão.
+
+        A verificação de mudança no arquivo não bloqueia: a recarga roda em segundo plano
+        e, até a troca, a versão antiga continua valendo. Consultas em andamento mantêm
+        suas referências aos DataFrames antigos.
+        """
+        self.parquet_adapter.check_for_update()
+        version = self.parquet_adapter.data_version
+        if version != self._data_version:
+            if self._data_version is not None:
+                logger.info(f"Dataset mudou de versão ({self._data_version} -> {version}) - invalidando caches derivados")
+            self._cached_data = {}
+            self._dataset_index = None
+            self._rollups = None
+            self._stream_frame = None
+            self._data_version = version
+
+    def _get_dataset_index(self, df: pd.DataFrame) -> Optional[DatasetIndex]:
+        """Retorna o índice do dataset completo, (re)construindo-o quando a versão em cache muda.
+
+        Vale para o dataset completo e suas visões projetadas; partições e subconjuntos
+        de linhas não são indexados: são pequenos e mudam a cada consulta.
+        """
+        full_df = self._cached_data.get("full_data")
+        if full_df is None:
+            return None
+        # Um novo frame da mesma versão (colunas sob demanda) compartilha as linhas: o índice vale
+        if self._dataset_index is None or not self._dataset_index.aligned_with(full_df):
+            self._dataset_index = DatasetIndex(full_df)
+        self._dataset_index.source = full_df  # não prende o frame anterior na memória
+        return self._dataset_index if self._dataset_index.aligned_with(df) else None
+
+    def _select_rows(self, df: pd.DataFrame, **filters: Any) -> pd.DataFrame:
+        """Filtro de igualdade (ex.: codigo=..., une=...) via índice quando disponível."""
+        return select_rows(df, self._get_dataset_index(df), **filters)
+
+    def _get_rollups(self, build: bool = True) -> Optional[RollupCubes]:
+        """Cubos da versão atual: lidos do disco ou, na primeira vez, construídos e gravados.
+
+        Args:
+            build: Sem cubos gravados, constrói a partir do dataset completo (que é carregado).
+        """
+        if self._rollups is None:
+            path = rollup_path(self.parquet_adapter.file_path)
+            rollups = RollupCubes.load(path, self._data_version)
+            if rollups is None and not build:
+                return None
+            if rollups is None:
                 self.parquet_adapter._load_dataframe()
-                if self.parquet_adapter._dataframe is not None:
-                    df = self.parquet_adapter._dataframe.copy()
-                    logger.info(f"Dataset completo carregado: {len(df)} registros")
-                else:
-                    logger.error("Falha ao carregar dataset completo")
-                    return pd.DataFrame()
+                if self.parquet_adapter._dataframe is None:
+                    return None
+                aggregate = self.parallel.aggregate if self.parallel is not None else aggregate_frame
+                rollups = RollupCubes.build(self.parquet_adapter._dataframe, self._data_version, aggregate)
+                try:
+                    rollups.save(path)
+                except Exception as e:
+                    # Ex.: sistema de arquivos somente leitura - cubos ficam só em memória
+                    logger.warning(f"Não foi possível gravar rollups em {path}: {e}")
+            self._rollups = rollups
+        return self._rollups
+
+    @profiled("aggregate")
+    def _aggregate(self, df: pd.DataFrame, group_by: List[str], measures: Optional[List[str]] = None,
+                   filters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        """Soma das medidas por group_by, a partir do menor cubo que cobre a consulta.
+
+        Sem cubo disponível (ou que cubra a consulta), agrega o próprio df ou, quando
+        a consulta não carregou o dataset, o parquet (pelo backend ou em blocos).
+        Dentro de execute_many, agregações sem filtro sobre o dataset completo são
+        calculadas uma vez por grão e medidas e reaproveitadas pelo lote.
+        """
+        batch_key = None
+        if self._batch_aggregates is not None and not filters and self._get_dataset_index(df) is not None:
+            batch_key = (tuple(group_by), tuple(measures or ()))
+            if batch_key in self._batch_aggregates:
+                return self._batch_aggregates[batch_key]
+
+        # Sem o dataset em memória os cubos só são usados se já estiverem gravados
+        streamed = self._is_streamed(df)
+        result = None
+        rollups = self._get_rollups(build=not streamed)
+        if rollups is not None:
+            result = rollups.query(group_by, measures, filters)
+        if result is None and streamed:
+            aggregator = self.chunked if isinstance(self.backend, PandasBackend) else self.backend
+            result = aggregator.aggregate(group_by, measures, filters)
+        elif result is None:
+            index = self._get_dataset_index(df)
+            # Em paralelo só o dataset completo sem filtro de igualdade (esse vai pelo índice)
+            if self.parallel is not None and index is not None and all(map(callable, (filters or {}).values())):
+                result = self.parallel.aggregate(df, group_by, measures, filters, index)
             else:
-                # Carregar apenas amostra para economizar memória
-                base_data = self.parquet_adapter.execute_query({})
-
-                if base_data and len(base_data) > 0:
-                    df = pd.DataFrame(base_data)
-                    logger.info(f"Amostra carregada: {len(df)} registros")
-                else:
-                    logger.error("Falha ao carregar dados base")
-                    return pd.DataFrame()
-
-            # Garantir que vendas_total existe
-            vendas_cols = [col for col in df.columns if col.startswith('mes_') and col[4:].isdigit()]
-            if vendas_cols and 'vendas_total' not in df.columns:
-                df['vendas_total'] = df[vendas_cols].sum(axis=1)
-                logger.info("Coluna vendas_total criada no dataset")
-
-            self._cached_data[cache_key] = df
-            self._cache_timestamp = current_time
-            logger.info(f"Cache atualizado: {len(df)} registros")
+                result = aggregate_frame(df, group_by, measures, filters, index)
 
-        return self._cached_data[cache_key]
+        if batch_key is not None:
+            self._batch_aggregates[batch_key] = result
+        return result
 
+    def _should_stream(self, query_type: str) -> bool:
+        """Consulta do backend ou do modo em blocos sobre o parquet, só com o dataset fora da memória.
+
+        Com o DataFrame carregado, cubos e pandas respondem sem reler os arquivos e
+        ganham do backend; ele serve às consultas que evitariam carregar o dataset.
+        """
+        if self._cached_data.get("full_data") is not None or self.parquet_adapter._dataframe is not None:
+            return False
+        if self.backend.supports(query_type):
+            return True
+        return self.chunked is not None and query_type in STREAMABLE_QUERIES
+
+    def _get_stream_frame(self) -> pd.DataFrame:
+        """DataFrame vazio com as colunas do dataset (e as medidas derivadas), um por versão."""
+        if self._stream_frame is None:
+            names = self.parquet_adapter._get_dataset().schema.names
+            self._stream_frame = pd.DataFrame(columns=list(dict.fromkeys(names + DERIVED_COLUMNS)))
+        return self._stream_frame
+
+    def _is_streamed(self, df: pd.DataFrame) -> bool:
+        """Indica se df é o marcador do modo em blocos (as linhas estão no parquet)."""
+        return self._stream_frame is not None and df is self._stream_frame
+
+    def _scan(self, df: pd.DataFrame, partials: List[Any], columns: List[str]) -> List[Any]:
+        """Alimenta agregados parciais com df ou, no modo em blocos, com o parquet bloco a bloco."""
+        if self._is_streamed(df):
+            return self.chunked.scan(partials, columns)
+        for partial in partials:
+            partial.update(df)
+        return partials
+
+    @profiled("load_data")
+    def _get_une_partition_data(self, query_type: str, params: Dict[str, Any]) -> Optional[pd.DataFrame]:
+        """Obtém apenas a partição da UNE para consultas restritas a uma UNE.
+
+        Returns:
+            DataFrame da partição, ou None se a consulta deve usar o dataset completo
+            (adapter não particionado, dataset já em memória ou UNE desconhecida).
+        """
+        une_param = UNE_SCOPED_QUERIES.get(query_type)
+        if une_param is None or not getattr(self.parquet_adapter, "is_partitioned", False):
+            return None
+        if self.parquet_adapter._dataframe is not None:
+            # Dataset completo já carregado - filtrar em memória é mais barato
+            return None
+
+        une_code = self.parquet_adapter.resolve_une_code(params.get(une_param))
+        if une_code is None:
+            return None
+
+        logger.info(f"⚡ PARTITION PRUNING - Lendo apenas a partição une={une_code}")
+        return self.parquet_adapter.load_partition(une_code, [col for col in QUERY_COLUMNS.get(query_type) or []
+                                                              if col not in ESSENTIAL_COLUMNS])
+
+    @profiled("classify")
     def classify_intent_direct(self, user_query: str) -> Tuple[str, Dict[str, Any]]:
-        """Classifica intenção SEM usar LLM - apenas keywords."""
+        """Classifica intenção SEM usar LLM - regras de padrões e keywords dos templates."""
         start_time = datetime.now()
         logger.info(f"CLASSIFICANDO INTENT: '{user_query}'")
 
         try:
-            query_lower = user_query.lower()
-
-            # ALTA PRIORIDADE: Detectar consultas de PREÇO de produto em UNE específica
-            preco_produto_une_match = re.search(r'(pre[çc]o|valor|custo).*produto\s*(\d{5,7}).*une\s*([A-Za-z0-9]+)', query_lower)
-            if preco_produto_une_match:
-                produto_codigo = preco_produto_une_match.group(2)
-                une_nome = preco_produto_une_match.group(3).upper()
-                result = ("preco_produto_une_especifica", {"produto_codigo": produto_codigo, "une_nome": une_nome})
-                logger.info(f"CLASSIFICADO COMO: preco_produto_une_especifica (produto: {produto_codigo}, une: {une_nome})")
-                return result
-
-            # ALTA PRIORIDADE: Detectar consultas de TOP PRODUTOS em UNE específica
-            top_produtos_une_match = re.search(r'(\d+)\s*produtos\s*mais\s*vendidos\s+na\s+une\s+([A-Za-z0-9]+)\b', query_lower)
-            if top_produtos_une_match:
-                limite = int(top_produtos_une_match.group(1))
-                une_nome = top_produtos_une_match.group(2).upper()
-                result = ("top_produtos_une_especifica", {"limite": limite, "une_nome": une_nome})
-                logger.info(f"CLASSIFICADO COMO: top_produtos_une_especifica (limite: {limite}, une: {une_nome})")
-                return result
-
-            # ALTA PRIORIDADE: Detectar consultas de VENDAS DE UNE em MÊS específico
-            vendas_une_mes_match = re.search(r'vendas.*une\s*([A-Za-z0-9]+).*em\s*(janeiro|fevereiro|março|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro|jan|fev|mar|abr|mai|jun|jul|ago|set|out|nov|dez)', query_lower)
-            if vendas_une_mes_match:
-                une_nome = vendas_une_mes_match.group(1).upper()
-                mes_nome = vendas_une_mes_match.group(2).lower()
-                result = ("vendas_une_mes_especifico", {"une_nome": une_nome, "mes_nome": mes_nome})
-                logger.info(f"CLASSIFICADO COMO: vendas_une_mes_especifico (une: {une_nome}, mes: {mes_nome})")
-                return result
-
-            # ALTA PRIORIDADE: Detectar consultas de VENDAS TOTAIS DE CADA UNE
-            vendas_todas_unes_match = re.search(r'vendas\s*(totais|total).*(cada\s*une|todas\s*unes|por\s*une)', query_lower)
-            if vendas_todas_unes_match:
-                result = ("ranking_vendas_unes", {})
-                logger.info(f"CLASSIFICADO COMO: ranking_vendas_unes")
-                return result
-
-            # ALTA PRIORIDADE: Detectar consultas de PRODUTO MAIS VENDIDO EM CADA UNE
-            produto_cada_une_match = re.search(r'produto\s*mais\s*vendido.*(cada\s*une|em\s*cada\s*une|por\s*une)', query_lower)
-            if produto_cada_une_match:
-                result = ("produto_mais_vendido_cada_une", {})
-                logger.info(f"CLASSIFICADO COMO: produto_mais_vendido_cada_une")
-                return result
-
-            # ALTA PRIORIDADE: Detectar consultas de PRODUTO MAIS VENDIDO EM TODAS AS UNES
-            produto_todas_unes_match = re.search(r'produto\s*mais\s*vendido.*(todas?\s*unes?|todas?\s*as\s*unes?|em\s*todas?\s*unes?)', query_lower)
-            if produto_todas_unes_match:
-                result = ("produto_mais_vendido_cada_une", {})  # Usar o mesmo método
-                logger.info(f"CLASSIFICADO COMO: produto_mais_vendido_cada_une (todas as UNEs)")
-                return result
-
-            # CORREÇÃO: Detectar GRÁFICO DE BARRAS para produto em TODAS AS UNEs (MAIOR PRIORIDADE)
-            product_all_unes_match = re.search(r'(gr[áa]fico.*barras?|barras?).*produto\s*(\d{5,7}).*(todas.*unes?|todas.*filiais?)', query_lower)
-            if product_all_unes_match:
-                produto_codigo = product_all_unes_match.group(2)
-                result = ("produto_vendas_todas_unes", {"produto_codigo": produto_codigo})
-                logger.info(f"CLASSIFICADO COMO: produto_vendas_todas_unes (produto: {produto_codigo})")
-                return result
-
-            # Detectar GRÁFICO DE BARRAS para produto específico com UNE específica
-            product_bar_une_match = re.search(r'(gr[áa]fico.*barras?|barras?).*produto\s*(\d{5,7}).*une\s*(\d+)', query_lower)
-            if product_bar_une_match:
-                produto_codigo = product_bar_une_match.group(2)
-                une_codigo = product_bar_une_match.group(3)
-                result = ("produto_vendas_une_barras", {"produto_codigo": produto_codigo, "une_codigo": une_codigo})
-                logger.info(f"CLASSIFICADO COMO: produto_vendas_une_barras (produto: {produto_codigo}, une: {une_codigo})")
-                return result
-
-            # Detectar EVOLUÇÃO DE VENDAS para um produto específico
-            product_evo_match = re.search(r'(gr[áa]fico|evolu[çc][ãa]o|hist[óo]rico|vendas\s+do\s+produto)\s.*?(\b\d{5,7}\b)', query_lower)
-            if product_evo_match:
-                produto_codigo = product_evo_match.group(2)
-                result = ("evolucao_vendas_produto", {"produto_codigo": produto_codigo})
-                logger.info(f"CLASSIFICADO COMO: evolucao_vendas_produto (código: {produto_codigo})")
-                return result
-
-            # Detectar top produtos por segmento com nome do segmento
-            segmento_match = re.search(r'(top\s+\d+\s+produtos|produtos\s+mais\s+vendidos).*(segmento\s+(\w+)|(\w+)\s+segmento)', query_lower)
-            if segmento_match:
-                segmento_nome = segmento_match.group(3) or segmento_match.group(4)
-                result = ("top_produtos_por_segmento", {"segmento": segmento_nome, "limit": 10})
-                logger.info(f"CLASSIFICADO COMO: top_produtos_por_segmento (segmento: {segmento_nome})")
-                return result
-
-            # Buscar correspondência direta por keywords
-            for keywords, query_type in self.keywords_map.items():
-                if keywords in query_lower:
-                    # Se for top produtos e não tem segmento específico, assumir que quer de todos
-                    if query_type == "top_produtos_por_segmento" and "segmento" not in query_lower:
-                        result = (query_type, {"segmento": "todos", "limit": 10})
-                        logger.info(f"CLASSIFICADO COMO: {query_type} (todos os segmentos)")
-                        return result
-
-                    result = (query_type, {"matched_keywords": keywords})
-                    logger.info(f"CLASSIFICADO COMO: {query_type} (keyword: {keywords})")
-                    return result
-
-            # Detectar números de produtos (agora com menor prioridade)
-            product_match = re.search(r'\b\d{5,7}\b', user_query)
-            if product_match:
-                produto_codigo = product_match.group()
-                result = ("consulta_produto_especifico", {"produto_codigo": produto_codigo})
-                logger.info(f"CLASSIFICADO COMO: consulta_produto_especifico (código: {produto_codigo})")
-                return result
-
-            # Detectar nomes de UNE
-            une_match = re.search(r'\bune\s+(\w+)\b|\b(\w+)\s+une\b', query_lower)
-            if une_match:
-                une_name = une_match.group(1) or une_match.group(2)
-                result = ("consulta_une_especifica", {"une_nome": une_name.upper()})
-                logger.info(f"CLASSIFICADO COMO: consulta_une_especifica (UNE: {une_name})")
-                return result
-
-            # Default para análise geral
-            result = ("analise_geral", {"tipo": "geral"})
-            logger.warning(f"CLASSIFICADO COMO PADRÃO: analise_geral")
-            return result
+            # Regras dos templates compiladas: uma varredura classifica e extrai os parâmetros
+            query_type, params = self.intent_matcher.classify(normalize_query(user_query))
+            if query_type == self.intent_matcher.default[0]:
+                logger.warning(f"CLASSIFICADO COMO PADRÃO: {query_type}")
+            else:
+                logger.info(f"CLASSIFICADO COMO: {query_type} {params}")
+            return query_type, params
 
         except Exception as e:
             duration = (datetime.now() - start_time).total_seconds()
@@ -315,58 +423,39 @@ class DirectQueryEngine:
             log_performance_metric("classify_intent", duration, {"query_length": len(user_query)})
 
     def execute_direct_query(self, query_type: str, params: Dict[str, Any]) -> Dict[str, Any]:
-        """Executa consulta direta SEM usar LLM."""
+        """Executa consulta direta SEM usar LLM.
+
+        Com o profiler ligado, o resultado traz os tempos por etapa em "timings" (ms).
+        """
+        with query_profiler.trace(query_type) as trace:
+            result = self._execute_direct_query(query_type, params)
+        if trace is not None:
+            result["timings"] = trace.timings()
+        return result
+
+    def _execute_direct_query(self, query_type: str, params: Dict[str, Any]) -> Dict[str, Any]:
         start_time = datetime.now()
         logger.info(f"EXECUTANDO CONSULTA: {query_type} | Params: {params}")
 
         try:
-            # 🔧 FIX CRÍTICO: Para consultas específicas de produtos, carregar dataset completo
-            full_dataset_queries = ["consulta_produto_especifico", "consulta_une_especifica", "evolucao_vendas_produto", "produto_vendas_une_barras", "produto_vendas_todas_unes", "preco_produto_une_especifica", "top_produtos_une_especifica", "vendas_une_mes_especifico", "ranking_vendas_unes", "produto_mais_vendido_cada_une", "top_produtos_por_segmento"]
-            use_full_dataset = query_type in full_dataset_queries
-
-            if use_full_dataset:
-                logger.info("⚡ CONSULTA ESPECÍFICA DETECTADA - Carregando dataset COMPLETO")
-
-            df = self._get_cached_base_data(full_dataset=use_full_dataset)
-
-            if df.empty:
-                error_msg = "Dados não disponíveis"
-                logger.error(f"ERRO - DADOS VAZIOS: {error_msg}")
-                log_query_attempt(f"{query_type}", query_type, params, False, error_msg)
-                return {"error": error_msg, "type": "error"}
-
-            logger.info(f"DADOS CARREGADOS: {len(df)} registros, {list(df.columns)}")
-
-            # Dispatch para método específico
-            method_name = f"_query_{query_type}"
-            if hasattr(self, method_name):
-                logger.info(f"EXECUTANDO MÉTODO: {method_name}")
-                method = getattr(self, method_name)
-                result = method(df, params)
+            # Colunas e linhas que a consulta lê: visão do dataset completo ou partição da UNE
+            data_plan = plan_query_data(query_type, params)
+            self._check_data_version()
+            df = self._get_une_partition_data(query_type, params)
+            from_partition = df is not None
+            if from_partition:
+                df = project_view(df, data_plan)
+            elif self._should_stream(query_type):
+                mode = f"BACKEND {self.backend.name}" if self.backend.supports(query_type) else "MODO EM BLOCOS"
+                logger.info(f"{mode}: {query_type} sem carregar o dataset")
+                df = self._get_stream_frame()
             else:
-                logger.warning(f"MÉTODO NÃO ENCONTRADO: {method_name} - usando fallback")
-                result = self._query_fallback(df, query_type, params)
-
-            # Log do resultado
-            success = result.get("type") != "error"
-            error_msg = result.get("error") if not success else None
+                df = self._get_query_data(data_plan)
 
-            log_query_attempt(f"{query_type}", query_type, params, success, error_msg)
-
-            if success:
-                logger.info(f"CONSULTA SUCESSO: {query_type} - {result.get('title', 'N/A')}")
-            else:
-                logger.error(f"CONSULTA FALHOU: {query_type} - {error_msg}")
-
-            return result
+            return self._run_query_method(query_type, params, df, data_plan, from_partition)
 
         except Exception as e:
-            error_msg = str(e)
-            log_critical_error(e, "execute_direct_query", {"query_type": query_type, "params": params})
-            log_query_attempt(f"{query_type}", query_type, params, False, error_msg)
-            logger.error(f"ERRO CRÍTICO NA EXECUÇÃO: {query_type} - {error_msg}")
-            logger.error(f"TRACEBACK: {traceback.format_exc()}")
-            return {"error": error_msg, "type": "error"}
+            return self._query_exception(e, query_type, params, "execute_direct_query")
 
         finally:
             duration = (datetime.now() - start_time).total_seconds()
@@ -376,20 +465,153 @@ class DirectQueryEngine:
                 "data_rows": len(df) if 'df' in locals() and not df.empty else 0
             })
 
+    def execute_many(self, queries: Sequence[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Executa várias consultas diretas dividindo o trabalho entre as compatíveis.
+
+        - consultas repetidas (mesmo tipo e parâmetros) rodam uma vez;
+        - consultas com o mesmo filtro de linhas (ex.: vários produtos) fazem uma
+          única seleção, repartida por valor;
+        - agregações no mesmo grão (ex.: filial_mais_vendeu e ranking_vendas_unes)
+          são calculadas uma vez por lote.
+
+        O lote lê o dataset completo (uma leitura no lugar de uma partição por consulta).
+
+        Args:
+            queries: Pares (query_type, params), como os de classify_intent_direct.
+
+        Returns:
+            Um resultado por consulta, na ordem de entrada.
+        """
+        start_time = datetime.now()
+        queries = list(queries)
+        logger.info(f"EXECUTANDO LOTE: {len(queries)} consultas")
+
+        # Consultas distintas, na ordem da primeira ocorrência
+        distinct: Dict[str, int] = {}
+        slots = [distinct.setdefault(self._batch_key(query_type, params), len(distinct))
+                 for query_type, params in queries]
+        unique = list({self._batch_key(*query): query for query in queries}.values())
+        plans = [plan_query_data(query_type, params) for query_type, params in unique]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(unique)
+
+        self._batch_aggregates = {}
+        try:
+            # Colunas sob demanda do lote inteiro carregadas de uma vez
+            df = self._get_cached_base_data()
+            lazy_columns = list(dict.fromkeys(col for plan in plans for col in plan.lazy_columns(df.columns)))
+            if lazy_columns:
+                df = self._get_cached_base_data(extra_columns=lazy_columns)
+            index = self._get_dataset_index(df) if not df.empty else None
+            row_views = shared_row_views(df, plans, index) if not df.empty else {}
+
+            for slot, (query_type, params) in enumerate(unique):
+                try:
+                    # Um trace por consulta; a carga compartilhada do lote fica de fora
+                    with query_profiler.trace(query_type) as trace:
+                        view = row_views.get(slot)
+                        if view is None:
+                            with query_profiler.span("select"):
+                                view = project_view(df, plans[slot], index) if not df.empty else df
+                        results[slot] = self._run_query_method(query_type, params, view, plans[slot])
+                    if trace is not None:
+                        results[slot]["timings"] = trace.timings()
+                except Exception as e:
+                    results[slot] = self._query_exception(e, query_type, params, "execute_many")
+        except Exception as e:
+            # Falha ao carregar o dataset: o erro vale para todas as consultas sem resultado
+            for slot, (query_type, params) in enumerate(unique):
+                if results[slot] is None:
+                    results[slot] = self._query_exception(e, query_type, params, "execute_many")
+        finally:
+            shared_aggregates = len(self._batch_aggregates)
+            self._batch_aggregates = None
+            duration = (datetime.now() - start_time).total_seconds()
+            log_performance_metric("execute_many", duration, {
+                "queries": len(queries),
+                "distinct_queries": len(unique),
+                "shared_aggregates": shared_aggregates
+            })
+
+        # Repetidas recebem uma cópia rasa: quem consome o resultado costuma anotá-lo
+        ordered, seen = [], set()
+        for slot in slots:
+            ordered.append(dict(results[slot]) if slot in seen else results[slot])
+            seen.add(slot)
+        return ordered
+
+    @staticmethod
+    def _batch_key(query_type: str, params: Dict[str, Any]) -> str:
+        """Identidade de uma consulta no lote (tipo + parâmetros)."""
+        return query_type + json.dumps(params, sort_keys=True, default=str)
+
+    def _run_query_method(self, query_type: str, params: Dict[str, Any], df: pd.DataFrame,
+                          data_plan: DataPlan, from_partition: bool = False) -> Dict[str, Any]:
+        """Despacha a consulta para o método _query_* sobre os dados já planejados e registra o resultado."""
+        # Com filtro de linhas, uma visão vazia é resposta do método (ex.: produto não encontrado);
+        # no modo em blocos as linhas são lidas pelo próprio método
+        if df.empty and not data_plan.row_filters and not self._is_streamed(df):
+            error_msg = "Dados não disponíveis"
+            logger.error(f"ERRO - DADOS VAZIOS: {error_msg}")
+            log_query_attempt(f"{query_type}", query_type, params, False, error_msg)
+            return {"error": error_msg, "type": "error"}
+
+        logger.info(f"DADOS CARREGADOS: {len(df)} registros, {list(df.columns)}")
+
+        # Dispatch para método específico
+        method_name = f"_query_{query_type}"
+        if hasattr(self, method_name):
+            logger.info(f"EXECUTANDO MÉTODO: {method_name}")
+            method = getattr(self, method_name)
+            with query_profiler.span("query"):
+                result = method(df, params)
+
+            # Erros (ex.: produto fora da UNE) precisam do dataset completo para sugerir alternativas
+            if from_partition and result.get("type") == "error":
+                logger.info("Consulta na partição sem resultado - repetindo sobre o dataset completo")
+                df = self._get_query_data(data_plan)
+                result = method(df, params)
+        else:
+            logger.warning(f"MÉTODO NÃO ENCONTRADO: {method_name} - usando fallback")
+            result = self._query_fallback(df, query_type, params)
+
+        # Log do resultado
+        success = result.get("type") != "error"
+        error_msg = result.get("error") if not success else None
+
+        log_query_attempt(f"{query_type}", query_type, params, success, error_msg)
+
+        if success:
+            logger.info(f"CONSULTA SUCESSO: {query_type} - {result.get('title', 'N/A')}")
+        else:
+            logger.error(f"CONSULTA FALHOU: {query_type} - {error_msg}")
+
+        return result
+
+    def _query_exception(self, error: Exception, query_type: str, params: Dict[str, Any],
+                         context: str) -> Dict[str, Any]:
+        """Registra uma exceção na execução e a converte no resultado de erro."""
+        error_msg = str(error)
+        log_critical_error(error, context, {"query_type": query_type, "params": params})
+        log_query_attempt(f"{query_type}", query_type, params, False, error_msg)
+        logger.error(f"ERRO CRÍTICO NA EXECUÇÃO: {query_type} - {error_msg}")
+        logger.error(f"TRACEBACK: {traceback.format_exc()}")
+        return {"error": error_msg, "type": "error"}
+
     def _query_produto_mais_vendido(self, df: pd.DataFrame, params: Dict[str, Any]) -> Dict[str, Any]:
-        """Query: Produto mais vendido."""
+        """Query: Produto mais vendido (vendas do produto somadas em todas as UNEs)."""
         if 'vendas_total' not in df.columns:
             return {"error": "Dados de vendas não disponíveis", "type": "error"}
 
-        top_produto = df.nlargest(1, 'vendas_total')
+        # Vendas por produto (todas as UNEs) a partir do cubo (codigo)
+        vendas_por_produto = self._aggregate(df, ['codigo'], ['vendas_total'])
+        top_10 = vendas_por_produto.nlargest(10, 'vendas_total')
 
-        if top_produto.empty:
+        if top_10.empty:
             return {"error": "Nenhum produto encontrado", "type": "error"}
 
-        produto = top_produto.iloc[0]
+        produto = top_10.iloc[0]
 
         # Gerar gráfico
-        top_10 = df.nlargest(10, 'vendas_total')
         chart = self.chart_generator.create_product_ranking_chart(
             top_10[['nome_produto', 'vendas_total']],
             limit=10,
@@ -398,14 +620,17 @@ class DirectQueryEngine:
 
         return {
             "type": "produto_ranking",
-            "title": "Produto Mais Vendido",
+            "title": "Produto Mais Vendido (Total de Todas as UNEs)",
+            "description": "Ranking pela soma das vendas de cada produto em todas as UNEs.",
             "result": {
                 "produto": produto['nome_produto'],
                 "vendas": float(produto['vendas_total']),
-                "codigo": produto.get('codigo', 'N/A')
+                "codigo": produto.get('codigo', 'N/A'),
+                "escopo": "total_todas_unes"
             },
             "chart": chart,
-            "summary": f"O produto mais vendido é '{produto['nome_produto']}' com {produto['vendas_total']:,.0f} vendas.",
+            "summary": f"O produto mais vendido é '{produto['nome_produto']}' com {produto['vendas_total']:,.0f} vendas "
+                       f"somando todas as UNEs.",
             "tokens_used": 0  # ZERO tokens LLM
         }
 
@@ -414,7 +639,7 @@ class DirectQueryEngine:
         if 'vendas_total' not in df.columns or 'une_nome' not in df.columns:
             return {"error": "Dados de filiais/vendas não disponíveis", "type": "error"}
 
-        vendas_por_filial = df.groupby('une_nome')['vendas_total'].sum().reset_index()
+        vendas_por_filial = self._aggregate(df, ['une'], ['vendas_total'])
         vendas_por_filial = vendas_por_filial.sort_values('vendas_total', ascending=False)
 
         top_filial = vendas_por_filial.iloc[0]
@@ -442,14 +667,14 @@ class DirectQueryEngine:
         if 'vendas_total' not in df.columns or 'nomesegmento' not in df.columns:
             return {"error": "Dados de segmentos não disponíveis", "type": "error"}
 
-        vendas_por_segmento = df.groupby('nomesegmento')['vendas_total'].sum().reset_index()
+        vendas_por_segmento = self._aggregate(df, ['nomesegmento'], ['vendas_total'])
         vendas_por_segmento = vendas_por_segmento.sort_values('vendas_total', ascending=False)
 
         top_segmento = vendas_por_segmento.iloc[0]
 
         # Gerar gráfico
         chart = self.chart_generator.create_segmentation_chart(
-            df, 'nomesegmento', 'vendas_total', chart_type='pie'
+            vendas_por_segmento, 'nomesegmento', 'vendas_total', chart_type='pie'
         )
 
         return {
@@ -469,24 +694,31 @@ class DirectQueryEngine:
         if 'vendas_total' not in df.columns:
             return {"error": "Dados de vendas não disponíveis", "type": "error"}
 
-        produtos_sem_vendas = df[df['vendas_total'] == 0]
-        count_sem_vendas = len(produtos_sem_vendas)
-
-        # Top 10 produtos sem vendas com maior estoque
+        # Contagens e exemplos como agregados parciais (uma passada, em memória ou em blocos)
+        sem_vendas = MeasureTotals(where=lambda chunk: chunk['vendas_total'] == 0)
         if 'estoque_atual' in df.columns:
-            top_sem_vendas = produtos_sem_vendas[produtos_sem_vendas['estoque_atual'] > 0].nlargest(10, 'estoque_atual')
+            # Exemplos: produtos sem vendas com maior estoque
+            exemplos = TopKPartial(5, 'estoque_atual', ['nome_produto'],
+                                   where=lambda chunk: (chunk['vendas_total'] == 0) & (chunk['estoque_atual'] > 0))
         else:
-            top_sem_vendas = produtos_sem_vendas.head(10)
+            exemplos = TopKPartial(5, None, ['nome_produto'], where=lambda chunk: chunk['vendas_total'] == 0)
+        self._scan(df, [sem_vendas, exemplos], ['vendas_total', 'estoque_atual', 'nome_produto'])
+
+        count_sem_vendas = sem_vendas.matched
+        total_linhas = sem_vendas.rows
+        if not total_linhas:
+            return {"error": "Dados não disponíveis", "type": "error"}
+        top_sem_vendas = exemplos.result()
 
         return {
             "type": "produtos_sem_movimento",
             "title": "Produtos Sem Movimento",
             "result": {
                 "total_produtos": count_sem_vendas,
-                "percentual": round(count_sem_vendas / len(df) * 100, 1),
-                "produtos_exemplo": top_sem_vendas[['nome_produto']].head(5).to_dict('records') if not top_sem_vendas.empty else []
+                "percentual": round(count_sem_vendas / total_linhas * 100, 1),
+                "produtos_exemplo": top_sem_vendas[['nome_produto']].to_dict('records') if not top_sem_vendas.empty else []
             },
-            "summary": f"Encontrados {count_sem_vendas} produtos sem movimento ({count_sem_vendas/len(df)*100:.1f}% do total).",
+            "summary": f"Encontrados {count_sem_vendas} produtos sem movimento ({count_sem_vendas/total_linhas*100:.1f}% do total).",
             "tokens_used": 0
         }
 
@@ -495,9 +727,14 @@ class DirectQueryEngine:
         if 'vendas_total' not in df.columns or 'estoque_atual' not in df.columns:
             return {"error": "Dados de estoque não disponíveis", "type": "error"}
 
-        estoque_parado = df[(df['vendas_total'] == 0) & (df['estoque_atual'] > 0)]
-        total_estoque_parado = estoque_parado['estoque_atual'].sum()
-        count_produtos = len(estoque_parado)
+        # Estoque sem vendas e preço médio geral como agregados parciais
+        estoque_parado = MeasureTotals(['estoque_atual'],
+                                       where=lambda chunk: (chunk['vendas_total'] == 0) & (chunk['estoque_atual'] > 0))
+        precos = MeasureTotals(['preco_38_percent'] if 'preco_38_percent' in df.columns else [])
+        self._scan(df, [estoque_parado, precos], ['vendas_total', 'estoque_atual', 'preco_38_percent'])
+
+        total_estoque_parado = estoque_parado.sums['estoque_atual']
+        count_produtos = estoque_parado.matched
 
         return {
             "type": "estoque_parado",
@@ -505,7 +742,7 @@ class DirectQueryEngine:
             "result": {
                 "produtos_parados": count_produtos,
                 "quantidade_total": float(total_estoque_parado),
-                "valor_estimado": float(total_estoque_parado * df['preco_38_percent'].mean()) if 'preco_38_percent' in df.columns else None
+                "valor_estimado": float(total_estoque_parado * precos.mean('preco_38_percent')) if precos.measures else None
             },
             "summary": f"Identificados {count_produtos} produtos com estoque parado totalizando {total_estoque_parado:,.0f} unidades.",
             "tokens_used": 0
@@ -520,7 +757,7 @@ class DirectQueryEngine:
         except (ValueError, TypeError):
             return {"error": f"Código de produto inválido: {produto_codigo}", "type": "error"}
 
-        produto_data = df[df['codigo'] == produto_codigo]
+        produto_data = self._select_rows(df, codigo=produto_codigo)
 
         if produto_data.empty:
             return {"error": f"Produto {produto_codigo} não encontrado", "type": "error"}
@@ -563,11 +800,11 @@ class DirectQueryEngine:
             return {"error": f"Código de produto inválido: {produto_codigo}", "type": "error"}
 
         # Verificar se produto existe na UNE específica
-        produto_une_data = df[(df['codigo'] == produto_codigo) & (df['une_nome'] == une_nome)]
+        produto_une_data = self._select_rows(df, codigo=produto_codigo, une_nome=une_nome)
 
         if produto_une_data.empty:
             # Verificar se produto existe em outras UNEs
-            produto_geral = df[df['codigo'] == produto_codigo]
+            produto_geral = self._select_rows(df, codigo=produto_codigo)
             if produto_geral.empty:
                 return {"error": f"Produto {produto_codigo} não encontrado no sistema", "type": "error"}
             else:
@@ -615,7 +852,7 @@ class DirectQueryEngine:
             return {"error": "Dados de vendas não disponíveis", "type": "error"}
 
         # Verificar se UNE existe
-        une_data = df[df['une_nome'] == une_nome]
+        une_data = self._select_rows(df, une_nome=une_nome)
         if une_data.empty:
             unes_disponiveis = df['une_nome'].unique()
             return {
@@ -625,7 +862,7 @@ class DirectQueryEngine:
             }
 
         # Filtrar apenas produtos da UNE específica com vendas > 0
-        produtos_une = une_data[une_data['vendas_total'] > 0].copy()
+        produtos_une = une_data[une_data['vendas_total'] > 0]
 
         if produtos_une.empty:
             return {
@@ -644,45 +881,18 @@ class DirectQueryEngine:
         # Ordenar por vendas e pegar o top N
         top_produtos = produtos_agrupados.nlargest(limite, 'vendas_total')
 
-        # Preparar dados para gráfico
-        x_data = [produto['nome_produto'][:50] + '...' if len(produto['nome_produto']) > 50 else produto['nome_produto']
-                  for _, produto in top_produtos.iterrows()]
-        y_data = [float(produto['vendas_total']) for _, produto in top_produtos.iterrows()]
-
-        # Cores baseadas na performance
-        max_vendas = max(y_data) if y_data else 1
-        colors = []
-        for valor in y_data:
-            if valor >= max_vendas * 0.7:
-                colors.append('#2E8B57')  # Verde escuro para top performers
-            elif valor >= max_vendas * 0.3:
-                colors.append('#FFD700')  # Dourado para performance média
-            else:
-                colors.append('#CD5C5C')  # Vermelho suave para baixa performance
+        # Dados do gráfico (cores por faixa de desempenho)
+        chart_data = bar_chart_data(truncate_labels(top_produtos['nome_produto'], 50),
+                                    top_produtos['vendas_total'], colors=True, bar_height=50)
 
-        # Criar dados do gráfico
-        chart_data = {
-            "x": x_data,
-            "y": y_data,
-            "type": "bar",
-            "colors": colors,
-            "show_values": True,
-            "height": max(400, min(800, len(x_data) * 50)),
-            "margin": {"l": 80, "r": 80, "t": 100, "b": 120}
-        }
-
-        # Preparar lista de produtos para resultado
-        produtos_list = []
-        for _, produto in top_produtos.iterrows():
-            produtos_list.append({
-                "codigo": int(produto['codigo']),
-                "nome": produto['nome_produto'],
-                "vendas": float(produto['vendas_total']),
-                "preco": float(produto.get('preco_38_percent', 0)),
-                "segmento": produto.get('nomesegmento', 'N/A')
-            })
+        produtos_list = to_records(
+            top_produtos,
+            {'codigo': 'codigo', 'nome_produto': 'nome', 'vendas_total': 'vendas',
+             'preco_38_percent': 'preco', 'nomesegmento': 'segmento'},
+            types={'codigo': int, 'vendas': float, 'preco': float}
+        )
 
-        total_vendas = sum(y_data)
+        total_vendas = sum(chart_data["y"])
 
         return {
             "type": "chart",
@@ -725,7 +935,7 @@ class DirectQueryEngine:
             return {"error": f"Mês '{mes_nome}' não reconhecido", "type": "error"}
 
         # Verificar se UNE existe
-        une_data = df[df['une_nome'] == une_nome]
+        une_data = self._select_rows(df, une_nome=une_nome)
         if une_data.empty:
             unes_disponiveis = df['une_nome'].unique()
             return {
@@ -760,41 +970,17 @@ class DirectQueryEngine:
         if 'vendas_total' not in df.columns:
             return {"error": "Dados de vendas não disponíveis", "type": "error"}
 
-        # Agrupar por UNE e somar todas as vendas
-        vendas_por_une = df.groupby(['une', 'une_nome']).agg({
-            'vendas_total': 'sum'
-        }).reset_index()
+        # Vendas totais por UNE a partir do cubo (une)
+        vendas_por_une = self._aggregate(df, ['une'], ['vendas_total'])
 
         # Ordenar por vendas totais (decrescente)
         vendas_por_une = vendas_por_une.sort_values('vendas_total', ascending=False)
 
-        # Preparar dados para gráfico
-        x_data = [f"{row['une_nome']}\n(UNE {row['une']})" for _, row in vendas_por_une.iterrows()]
-        y_data = [float(row['vendas_total']) for _, row in vendas_por_une.iterrows()]
-
-        # Cores baseadas na performance
-        max_vendas = max(y_data) if y_data else 1
-        colors = []
-        for valor in y_data:
-            if valor >= max_vendas * 0.7:
-                colors.append('#2E8B57')  # Verde escuro para top performers
-            elif valor >= max_vendas * 0.3:
-                colors.append('#FFD700')  # Dourado para performance média
-            else:
-                colors.append('#CD5C5C')  # Vermelho suave para baixa performance
-
-        # Criar dados do gráfico
-        chart_data = {
-            "x": x_data,
-            "y": y_data,
-            "type": "bar",
-            "colors": colors,
-            "show_values": True,
-            "height": max(400, min(800, len(x_data) * 60)),
-            "margin": {"l": 80, "r": 80, "t": 100, "b": 120}
-        }
+        # Dados do gráfico (cores por faixa de desempenho)
+        labels = vendas_por_une['une_nome'].astype(str) + "\n(UNE " + vendas_por_une['une'].astype(str) + ")"
+        chart_data = bar_chart_data(labels, vendas_por_une['vendas_total'], colors=True, bar_height=60)
 
-        total_vendas_geral = sum(y_data)
+        total_vendas_geral = sum(chart_data["y"])
 
         return {
             "type": "chart",
@@ -815,51 +1001,20 @@ class DirectQueryEngine:
         if 'vendas_total' not in df.columns or 'une_nome' not in df.columns:
             return {"error": "Dados de vendas/UNE não disponíveis", "type": "error"}
 
-        # Encontrar o produto mais vendido por UNE
-        produtos_por_une = []
-
-        # Agrupar por UNE
-        for une_nome in df['une_nome'].unique():
-            une_data = df[df['une_nome'] == une_nome]
+        # Produto mais vendido de cada UNE: um único groupby/idxmax sobre o cubo (une, codigo)
+        vendas_une_produto = self._aggregate(df, ['une', 'codigo'], ['vendas_total'])
+        produtos_top = top_per_group(vendas_une_produto, 'une_nome', 'vendas_total')
+        produtos_top = produtos_top.sort_values('vendas_total', ascending=False, kind='stable')
 
-            # Encontrar produto mais vendido desta UNE
-            produto_top = une_data.loc[une_data['vendas_total'].idxmax()]
-
-            produtos_por_une.append({
-                'une_nome': une_nome,
-                'produto_codigo': produto_top['codigo'],
-                'produto_nome': produto_top['nome_produto'],
-                'vendas_total': produto_top['vendas_total']
-            })
+        produtos_por_une = to_records(
+            produtos_top,
+            {'une_nome': 'une_nome', 'codigo': 'produto_codigo',
+             'nome_produto': 'produto_nome', 'vendas_total': 'vendas_total'}
+        )
 
-        # Ordenar por vendas (descendente)
-        produtos_por_une.sort(key=lambda x: x['vendas_total'], reverse=True)
-
-        # Preparar dados para gráfico com nome do produto
-        x_data = [f"UNE {item['une_nome']}\n{item['produto_nome'][:30]}{'...' if len(item['produto_nome']) > 30 else ''}" for item in produtos_por_une]
-        y_data = [float(item['vendas_total']) for item in produtos_por_une]
-
-        # Cores baseadas na performance
-        max_vendas = max(y_data) if y_data else 1
-        colors = []
-        for valor in y_data:
-            if valor >= max_vendas * 0.7:
-                colors.append('#2E8B57')  # Verde escuro para top performers
-            elif valor >= max_vendas * 0.3:
-                colors.append('#FFD700')  # Dourado para performance média
-            else:
-                colors.append('#CD5C5C')  # Vermelho suave para baixa performance
-
-        # Criar dados do gráfico
-        chart_data = {
-            "x": x_data,
-            "y": y_data,
-            "type": "bar",
-            "colors": colors,
-            "show_values": True,
-            "height": max(400, min(800, len(x_data) * 60)),
-            "margin": {"l": 80, "r": 80, "t": 100, "b": 120}
-        }
+        # Dados do gráfico com nome do produto (cores por faixa de desempenho)
+        labels = "UNE " + produtos_top['une_nome'].astype(str) + "\n" + truncate_labels(produtos_top['nome_produto'], 30)
+        chart_data = bar_chart_data(labels, produtos_top['vendas_total'], colors=True, bar_height=60)
 
         return {
             "type": "chart",
@@ -882,54 +1037,36 @@ class DirectQueryEngine:
         segmento = params.get('segmento', 'todos')
         limit = params.get('limit', 10)
 
-        # Filtrar por segmento se especificado
+        # Vendas por produto a partir dos cubos (codigo) ou (nomesegmento, codigo)
         if segmento.lower() != 'todos':
             # Buscar segmento (case insensitive)
-            segmento_filter = df['nomesegmento'].str.lower().str.contains(segmento.lower(), na=False)
-            if not segmento_filter.any():
+            segmento_lower = segmento.lower()
+            produtos_vendas = self._aggregate(df, ['codigo'], ['vendas_total'], filters={
+                'nomesegmento': lambda s: s.astype(str).str.lower().str.contains(segmento_lower, regex=False)
+            })
+            if produtos_vendas.empty:
                 return {"error": f"Segmento '{segmento}' não encontrado", "type": "error"}
 
-            df_filtered = df[segmento_filter]
-            segmento_real = df_filtered['nomesegmento'].iloc[0]  # Nome real do segmento
+            segmento_real = produtos_vendas['nomesegmento'].iloc[0]  # Nome real do segmento
         else:
-            df_filtered = df
+            produtos_vendas = self._aggregate(df, ['codigo'], ['vendas_total'])
             segmento_real = "Todos os Segmentos"
 
-        # Agrupar por produto e somar vendas (OTIMIZADO para evitar erro de memória)
-        produtos_vendas = df_filtered.groupby('codigo').agg(
-            vendas_total=('vendas_total', 'sum'),
-            nome_produto=('nome_produto', 'first'),
-            nomesegmento=('nomesegmento', 'first'),
-            preco_38_percent=('preco_38_percent', 'first')
-        ).reset_index()
-
         # Pegar top N produtos
         top_produtos = produtos_vendas.nlargest(limit, 'vendas_total')
 
         if top_produtos.empty:
             return {"error": f"Nenhum produto encontrado no segmento '{segmento}'", "type": "error"}
 
-        # Preparar dados para o gráfico
-        x_data = [produto['nome_produto'] for _, produto in top_produtos.iterrows()]
-        y_data = [float(produto['vendas_total']) for _, produto in top_produtos.iterrows()]
+        # Dados do gráfico e resultado, montados por coluna
+        chart_data = bar_chart_data(top_produtos['nome_produto'].astype(str), top_produtos['vendas_total'])
 
-        chart_data = {
-            "x": x_data,
-            "y": y_data,
-            "type": "bar",
-            "show_values": True
-        }
-
-        # Preparar resultado
-        produtos_list = []
-        for _, produto in top_produtos.iterrows():
-            produtos_list.append({
-                "codigo": int(produto['codigo']),
-                "nome": produto['nome_produto'],
-                "vendas": float(produto['vendas_total']),
-                "segmento": produto['nomesegmento'],
-                "preco": float(produto.get('preco_38_percent', 0))
-            })
+        produtos_list = to_records(
+            top_produtos,
+            {'codigo': 'codigo', 'nome_produto': 'nome', 'vendas_total': 'vendas',
+             'nomesegmento': 'segmento', 'preco_38_percent': 'preco'},
+            types={'codigo': int, 'vendas': float, 'preco': float}
+        )
 
         return {
             "type": "chart",
@@ -953,7 +1090,7 @@ class DirectQueryEngine:
         except (ValueError, TypeError):
             return {"error": f"Código de produto inválido: {produto_codigo}", "type": "error"}
 
-        produto_data = df[df['codigo'] == produto_codigo]
+        produto_data = self._select_rows(df, codigo=produto_codigo)
         if produto_data.empty:
             return {"error": f"Produto {produto_codigo} não encontrado", "type": "error"}
 
@@ -1037,12 +1174,12 @@ class DirectQueryEngine:
             return {"error": f"Código de produto ou UNE inválido: {produto_codigo}, {une_codigo}", "type": "error"}
 
         # Verificar se produto existe
-        produto_data = df[df['codigo'] == produto_codigo]
+        produto_data = self._select_rows(df, codigo=produto_codigo)
         if produto_data.empty:
             return {"error": f"Produto {produto_codigo} não encontrado", "type": "error"}
 
         # Verificar se UNE existe
-        une_data = df[df['une'] == une_codigo]
+        une_data = self._select_rows(df, une=une_codigo)
         if une_data.empty:
             unes_disponiveis = sorted(df['une'].unique())
             return {
@@ -1051,7 +1188,7 @@ class DirectQueryEngine:
             }
 
         # Verificar se produto existe na UNE específica
-        produto_une_data = df[(df['codigo'] == produto_codigo) & (df['une'] == une_codigo)]
+        produto_une_data = self._select_rows(df, codigo=produto_codigo, une=une_codigo)
         if produto_une_data.empty:
             produto_unes = produto_data['une'].unique()
             return {
@@ -1062,14 +1199,14 @@ class DirectQueryEngine:
         produto_nome = produto_data.iloc[0]['nome_produto']
         une_nome = produto_une_data.iloc[0].get('une_nome', f'UNE {une_codigo}')
 
-        # Extrair vendas por mês
+        # Extrair vendas por mês (uma linha, 12 colunas) como vetor
         vendas_meses = [f'mes_{i:02d}' for i in range(1, 13)]
-        vendas_data = produto_une_data[vendas_meses].iloc[0]
+        vendas_data = produto_une_data[vendas_meses].iloc[0].fillna(0).to_numpy(dtype=float)
 
         # Criar dados para gráfico de barras
         chart_data = {
             "x": [f"Mês {i:02d}" for i in range(1, 13)],
-            "y": [float(vendas_data[col]) if pd.notna(vendas_data[col]) else 0 for col in vendas_meses],
+            "y": vendas_data.tolist(),
             "type": "bar"
         }
 
@@ -1100,16 +1237,16 @@ class DirectQueryEngine:
             return {"error": f"Código de produto inválido: {produto_codigo}", "type": "error"}
 
         # Verificar se produto existe
-        produto_data = df[df['codigo'] == produto_codigo]
+        produto_data = self._select_rows(df, codigo=produto_codigo)
         if produto_data.empty:
             return {"error": f"Produto {produto_codigo} não encontrado", "type": "error"}
 
         produto_nome = produto_data.iloc[0]['nome_produto']
 
-        # Agrupar por UNE e somar vendas
+        # Vendas do produto por UNE a partir do cubo (une, codigo)
         vendas_meses = [f'mes_{i:02d}' for i in range(1, 13)]
-        vendas_por_une = produto_data.groupby(['une', 'une_nome'])[vendas_meses].sum()
-        vendas_por_une['vendas_total'] = vendas_por_une.sum(axis=1)
+        vendas_por_une = self._aggregate(df, ['une'], vendas_meses + ['vendas_total'], filters={'codigo': produto_codigo})
+        vendas_por_une = vendas_por_une.set_index(['une', 'une_nome'])[vendas_meses + ['vendas_total']]
 
         # Ordenar por vendas totais (decrescente)
         vendas_por_une = vendas_por_une.sort_values('vendas_total', ascending=False)
@@ -1123,37 +1260,13 @@ class DirectQueryEngine:
             vendas_por_une_top = vendas_por_une
             titulo_extra = ""
 
-        # Criar labels melhorados
-        x_labels = []
-        y_values = []
-        for (une_codigo, une_nome), row in vendas_por_une_top.iterrows():
-            label = f"{une_nome}\\n(UNE {une_codigo})"
-            x_labels.append(label)
-            y_values.append(float(row['vendas_total']))
-
-        # Cores baseadas na performance (verde para altas vendas, amarelo para médias, vermelho para baixas)
-        max_vendas = max(y_values) if y_values else 1
-        colors = []
-        for valor in y_values:
-            if valor >= max_vendas * 0.7:
-                colors.append('#2E8B57')  # Verde escuro para top performers
-            elif valor >= max_vendas * 0.3:
-                colors.append('#FFD700')  # Dourado para performance média
-            else:
-                colors.append('#CD5C5C')  # Vermelho suave para baixa performance
-
-        total_vendas = sum(y_values)
+        # Labels "<une_nome>\\n(UNE <codigo>)" e cores por faixa de desempenho, por coluna
+        une_codigos = vendas_por_une_top.index.get_level_values('une').astype(str)
+        une_nomes = vendas_por_une_top.index.get_level_values('une_nome').astype(str)
+        x_labels = (une_nomes + "\\n(UNE " + une_codigos + ")").tolist()
+        chart_data = bar_chart_data(x_labels, vendas_por_une_top['vendas_total'], colors=True, bar_height=40)
 
-        # Criar dados otimizados para gráfico
-        chart_data = {
-            "x": x_labels,
-            "y": y_values,
-            "type": "bar",
-            "colors": colors,
-            "show_values": True,  # Mostrar valores nas barras
-            "height": max(400, min(800, len(x_labels) * 40)),  # Altura responsiva
-            "margin": {"l": 80, "r": 80, "t": 100, "b": 120}  # Margens maiores para labels
-        }
+        total_vendas = sum(chart_data["y"])
 
         return {
             "type": "chart",
@@ -1182,21 +1295,40 @@ class DirectQueryEngine:
             "title": "Necessário Processamento Avançado"
         }
 
-    def process_query(self, user_query: str) -> Dict[str, Any]:
-        """Processa query completa: classifica + executa SEM usar LLM."""
+    def close(self) -> None:
+        """Libera os recursos de execução (pool de workers e conexão do backend)."""
+        if self.parallel is not None:
+            self.parallel.close()
+        self.backend.close()
+
+    def supports(self, query_type: str) -> bool:
+        """True se o tipo de consulta tem execução direta (método _query_<tipo>)."""
+        return hasattr(self, f"_query_{query_type}")
+
+    def process_query(self, user_query: str, plan: Optional[QueryPlan] = None) -> Dict[str, Any]:
+        """Processa query completa: classifica + executa SEM usar LLM.
+
+        Com um plano (já classificado pelo HybridQueryEngine), a pergunta não é classificada de novo.
+        """
         start_time = datetime.now()
 
-        # Classificar intenção SEM LLM
-        query_type, params = self.classify_intent_direct(user_query)
+        with query_profiler.trace(plan.query_type if plan is not None else None) as trace:
+            # Classificar intenção SEM LLM
+            if plan is not None:
+                query_type, params = plan.query_type, plan.params_dict()
+            else:
+                query_type, params = self.classify_intent_direct(user_query)
 
-        # Executar consulta direta
-        result = self.execute_direct_query(query_type, params)
+            # Executar consulta direta
+            result = self.execute_direct_query(query_type, params)
 
         # Adicionar metadados
         result['query_original'] = user_query
         result['query_type'] = query_type
         result['processing_time'] = (datetime.now() - start_time).total_seconds()
         result['method'] = 'direct_query'  # Indica que NÃO usou LLM
+        if trace is not None:
+            result['timings'] = trace.timings()
 
         logger.info(f"Query processada em {result['processing_time']:.2f}s - ZERO tokens LLM")
 
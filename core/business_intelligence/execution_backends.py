@@ -0,0 +1,216 @@
+"""
+Backends de Execução - Onde rodam as agregações das consultas diretas
+O backend pandas é a referência: o engine agrega o DataFrame em memória (ou os
+cubos), numa thread. O backend DuckDB responde os rankings e agrupamentos em SQL
+direto sobre os arquivos parquet, com todos os núcleos, sem carregar o dataset; com
+o dataset já em memória o engine volta ao caminho em pandas, que não relê os arquivos.
+Os dois devolvem as mesmas colunas e a mesma ordem de grupos que aggregate_frame.
+"""
+
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from core.connectivity.derived_measures import DERIVED_COLUMNS, LAST_3_MONTHS, LAST_6_MONTHS, MONTH_COLUMNS
+from .rollup_cubes import KEY_ATTRIBUTES, ROLLUP_MEASURES, FilterValue, aggregate_frame
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    duckdb = None
+    DUCKDB_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Backend usado pelos engines que não escolhem um explicitamente
+DEFAULT_BACKEND = os.getenv("DIRECT_QUERY_BACKEND", "pandas")
+
+# Rankings e agrupamentos que um backend sobre o parquet responde (via DirectQueryEngine._aggregate)
+BACKEND_QUERIES = frozenset({
+    "produto_mais_vendido",
+    "filial_mais_vendeu",
+    "segmento_campao",
+    "ranking_vendas_unes",
+    "produto_mais_vendido_cada_une",
+    "top_produtos_por_segmento",
+})
+
+
+class ExecutionBackend(ABC):
+    """Interface dos backends: agregações equivalentes a aggregate_frame sobre o dataset inteiro."""
+
+    name = "base"
+
+    # Tipos de consulta que o backend responde sem o dataset em memória
+    queries = frozenset()
+
+    def __init__(self, parquet_adapter):
+        self.parquet_adapter = parquet_adapter
+
+    def supports(self, query_type: str) -> bool:
+        return query_type in self.queries
+
+    @abstractmethod
+    def aggregate(self, group_by: Sequence[str], measures: Optional[Sequence[str]] = None,
+                  filters: Optional[Dict[str, FilterValue]] = None) -> pd.DataFrame:
+        """Agrega o dataset inteiro por group_by (mesmas colunas e ordem que aggregate_frame)."""
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class PandasBackend(ExecutionBackend):
+    """
+    Referência: aggregate_frame sobre o DataFrame do adapter. Não assume nenhuma
+    consulta; o engine segue o caminho em memória de sempre (cubos, índice, lotes).
+    """
+
+    name = "pandas"
+
+    def aggregate(self, group_by: Sequence[str], measures: Optional[Sequence[str]] = None,
+                  filters: Optional[Dict[str, FilterValue]] = None) -> pd.DataFrame:
+        self.parquet_adapter._load_dataframe()
+        return aggregate_frame(self.parquet_adapter._dataframe, group_by, measures, filters)
+
+
+def _quote(column: str) -> str:
+    return '"' + column.replace('"', '""') + '"'
+
+
+class DuckDBBackend(ExecutionBackend):
+    """
+    Agregações em SQL sobre os arquivos do dataset (read_parquet), multi-thread.
+
+    As medidas derivadas são calculadas dos meses na própria consulta. Para sair
+    igual ao pandas, os atributos de cada grupo são o primeiro valor não nulo na
+    ordem das linhas (arquivo, linha no arquivo) e os grupos saem na ordem de
+    primeira aparição. Filtros de igualdade viram parâmetros; filtros por função
+    são avaliados sobre os valores distintos da coluna e viram uma lista.
+
+    Args:
+        parquet_adapter: Adapter do dataset (arquivo ou diretório particionado)
+        threads: Threads do DuckDB (None = todos os núcleos)
+    """
+
+    name = "duckdb"
+    queries = BACKEND_QUERIES
+
+    def __init__(self, parquet_adapter, threads: Optional[int] = None):
+        if not DUCKDB_AVAILABLE:
+            raise ImportError("Backend 'duckdb' requer o pacote duckdb (pip install duckdb)")
+        super().__init__(parquet_adapter)
+        config = {"threads": int(threads)} if threads else {}
+        self._connection = duckdb.connect(database=":memory:", config=config)
+        self._lock = threading.Lock()
+
+    @property
+    def threads(self) -> int:
+        return int(self._execute("SELECT current_setting('threads')").iloc[0, 0])
+
+    def _execute(self, sql: str, parameters: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+        # Um cursor por consulta: a conexão é compartilhada entre as threads do app
+        with self._lock:
+            cursor = self._connection.cursor()
+        try:
+            return cursor.execute(sql, parameters or {}).df()
+        finally:
+            cursor.close()
+
+    def _source(self) -> str:
+        partitioning = "true" if self.parquet_adapter.is_partitioned else "false"
+        return f"read_parquet($files, hive_partitioning={partitioning}, filename=true, file_row_number=true)"
+
+    def _column_expressions(self, names: Sequence[str]) -> Dict[str, str]:
+        """Expressão SQL de cada coluna disponível: as do arquivo e as medidas derivadas."""
+        expressions = {name: _quote(name) for name in names}
+
+        def month_sum(months):
+            present = [_quote(m) for m in months if m in names]
+            return "(" + " + ".join(f"COALESCE({m}, 0)::DOUBLE" for m in present) + ")" if present else None
+
+        derived = {
+            "vendas_total": month_sum(MONTH_COLUMNS),
+            "vendas_ultimos_3_meses": month_sum(LAST_3_MONTHS),
+            "vendas_ultimos_6_meses": month_sum(LAST_6_MONTHS),
+        }
+        if derived["vendas_total"]:
+            months = sum(m in names for m in MONTH_COLUMNS)
+            derived["vendas_media_mensal"] = f"({derived['vendas_total']} / {months})"
+            if "preco_38_percent" in names:
+                derived["receita_total"] = (f"({derived['vendas_total']} * "
+                                            f"COALESCE({_quote('preco_38_percent')}, 0)::DOUBLE)")
+        for name in DERIVED_COLUMNS:
+            if name not in expressions and derived.get(name):
+                expressions[name] = derived[name]
+        return expressions
+
+    def _distinct_matching(self, column: str, predicate, files: List[str]) -> list:
+        """Valores distintos da coluna que satisfazem o filtro por função."""
+        values = self._execute(f"SELECT DISTINCT {_quote(column)} AS v FROM {self._source()} "
+                               f"WHERE {_quote(column)} IS NOT NULL", {"files": files})["v"]
+        mask = pd.Series(predicate(values)).to_numpy(dtype=bool)
+        return values[mask].tolist()
+
+    def aggregate(self, group_by: Sequence[str], measures: Optional[Sequence[str]] = None,
+                  filters: Optional[Dict[str, FilterValue]] = None) -> pd.DataFrame:
+        """Equivalente a aggregate_frame sobre o dataset inteiro, em SQL sobre o parquet."""
+        start = time.perf_counter()
+        dataset = self.parquet_adapter._get_dataset()
+        files = list(dataset.files)
+        expressions = self._column_expressions(dataset.schema.names)
+        group_by = list(group_by)
+        measures = [m for m in (measures or ROLLUP_MEASURES) if m in expressions]
+
+        attributes = []
+        for key in group_by:
+            for attribute in KEY_ATTRIBUTES.get(key, []):
+                if attribute in expressions and attribute not in group_by + measures + attributes:
+                    attributes.append(attribute)
+
+        # Posição da linha no dataset: arquivo (na ordem do dataset) e linha dentro dele
+        row_order = "((list_position($files, filename)::BIGINT << 40) + file_row_number)"
+        select = [f"{expressions[col]} AS {_quote(col)}" for col in group_by]
+        select += [f"SUM({expressions[m]}) AS {_quote(m)}" for m in measures]
+        select += [f"ARG_MIN({expressions[a]}, {row_order}) FILTER (WHERE {expressions[a]} IS NOT NULL) "
+                   f"AS {_quote(a)}" for a in attributes]
+
+        conditions, parameters = [], {"files": files}
+        for i, (col, value) in enumerate((filters or {}).items()):
+            if callable(value):
+                value = self._distinct_matching(col, value, files)
+                conditions.append(f"list_contains($f{i}, {expressions[col]})" if value else "FALSE")
+            else:
+                conditions.append(f"{expressions[col]} = $f{i}")
+            if value != []:
+                parameters[f"f{i}"] = value
+
+        sql = (f"SELECT {', '.join(select)} FROM {self._source()}"
+               + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+               + f" GROUP BY {', '.join(str(i + 1) for i in range(len(group_by)))}"
+               + f" ORDER BY MIN({row_order})")
+        result = self._execute(sql, parameters)
+        logger.info(f"DuckDB: agregação por {group_by} em {time.perf_counter() - start:.3f}s ({len(result)} grupos)")
+        return result
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+BACKENDS = {
+    "pandas": PandasBackend,
+    "duckdb": DuckDBBackend,
+}
+
+
+def create_backend(name: str, parquet_adapter, **options: Any) -> ExecutionBackend:
+    """Instancia o backend pelo nome. ImportError se a biblioteca dele não estiver instalada."""
+    if name not in BACKENDS:
+        raise ValueError(f"Backend desconhecido: {name!r} (disponíveis: {', '.join(BACKENDS)})")
+    return BACKENDS[name](parquet_adapter, **options)
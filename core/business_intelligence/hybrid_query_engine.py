@@ -8,8 +8,10 @@ from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
 import re
 
-from .direct_query_engine import DirectQueryEngine
 from .smart_cache import SmartCache
+from .dataset_registry import dataset_registry
+from .query_plan import QueryPlan, ROUTE_DIRECT, ROUTE_LLM, normalize_query
+from core.utils.query_profiler import query_profiler
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +23,8 @@ class HybridQueryEngine:
     3. LLM apenas se absolutamente necessário
     """
 
-    def __init__(self, parquet_adapter, llm_adapter=None, enable_llm_fallback=False):
+    def __init__(self, parquet_adapter, llm_adapter=None, enable_llm_fallback=False,
+                 cache_dir: str = "cache"):
         """
         Inicializa motor híbrido.
 
@@ -29,14 +32,20 @@ class HybridQueryEngine:
             parquet_adapter: Adapter para dados
             llm_adapter: Adapter LLM (opcional)
             enable_llm_fallback: Se True, permite usar LLM em último caso
+            cache_dir: Diretório do SmartCache
         """
-        self.parquet_adapter = parquet_adapter
         self.llm_adapter = llm_adapter
         self.enable_llm_fallback = enable_llm_fallback
 
+        # Entrada compartilhada: mesmo arquivo => mesmo adapter e engine aquecidos.
+        # Se o arquivo já está registrado, o adapter recebido é descartado: versão,
+        # recarga e etiquetas do cache acompanham o adapter que responde as consultas.
+        self._registry_entry = dataset_registry.acquire(parquet_adapter.file_path, parquet_adapter)
+        self.parquet_adapter = self._registry_entry.adapter
+        self.direct_engine = self._registry_entry.engine
+
         # Componentes principais
-        self.cache = SmartCache(cache_dir="cache", max_size_mb=100)
-        self.direct_engine = DirectQueryEngine(parquet_adapter)
+        self.cache = SmartCache(cache_dir=cache_dir, max_size_mb=100)
 
         # Estatísticas de economia
         self.stats = {
@@ -66,16 +75,27 @@ class HybridQueryEngine:
             force_direct: Se True, força uso apenas de consultas diretas
 
         Returns:
-            Resultado da consulta com informações de economia
+            Resultado da consulta com informações de economia (e, com o profiler
+            ligado, os tempos por etapa em "timings")
         """
+        with query_profiler.trace() as trace:
+            result = self._process_query(user_query, force_direct)
+        if trace is not None:
+            result["timings"] = trace.timings()
+        return result
+
+    def _process_query(self, user_query: str, force_direct: bool) -> Dict[str, Any]:
         start_time = datetime.now()
         self.stats["total_queries"] += 1
 
-        query_lower = user_query.lower()
         logger.info(f"Processando query híbrida: '{user_query[:50]}...'")
 
-        # 1. PRIMEIRO: Verificar cache
-        result = self._try_cache(user_query)
+        # Classificação, chave de cache e rota calculadas uma única vez
+        plan = self.plan_query(user_query, force_direct=force_direct)
+
+        # 1. PRIMEIRO: Verificar cache (o trace da pergunta passa a ser do tipo classificado)
+        with query_profiler.trace(plan.query_type), query_profiler.span("cache_get"):
+            result = self._try_cache(plan)
         if result:
             result["processing_time"] = (datetime.now() - start_time).total_seconds()
             result["source"] = "cache"
@@ -85,50 +105,86 @@ class HybridQueryEngine:
             return result
 
         # 2. SEGUNDO: Tentar consulta direta
-        result = self._try_direct_query(user_query)
-        if result and result.get("type") != "not_implemented":
-            # Salvar no cache para próximas consultas
-            query_type, params = self.direct_engine.classify_intent_direct(user_query)
-            estimated_tokens = self._estimate_tokens_for_query(user_query)
-            self.cache.set(query_type, params, result, tokens_would_use=estimated_tokens)
-
-            result["processing_time"] = (datetime.now() - start_time).total_seconds()
-            result["source"] = "direct"
-            result["tokens_used"] = 0
-            result["tokens_saved"] = estimated_tokens
-            self.stats["direct_queries"] += 1
-            self.stats["total_tokens_saved"] += estimated_tokens
-            logger.info(f"✅ Consulta DIRETA - {estimated_tokens} tokens economizados")
-            return result
+        if plan.route == ROUTE_DIRECT:
+            result = self._try_direct_query(plan)
+            if result and result.get("type") != "not_implemented":
+                # Salvar no cache para próximas consultas
+                estimated_tokens = self._estimate_tokens_for_query(user_query)
+                self.cache.set(plan.query_type, plan.params_dict(), result,
+                               tokens_would_use=estimated_tokens, cache_key=plan.cache_key)
+
+                result["processing_time"] = (datetime.now() - start_time).total_seconds()
+                result["source"] = "direct"
+                result["tokens_used"] = 0
+                result["tokens_saved"] = estimated_tokens
+                self.stats["direct_queries"] += 1
+                self.stats["total_tokens_saved"] += estimated_tokens
+                logger.info(f"✅ Consulta DIRETA - {estimated_tokens} tokens economizados")
+                return result
 
         # 3. TERCEIRO: Fallback para LLM (apenas se habilitado e necessário)
-        if not force_direct and self.enable_llm_fallback and self.llm_adapter:
-            if self._should_use_llm_fallback(user_query):
-                result = self._try_llm_query(user_query)
-                if result:
-                    result["processing_time"] = (datetime.now() - start_time).total_seconds()
-                    result["source"] = "llm"
-                    self.stats["llm_queries"] += 1
-                    logger.info(f"⚠️ Usado LLM fallback - {result.get('tokens_used', 0)} tokens")
-                    return result
+        if plan.route == ROUTE_LLM or self._llm_allowed(plan.normalized_text, force_direct):
+            result = self._try_llm_query(plan)
+            if result:
+                result["processing_time"] = (datetime.now() - start_time).total_seconds()
+                result["source"] = "llm"
+                self.stats["llm_queries"] += 1
+                logger.info(f"⚠️ Usado LLM fallback - {result.get('tokens_used', 0)} tokens")
+                return result
 
         # 4. ÚLTIMO RECURSO: Resposta de fallback
         logger.warning(f"Nenhuma estratégia funcionou para: '{user_query}'")
         return self._create_fallback_response(user_query, start_time)
 
-    def _try_cache(self, user_query: str) -> Optional[Dict[str, Any]]:
-        """Tenta obter resultado do cache."""
+    def plan_query(self, user_query: str, force_direct: bool = False) -> QueryPlan:
+        """
+        Classifica a pergunta uma vez e monta o plano usado por todas as etapas.
+
+        A versão do dataset é atualizada antes (verificação barata e não bloqueante),
+        para a chave de cache corresponder aos dados que vão responder.
+        """
         try:
-            query_type, params = self.direct_engine.classify_intent_direct(user_query)
-            return self.cache.get(query_type, params)
+            self.parquet_adapter.check_for_update()
+            self.cache.set_data_version(self.parquet_adapter.data_version,
+                                        self.parquet_adapter.changed_columns(self.cache.data_version))
+        except Exception as e:
+            logger.debug(f"Verificação de versão do dataset falhou: {e}")
+
+        normalized = normalize_query(user_query)
+        query_type, params = self.direct_engine.classify_intent_direct(user_query)
+
+        # Sem consulta direta para o tipo, perguntas que justificam LLM vão direto para ele
+        route = ROUTE_DIRECT
+        if not self.direct_engine.supports(query_type) and self._llm_allowed(normalized, force_direct):
+            route = ROUTE_LLM
+
+        return QueryPlan(
+            text=user_query,
+            normalized_text=normalized,
+            query_type=query_type,
+            params=params,
+            cache_key=self.cache.make_key(query_type, params),
+            route=route,
+        )
+
+    def _llm_allowed(self, normalized_text: str, force_direct: bool) -> bool:
+        """LLM habilitado, com adapter, e a pergunta justifica o fallback."""
+        if force_direct or not self.enable_llm_fallback or not self.llm_adapter:
+            return False
+        return self._should_use_llm_fallback(normalized_text)
+
+    def _try_cache(self, plan: QueryPlan) -> Optional[Dict[str, Any]]:
+        """Tenta obter resultado do cache (uma cópia: preenchê-la não altera a entrada)."""
+        try:
+            return self.cache.get(plan.query_type, plan.params_dict(), cache_key=plan.cache_key)
         except Exception as e:
             logger.debug(f"Cache lookup falhou: {e}")
             return None
 
-    def _try_direct_query(self, user_query: str) -> Optional[Dict[str, Any]]:
+    def _try_direct_query(self, plan: QueryPlan) -> Optional[Dict[str, Any]]:
         """Tenta executar consulta direta."""
         try:
-            return self.direct_engine.process_query(user_query)
+            return self.direct_engine.process_query(plan.text, plan=plan)
         except Exception as e:
             logger.warning(f"Consulta direta falhou: {e}")
             return None
@@ -174,14 +230,14 @@ class HybridQueryEngine:
 
         return False
 
-    def _try_llm_query(self, user_query: str) -> Optional[Dict[str, Any]]:
+    def _try_llm_query(self, plan: QueryPlan) -> Optional[Dict[str, Any]]:
         """Executa consulta usando LLM (último recurso)."""
         if not self.llm_adapter:
             return None
 
         try:
             # Usar prompt otimizado para economia
-            optimized_prompt = self._create_optimized_prompt(user_query)
+            optimized_prompt = self._create_optimized_prompt(plan.text)
 
             # Executar com limite de tokens
             response = self.llm_adapter.get_completion(
@@ -282,6 +338,13 @@ Responda de forma concisa e direta em português. Máximo 100 palavras."""
         self.llm_fallback_config["daily_token_limit"] = limit
         logger.info(f"Limite diário de tokens definido para: {limit}")
 
+    def close(self) -> None:
+        """Grava o cache pendente e devolve a referência da entrada do registro."""
+        self.cache.close()
+        if self._registry_entry is not None:
+            dataset_registry.release(self._registry_entry)
+            self._registry_entry = None
+
     def warm_up_cache(self):
         """Aquece cache com consultas populares."""
         popular_queries = [
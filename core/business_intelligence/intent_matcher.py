@@ -0,0 +1,184 @@
+"""
+Classificador de Intenção Compilado - Regras de dados, uma passada por consulta
+As regras de classificação do DirectQueryEngine (padrões com parâmetros e
+palavras-chave) vêm da seção "intent_rules" dos templates. Palavras-chave e
+gatilhos dos padrões são compilados numa única alternação de literais, varrida
+uma vez sobre a consulta; só os padrões cujos gatilhos apareceram são testados,
+em ordem de prioridade, e os grupos nomeados do padrão que casar já entregam os
+parâmetros.
+"""
+
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Conversões aplicadas a um parâmetro extraído
+TRANSFORMS: Dict[str, Callable[[str], Any]] = {
+    "upper": str.upper,
+    "lower": str.lower,
+    "int": int,
+}
+
+DEFAULT_INTENT = ("analise_geral", {"tipo": "geral"})
+
+# Num padrão, "segmento__a" e "segmento__b" são alternativas do mesmo parâmetro
+_GROUP_SEPARATOR = "__"
+
+
+class IntentRule:
+    """
+    Uma regra: padrão (regex com grupos nomeados) ou palavra-chave -> tipo de consulta.
+
+    triggers: literais dos quais ao menos um aparece sempre que o padrão casa.
+    Um padrão sem gatilhos é testado em toda consulta; uma palavra-chave é o
+    próprio gatilho.
+    """
+
+    def __init__(self, query_type: str, pattern: Optional[str] = None, keyword: Optional[str] = None,
+                 params: Optional[Dict[str, Any]] = None, transforms: Optional[Dict[str, str]] = None,
+                 when_absent: Optional[Dict[str, Any]] = None, triggers: Optional[List[str]] = None):
+        if (pattern is None) == (keyword is None):
+            raise ValueError(f"Regra de '{query_type}' precisa de 'pattern' ou 'keyword' (apenas um)")
+        self.query_type = query_type
+        self.keyword = keyword
+        self.regex = re.compile(pattern) if pattern is not None else None
+        self.triggers = [keyword] if keyword is not None else list(triggers or [])
+        self.params = dict(params or {})
+        self.transforms = {name: TRANSFORMS[kind] for name, kind in (transforms or {}).items()}
+        # {"text": ..., "params": {...}}: parâmetros usados quando o texto não aparece na consulta
+        self.when_absent = when_absent
+        if keyword is not None:
+            self.params.setdefault("matched_keywords", keyword)
+
+    def match(self, text: str) -> Optional[Dict[str, Optional[str]]]:
+        """Grupos capturados (parâmetro -> valor) se a regra casa com o texto, senão None."""
+        if self.regex is None:
+            return {} if self.keyword in text else None
+        found = self.regex.search(text)
+        if found is None:
+            return None
+        groups: Dict[str, Optional[str]] = {}
+        for name, value in found.groupdict().items():
+            param = name.split(_GROUP_SEPARATOR)[0]
+            if groups.get(param) is None:
+                groups[param] = value
+        return groups
+
+    def build_params(self, groups: Dict[str, Optional[str]], text: str) -> Dict[str, Any]:
+        """Parâmetros da regra a partir dos grupos capturados."""
+        if self.when_absent and self.when_absent["text"] not in text:
+            return dict(self.when_absent["params"])
+        params = dict(self.params)
+        for name, value in groups.items():
+            if value is None:
+                continue
+            params[name] = self.transforms[name](value) if name in self.transforms else value
+        return params
+
+    def __repr__(self) -> str:
+        source = f"keyword={self.keyword!r}" if self.regex is None else f"pattern={self.regex.pattern!r}"
+        return f"IntentRule({self.query_type!r}, {source})"
+
+
+def load_intent_rules(templates: Dict[str, Any]) -> List[IntentRule]:
+    """
+    Regras da seção "intent_rules", em ordem de prioridade. Uma regra com lista
+    "keywords" vira uma regra por palavra-chave, na ordem da lista.
+    """
+    rules = []
+    for spec in templates.get("intent_rules", {}).get("rules", []):
+        common = {
+            "params": spec.get("params"),
+            "transforms": spec.get("transforms"),
+            "when_absent": spec.get("when_absent"),
+        }
+        if "keywords" in spec:
+            rules.extend(IntentRule(spec["query_type"], keyword=kw, **common) for kw in spec["keywords"])
+        else:
+            rules.append(IntentRule(spec["query_type"], pattern=spec["pattern"],
+                                    triggers=spec.get("triggers"), **common))
+    return rules
+
+
+class IntentMatcher:
+    """
+    Classificação em uma varredura: todos os gatilhos numa alternação de literais.
+
+    Os literais são ordenados do maior para o menor, então em cada posição a
+    alternação acha o maior gatilho que começa ali; os gatilhos que são prefixo
+    dele também estão presentes e entram pelo fecho de prefixos pré-calculado.
+    Cada ocorrência marca as regras do gatilho como candidatas; palavras-chave
+    candidatas já estão confirmadas e os padrões candidatos são verificados na
+    ordem de prioridade. O resultado é o mesmo de testar as regras uma a uma.
+    """
+
+    def __init__(self, rules: List[IntentRule],
+                 default: Tuple[str, Dict[str, Any]] = DEFAULT_INTENT):
+        self.rules = list(rules)
+        self.default = default
+
+        rules_by_literal: Dict[str, set] = {}
+        for i, rule in enumerate(self.rules):
+            for literal in rule.triggers:
+                rules_by_literal.setdefault(literal, set()).add(i)
+        literals = sorted(rules_by_literal, key=len, reverse=True)
+
+        # Regras testadas em toda consulta (padrões sem gatilho)
+        self._always = frozenset(i for i, rule in enumerate(self.rules) if not rule.triggers)
+        # Literal encontrado -> regras dele e dos literais que são prefixo dele
+        self._literal_rules = {
+            literal: frozenset().union(*(rules_by_literal[p] for p in literals if literal.startswith(p)))
+            for literal in literals
+        }
+        self._literal_regex = re.compile("|".join(map(re.escape, literals))) if literals else None
+
+    @classmethod
+    def from_templates(cls, templates: Dict[str, Any],
+                       fallback_keywords: Optional[Dict[str, str]] = None) -> "IntentMatcher":
+        """
+        Matcher montado a partir das "intent_rules" dos templates. Templates sem essa
+        seção (fallback hardcoded) ficam só com regras de palavra-chave.
+        """
+        rules = load_intent_rules(templates)
+        if not rules and fallback_keywords:
+            logger.warning("Templates sem 'intent_rules' - classificando apenas por palavras-chave")
+            rules = [IntentRule(query_type, keyword=kw) for kw, query_type in fallback_keywords.items()]
+        default = templates.get("intent_rules", {}).get("default")
+        if default:
+            return cls(rules, (default["query_type"], dict(default.get("params", {}))))
+        return cls(rules)
+
+    def _candidates(self, text: str) -> List[int]:
+        """Índices das regras cujos gatilhos aparecem no texto, em ordem de prioridade."""
+        candidates = set(self._always)
+        if self._literal_regex is not None:
+            search = self._literal_regex.search
+            found = search(text)
+            while found is not None:
+                candidates |= self._literal_rules[found.group()]
+                found = search(text, found.start() + 1)
+        return sorted(candidates)
+
+    def classify(self, text: str) -> Tuple[str, Dict[str, Any]]:
+        """Tipo de consulta e parâmetros do texto (já em minúsculas)."""
+        for i in self._candidates(text):
+            rule = self.rules[i]
+            # Palavra-chave candidata: o gatilho é a própria palavra, já encontrada
+            groups = {} if rule.regex is None else rule.match(text)
+            if groups is not None:
+                return rule.query_type, rule.build_params(groups, text)
+        return self.default[0], dict(self.default[1])
+
+    def classify_sequential(self, text: str) -> Tuple[str, Dict[str, Any]]:
+        """Implementação de referência: todas as regras em ordem de prioridade, sem os gatilhos."""
+        for rule in self.rules:
+            groups = rule.match(text)
+            if groups is not None:
+                return rule.query_type, rule.build_params(groups, text)
+        return self.default[0], dict(self.default[1])
+
+    def keywords_map(self) -> Dict[str, str]:
+        """Palavra-chave -> tipo de consulta, na ordem de prioridade."""
+        return {rule.keyword: rule.query_type for rule in self.rules if rule.keyword is not None}
@@ -0,0 +1,214 @@
+"""
+Agregação Paralela por Fatias - groupbys do dataset completo em vários núcleos
+O dataset em memória é o snapshot Arrow IPC mapeado (memory-map) do adapter: as
+páginas do arquivo ficam no page cache e são compartilhadas por todos os processos.
+Cada worker de um pool persistente mapeia o snapshot uma vez por versão, agrega a
+sua fatia de linhas com aggregate_frame e devolve o agregado parcial; o processo
+principal junta os parciais na ordem das fatias com o mesmo aggregate_frame (somas
+das somas, primeiro valor dos atributos), o que dá o mesmo resultado da passada única.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from .dataset_index import DatasetIndex
+from .rollup_cubes import KEY_ATTRIBUTES, ROLLUP_MEASURES, FilterValue, aggregate_frame
+
+logger = logging.getLogger(__name__)
+
+# Workers dos engines que não escolhem um número explicitamente (1 = sem pool)
+DEFAULT_WORKERS = int(os.getenv("DIRECT_QUERY_WORKERS", "1"))
+
+# Abaixo disso o custo de despachar as fatias supera o ganho
+MIN_PARALLEL_ROWS = 200_000
+
+# Snapshots mapeados no worker: caminho -> (fingerprint, tabela)
+_worker_snapshots: Dict[str, Tuple[str, pa.Table]] = {}
+
+
+class ValueIn:
+    """Filtro por função serializável: a coluna pertence ao conjunto de valores."""
+
+    def __init__(self, values: Sequence[Any]):
+        self.values = list(values)
+
+    def __call__(self, series: pd.Series) -> pd.Series:
+        return series.isin(self.values)
+
+
+def _value_filter(series: pd.Series, predicate) -> ValueIn:
+    """Valores distintos da coluna que satisfazem o filtro por função."""
+    values = series.drop_duplicates()
+    return ValueIn(values[np.asarray(predicate(values), dtype=bool)])
+
+
+def _open_snapshot(path: str, fingerprint: str) -> pa.Table:
+    """Tabela do snapshot mapeada no worker (uma vez por versão, sem cópia)."""
+    cached = _worker_snapshots.get(path)
+    if cached is None or cached[0] != fingerprint:
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        if (table.schema.metadata or {}).get(b"source_fingerprint") != fingerprint.encode("utf-8"):
+            raise RuntimeError(f"Snapshot {path} não corresponde à versão {fingerprint}")
+        _worker_snapshots[path] = cached = (fingerprint, table)
+    return cached[1]
+
+
+def _aggregate_shard(path: str, fingerprint: str, start: int, stop: int, columns: List[str],
+                     group_by: List[str], measures: List[str],
+                     filters: Optional[Dict[str, FilterValue]]) -> pd.DataFrame:
+    """Executado no worker: aggregate_frame das linhas [start, stop) do snapshot."""
+    table = _open_snapshot(path, fingerprint)
+    frame = table.select(columns).slice(start, stop - start).to_pandas(split_blocks=True)
+    return aggregate_frame(frame, group_by, measures, filters)
+
+
+def _warm_up(path: str, fingerprint: str) -> int:
+    return os.getpid() if _open_snapshot(path, fingerprint) is not None else 0
+
+
+class ParallelAggregator:
+    """
+    aggregate_frame do dataset completo dividido em fatias contíguas de linhas,
+    uma por worker, num ProcessPoolExecutor criado na primeira agregação e mantido
+    até close(). Mesma assinatura de aggregate_frame, para substituí-lo onde o df é
+    o dataset completo (ou uma projeção dele): sem snapshot válido, sem as colunas no
+    snapshot ou com poucas linhas, agrega df no próprio processo.
+
+    Args:
+        parquet_adapter: Adapter cujo snapshot Arrow os workers mapeiam
+        workers: Processos do pool (e fatias por agregação)
+    """
+
+    def __init__(self, parquet_adapter, workers: int):
+        self.parquet_adapter = parquet_adapter
+        self.workers = int(workers)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._snapshot_columns: Dict[str, set] = {}
+        # (versão, coluna) -> limites das fatias nas trocas de valor da coluna, ou None se
+        # ela não é contígua; calculados uma vez por versão (varrer a coluna é O(N))
+        self._key_bounds: Dict[Tuple[str, str], Optional[np.ndarray]] = {}
+        self._stats = {"parallel": 0, "fallbacks": 0, "shards": 0}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # spawn: o processo principal tem threads (recarga em segundo plano), e fork copiaria locks
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _snapshot(self) -> Optional[Tuple[str, str, set, int]]:
+        """Caminho, versão, colunas e linhas do snapshot da versão carregada, ou None se não houver."""
+        version = self.parquet_adapter.loaded_version()
+        path = self.parquet_adapter._snapshot_path()
+        if version is None or not self.parquet_adapter.use_snapshot or not os.path.exists(path):
+            return None
+        fingerprint = version.fingerprint
+        if fingerprint not in self._snapshot_columns:
+            try:
+                schema = pa.ipc.open_file(pa.memory_map(path, "r")).schema
+            except Exception as e:
+                logger.warning(f"Snapshot {path} ilegível para os workers: {e}")
+                return None
+            if (schema.metadata or {}).get(b"source_fingerprint") != fingerprint.encode("utf-8"):
+                return None
+            self._snapshot_columns = {fingerprint: set(schema.names)}
+        return path, fingerprint, self._snapshot_columns[fingerprint], len(version.dataframe)
+
+    def warm_up(self) -> int:
+        """Sobe o pool e mapeia o snapshot nos workers. Retorna quantos processos distintos atenderam."""
+        snapshot = self._snapshot()
+        if snapshot is None:
+            return 0
+        pool = self._get_pool()
+        pids = pool.map(_warm_up, [snapshot[0]] * self.workers, [snapshot[1]] * self.workers)
+        return len(set(pids))
+
+    def aggregate(self, df: pd.DataFrame, group_by: Sequence[str],
+                  measures: Optional[Sequence[str]] = None,
+                  filters: Optional[Dict[str, FilterValue]] = None,
+                  index: Optional[DatasetIndex] = None) -> pd.DataFrame:
+        """aggregate_frame(df, ...) calculado em paralelo sobre as fatias do snapshot."""
+        group_by = list(group_by)
+        measures = [m for m in (measures or ROLLUP_MEASURES) if m in df.columns]
+        attributes = [a for key in group_by for a in KEY_ATTRIBUTES.get(key, []) if a in df.columns]
+        columns = list(dict.fromkeys(group_by + measures + attributes + list(filters or {})))
+
+        snapshot = self._snapshot() if self.workers > 1 and len(df) >= MIN_PARALLEL_ROWS else None
+        if snapshot is None or not set(columns) <= snapshot[2] or len(df) != snapshot[3]:
+            self._stats["fallbacks"] += 1
+            return aggregate_frame(df, group_by, measures, filters, index)
+
+        # Filtros por função viram o conjunto de valores aceitos (serializável para os workers)
+        shard_filters = {col: _value_filter(df[col], value) if callable(value) else value
+                         for col, value in (filters or {}).items()}
+
+        start = time.perf_counter()
+        path, fingerprint, _, _ = snapshot
+        bounds, disjoint = self._shard_bounds(df, group_by, fingerprint)
+        shards = [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+        pool = self._get_pool()
+        futures = [pool.submit(_aggregate_shard, path, fingerprint, a, b, columns, group_by, measures,
+                               shard_filters) for a, b in shards]
+        partials = [future.result() for future in futures]
+
+        # Parciais na ordem das fatias: a junção preserva a ordem de primeira aparição.
+        # Com fatias cortadas nas trocas de uma chave contígua, nenhum grupo se repete.
+        result = pd.concat(partials, ignore_index=True)
+        if not disjoint:
+            result = aggregate_frame(result, group_by, measures)
+        self._stats["parallel"] += 1
+        self._stats["shards"] += len(shards)
+        logger.info(f"Agregação paralela por {group_by}: {len(shards)} fatias em "
+                    f"{time.perf_counter() - start:.3f}s ({len(result)} grupos)")
+        return result
+
+    def _shard_bounds(self, df: pd.DataFrame, group_by: List[str], fingerprint: str) -> Tuple[np.ndarray, bool]:
+        """
+        Limites das fatias (tamanhos iguais). Se uma chave do agrupamento é contígua no
+        dataset (ex.: ordenado por codigo), os limites avançam até a próxima troca de
+        valor dela e os grupos não se repetem entre fatias (retorna disjoint=True).
+        """
+        for col in group_by:
+            bounds = self._contiguous_bounds(df, col, fingerprint)
+            if bounds is not None:
+                return bounds, True
+        return np.linspace(0, len(df), self.workers + 1, dtype=np.int64), False
+
+    def _contiguous_bounds(self, df: pd.DataFrame, col: str, fingerprint: str) -> Optional[np.ndarray]:
+        """Limites cortados nas trocas de valor de col (None se não é contígua), em cache por versão."""
+        key = (fingerprint, col)
+        if key not in self._key_bounds:
+            if any(cached != fingerprint for cached, _ in self._key_bounds):
+                self._key_bounds = {}   # nova versão: os limites antigos não valem mais
+            values = df[col].cat.codes if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col]
+            values = values.to_numpy()
+            changes = np.flatnonzero(values[1:] != values[:-1]) + 1
+            bounds = None
+            if len(changes) + 1 == pd.unique(values).size:
+                even = np.linspace(0, len(df), self.workers + 1, dtype=np.int64)
+                inner = np.append(changes, len(df))[np.searchsorted(changes, even[1:-1])]
+                bounds = np.concatenate(([0], inner, [len(df)]))
+            self._key_bounds[key] = bounds
+        return self._key_bounds[key]
+
+    def close(self) -> None:
+        """Encerra os workers do pool."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Workers, agregações paralelas, fatias despachadas e agregações feitas no processo."""
+        return {"workers": self.workers, "pool_active": self._pool is not None, **self._stats}
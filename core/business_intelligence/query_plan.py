@@ -0,0 +1,39 @@
+"""
+Plano de Consulta - Trabalho de entrada feito uma única vez por pergunta
+Texto normalizado, tipo de consulta, parâmetros extraídos, chave de cache e rota
+escolhida, produzidos numa só classificação e repassados sem alteração para a
+busca no cache, a execução direta, o fallback LLM e a gravação no cache.
+"""
+
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, Mapping
+
+# Rotas de execução
+ROUTE_DIRECT = "direct"  # DirectQueryEngine (inclui o payload de fallback dele)
+ROUTE_LLM = "llm"        # Tipo sem consulta direta e pergunta que justifica LLM
+
+
+def normalize_query(user_query: str) -> str:
+    """Forma do texto usada na classificação (as regras são escritas em minúsculas)."""
+    return user_query.lower()
+
+
+@dataclass(frozen=True)
+class QueryPlan:
+    """Plano imutável de uma pergunta; params é uma visão somente leitura."""
+
+    text: str
+    normalized_text: str
+    query_type: str
+    params: Mapping[str, Any] = field(default_factory=dict)
+    cache_key: str = ""
+    route: str = ROUTE_DIRECT
+
+    def __post_init__(self):
+        if not isinstance(self.params, MappingProxyType):
+            object.__setattr__(self, "params", MappingProxyType(dict(self.params)))
+
+    def params_dict(self) -> Dict[str, Any]:
+        """Cópia mutável dos parâmetros, para APIs que recebem dict."""
+        return dict(self.params)
@@ -0,0 +1,154 @@
+"""
+Planejador de Dados por Consulta - Cada _query_* lê só o que usa
+Para cada tipo de consulta, as colunas que o método lê e o subconjunto de linhas
+que basta para respondê-lo (ex.: as linhas de um produto). O engine entrega ao
+método uma visão projetada do dataset completo, sem copiar as colunas, no lugar
+da antiga divisão entre dataset completo copiado e amostra de 500 linhas.
+"""
+
+from dataclasses import dataclass, field, replace
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.connectivity.derived_measures import MONTH_COLUMNS
+from .dataset_index import DatasetIndex, select_rows
+
+_NO_ROWS = np.empty(0, dtype=np.intp)
+
+# Colunas lidas por cada consulta (incluindo as usadas nos gráficos e nas mensagens de erro).
+# None = todas as colunas (ex.: evolução de vendas descobre as colunas de mês pelo nome).
+QUERY_COLUMNS: Dict[str, Optional[List[str]]] = {
+    "produto_mais_vendido": ["codigo", "nome_produto", "vendas_total"],
+    "filial_mais_vendeu": ["une", "une_nome", "vendas_total"],
+    "segmento_campao": ["nomesegmento", "vendas_total"],
+    "produtos_sem_vendas": ["nome_produto", "vendas_total", "estoque_atual"],
+    "estoque_parado": ["vendas_total", "estoque_atual", "preco_38_percent"],
+    "consulta_produto_especifico": ["codigo", "nome_produto", "vendas_total", "une_nome", "preco_38_percent"],
+    "preco_produto_une_especifica": ["codigo", "une", "une_nome", "nome_produto", "preco_38_percent",
+                                     "estoque_atual"] + MONTH_COLUMNS,
+    "top_produtos_une_especifica": ["une_nome", "codigo", "nome_produto", "preco_38_percent",
+                                    "nomesegmento", "vendas_total"],
+    "vendas_une_mes_especifico": ["une_nome"] + MONTH_COLUMNS,
+    "ranking_vendas_unes": ["une", "une_nome", "vendas_total"],
+    "produto_mais_vendido_cada_une": ["une", "une_nome", "codigo", "nome_produto", "vendas_total"],
+    "top_produtos_por_segmento": ["codigo", "nome_produto", "nomesegmento", "preco_38_percent", "vendas_total"],
+    "evolucao_vendas_produto": None,
+    "produto_vendas_une_barras": ["codigo", "une", "une_nome", "nome_produto"] + MONTH_COLUMNS,
+    "produto_vendas_todas_unes": ["codigo", "une", "une_nome", "nome_produto", "vendas_total"] + MONTH_COLUMNS,
+}
+
+# Consultas respondidas só com as linhas de um produto: parâmetro -> coluna filtrada.
+# (produto_vendas_une_barras fica de fora: valida a UNE contra o dataset inteiro.)
+QUERY_ROW_FILTERS: Dict[str, Dict[str, str]] = {
+    "consulta_produto_especifico": {"produto_codigo": "codigo"},
+    "preco_produto_une_especifica": {"produto_codigo": "codigo"},
+    "evolucao_vendas_produto": {"produto_codigo": "codigo"},
+    "produto_vendas_todas_unes": {"produto_codigo": "codigo"},
+}
+
+
+@dataclass(frozen=True)
+class DataPlan:
+    """Colunas (None = todas) e filtros de linha de uma consulta."""
+
+    query_type: str
+    columns: Optional[Tuple[str, ...]]
+    row_filters: Mapping[str, Any] = field(default_factory=dict)
+
+    def __post_init__(self):
+        object.__setattr__(self, "row_filters", MappingProxyType(dict(self.row_filters)))
+
+    def lazy_columns(self, loaded_columns) -> List[str]:
+        """Colunas do plano que ainda não estão no DataFrame carregado."""
+        return [col for col in self.columns or () if col not in loaded_columns]
+
+    @property
+    def scan_key(self) -> Tuple[str, ...]:
+        """Colunas filtradas; planos com a mesma chave podem dividir uma seleção."""
+        return tuple(sorted(self.row_filters))
+
+    @property
+    def filter_values(self) -> Tuple[Any, ...]:
+        """Valores dos filtros, na ordem de scan_key."""
+        return tuple(self.row_filters[col] for col in self.scan_key)
+
+
+def plan_query_data(query_type: str, params: Dict[str, Any]) -> DataPlan:
+    """Plano de dados da consulta. Tipos desconhecidos leem todas as colunas e linhas."""
+    columns = QUERY_COLUMNS.get(query_type)
+    row_filters = {}
+    for param, column in QUERY_ROW_FILTERS.get(query_type, {}).items():
+        try:
+            row_filters[column] = int(params.get(param))
+        except (ValueError, TypeError):
+            # Parâmetro inválido: o método reporta o erro a partir das linhas completas
+            pass
+    return DataPlan(query_type, tuple(columns) if columns is not None else None, row_filters)
+
+
+def project_view(df: pd.DataFrame, plan: DataPlan, index: Optional[DatasetIndex] = None) -> pd.DataFrame:
+    """
+    Visão do df com as colunas do plano (as que existem), sem copiar os dados das
+    colunas, reduzida às linhas do plano quando ele tem filtros (via índice quando
+    disponível). A visão é somente leitura por contrato; com Copy-on-Write uma
+    escrita copia a coluna em vez de alterar o dataset compartilhado.
+    """
+    if plan.columns is not None:
+        columns = [col for col in plan.columns if col in df.columns]
+        df = pd.DataFrame({col: df[col] for col in columns}, index=df.index, copy=False)
+    if plan.row_filters:
+        df = select_rows(df, index, **plan.row_filters)
+    return df
+
+
+def _union_columns(df: pd.DataFrame, plans: Sequence[DataPlan]) -> Optional[List[str]]:
+    """Colunas (existentes no df) lidas por algum dos planos; None = todas."""
+    if any(plan.columns is None for plan in plans):
+        return None
+    columns = dict.fromkeys(col for plan in plans for col in plan.columns)
+    return [col for col in columns if col in df.columns]
+
+
+def _select_many(df: pd.DataFrame, index: Optional[DatasetIndex], key: Tuple[str, ...],
+                 values: Sequence[Tuple[Any, ...]]) -> pd.DataFrame:
+    """Linhas em que as colunas de key valem alguma das combinações de values (ordem original)."""
+    if len(key) == 1 and index is not None and index.covers(key[0]) and index.aligned_with(df):
+        positions = [index.positions(key[0], value[0]) for value in values]
+        return df.iloc[np.sort(np.concatenate(positions))] if positions else df.iloc[:0]
+    mask = np.ones(len(df), dtype=bool)
+    for i, col in enumerate(key):
+        mask &= df[col].isin({value[i] for value in values}).to_numpy(dtype=bool)
+    return df[mask]
+
+
+def shared_row_views(df: pd.DataFrame, plans: Sequence[DataPlan],
+                     index: Optional[DatasetIndex] = None) -> Dict[int, pd.DataFrame]:
+    """
+    Visões dos planos com filtros de linha, com uma seleção por grupo de planos que
+    filtram as mesmas colunas (ex.: várias consultas de produto): as linhas de todos
+    os valores pedidos são lidas de uma vez, com a união das colunas do grupo, e
+    repartidas por valor. Retorna {posição do plano em plans: visão}; planos sem
+    filtro de linha ficam de fora.
+    """
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    for position, plan in enumerate(plans):
+        if plan.row_filters:
+            groups.setdefault(plan.scan_key, []).append(position)
+
+    views = {}
+    for key, positions in groups.items():
+        group_plans = [plans[position] for position in positions]
+        columns = _union_columns(df, group_plans)
+        frame = df if columns is None else pd.DataFrame({col: df[col] for col in columns}, index=df.index, copy=False)
+        rows = _select_many(frame, index, key, list(dict.fromkeys(plan.filter_values for plan in group_plans)))
+
+        # Posições de cada valor dentro das linhas lidas
+        by_value = rows.groupby(key[0] if len(key) == 1 else list(key), sort=False).indices if len(rows) else {}
+        for position, plan in zip(positions, group_plans):
+            value = plan.filter_values
+            taken = by_value.get(value[0] if len(key) == 1 else value, _NO_ROWS)
+            views[position] = project_view(rows.iloc[taken], replace(plan, row_filters={}))
+    return views
@@ -0,0 +1,84 @@
+"""
+Construtores de Resultado Vetorizados - Payloads dos _query_* sem laços por linha
+Seleção do topo por grupo, cores por faixa de desempenho e dados de gráfico
+montados por coluna (arrays), no lugar de iterrows e laços Python.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from core.utils.query_profiler import profiled
+
+# Faixas de desempenho em relação ao maior valor do gráfico
+PERFORMANCE_HIGH = 0.7
+PERFORMANCE_MEDIUM = 0.3
+COLOR_HIGH = '#2E8B57'    # Verde escuro para top performers
+COLOR_MEDIUM = '#FFD700'  # Dourado para performance média
+COLOR_LOW = '#CD5C5C'     # Vermelho suave para baixa performance
+
+DEFAULT_CHART_MARGIN = {"l": 80, "r": 80, "t": 100, "b": 120}
+
+
+def performance_colors(values: Any) -> List[str]:
+    """Cor de cada barra: >= 70% do máximo verde, >= 30% dourado, abaixo vermelho."""
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0:
+        return []
+    max_value = values.max()
+    colors = np.select(
+        [values >= max_value * PERFORMANCE_HIGH, values >= max_value * PERFORMANCE_MEDIUM],
+        [COLOR_HIGH, COLOR_MEDIUM],
+        default=COLOR_LOW,
+    )
+    return colors.tolist()
+
+
+def truncate_labels(labels: pd.Series, max_length: int) -> pd.Series:
+    """Corta rótulos maiores que max_length, acrescentando '...'."""
+    labels = labels.astype(str)
+    return labels.where(labels.str.len() <= max_length, labels.str.slice(0, max_length) + '...')
+
+
+def top_per_group(df: pd.DataFrame, group_column: str, value_column: str) -> pd.DataFrame:
+    """Linha de maior value_column em cada grupo (um único groupby/idxmax)."""
+    if df.empty:
+        return df
+    positions = df.groupby(group_column, observed=True, sort=False)[value_column].idxmax()
+    return df.loc[positions.to_numpy()]
+
+
+@profiled("chart")
+def bar_chart_data(labels: Any, values: Any, colors: bool = False,
+                   bar_height: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Payload de gráfico de barras por coluna (listas x/y).
+
+    Args:
+        colors: Se True, inclui as cores por faixa de desempenho
+        bar_height: Se informado, altura responsiva (bar_height por barra, entre 400 e 800)
+            e margens maiores para os rótulos
+    """
+    x_data = list(labels) if not isinstance(labels, pd.Series) else labels.tolist()
+    y_data = np.asarray(values, dtype=np.float64).tolist()
+    chart_data = {"x": x_data, "y": y_data, "type": "bar"}
+    if colors:
+        chart_data["colors"] = performance_colors(y_data)
+    chart_data["show_values"] = True
+    if bar_height is not None:
+        chart_data["height"] = max(400, min(800, len(x_data) * bar_height))
+        chart_data["margin"] = dict(DEFAULT_CHART_MARGIN)
+    return chart_data
+
+
+def to_records(df: pd.DataFrame, columns: Dict[str, str],
+               types: Optional[Dict[str, type]] = None) -> List[Dict[str, Any]]:
+    """
+    Lista de dicts a partir das colunas (renomeadas por columns: origem -> destino),
+    convertendo colunas inteiras/reais por coluna em vez de item a item.
+    """
+    frame = df[list(columns)].rename(columns=columns)
+    for name, kind in (types or {}).items():
+        frame[name] = frame[name].astype(np.int64 if kind is int else np.float64)
+    return frame.to_dict('records')
@@ -0,0 +1,217 @@
+"""
+Cubos de Agregação (Rollups) - Rankings sem varrer 1.1M linhas
+Somas de mes_01..mes_12 e das medidas derivadas pré-calculadas nos grãos usados
+pelas consultas de ranking, construídas uma vez por versão do dataset e gravadas
+em disco ao lado do parquet. O roteador responde cada consulta a partir do menor
+cubo que a cobre.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Any, Callable, Dict, Optional, Sequence, Union
+
+import pandas as pd
+
+from core.connectivity.derived_measures import MONTH_COLUMNS
+from .dataset_index import DatasetIndex, select_rows
+
+logger = logging.getLogger(__name__)
+
+# Grãos materializados: nome do cubo -> colunas de agrupamento
+CUBE_GRAINS: Dict[str, tuple] = {
+    "une": ("une",),
+    "codigo": ("codigo",),
+    "nomesegmento": ("nomesegmento",),
+    "nome_categoria": ("nome_categoria",),
+    "une_codigo": ("une", "codigo"),
+    "nomesegmento_codigo": ("nomesegmento", "codigo"),
+}
+
+# Medidas aditivas somadas em todos os cubos
+ROLLUP_MEASURES = MONTH_COLUMNS + ['vendas_total', 'vendas_ultimos_3_meses',
+                                   'vendas_ultimos_6_meses', 'receita_total']
+
+# Atributos descritivos carregados junto de uma chave (primeiro valor do grupo)
+KEY_ATTRIBUTES = {
+    "une": ["une_nome"],
+    "codigo": ["nome_produto", "nomesegmento", "nome_categoria", "preco_38_percent"],
+}
+
+ROLLUP_SUFFIX = ".rollups"
+ROLLUP_FORMAT_VERSION = "1"
+MANIFEST_FILENAME = "_manifest.json"
+
+# Filtro: valor (igualdade) ou função Series -> máscara booleana
+FilterValue = Union[Any, Callable[[pd.Series], pd.Series]]
+
+
+def rollup_path(source_path: str) -> str:
+    """Diretório dos cubos persistidos, ao lado do arquivo de origem."""
+    return source_path.rstrip("/\\") + ROLLUP_SUFFIX
+
+
+def apply_filters(df: pd.DataFrame, filters: Optional[Dict[str, FilterValue]],
+                   index: Optional[DatasetIndex] = None,
+                   columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    Aplica os filtros de igualdade (pelo índice, quando ele vale para df) e depois os
+    filtros por função. Com columns, só essas colunas são recortadas.
+    """
+    frame = df if columns is None else df[list(columns)]
+    if not filters:
+        return frame
+    equality = {col: val for col, val in filters.items() if not callable(val)}
+    if equality:
+        if index is not None and index.aligned_with(df):
+            frame = index.select(frame, **equality)
+        else:
+            frame = select_rows(frame, None, **equality)
+    for col, predicate in filters.items():
+        if callable(predicate) and len(frame):
+            frame = frame[predicate(frame[col]).to_numpy(dtype=bool)]
+    return frame
+
+
+def aggregate_frame(df: pd.DataFrame, group_by: Sequence[str],
+                    measures: Optional[Sequence[str]] = None,
+                    filters: Optional[Dict[str, FilterValue]] = None,
+                    index: Optional[DatasetIndex] = None) -> pd.DataFrame:
+    """
+    Soma as medidas por group_by (mais os atributos descritivos de cada chave).
+    Usada tanto para montar os cubos a partir das linhas base quanto para agregar
+    um cubo num grão mais grosso, então os dois caminhos dão as mesmas colunas.
+    """
+    group_by = list(group_by)
+    measures = [m for m in (measures or ROLLUP_MEASURES) if m in df.columns]
+
+    agg = {m: "sum" for m in measures}
+    for key in group_by:
+        for attribute in KEY_ATTRIBUTES.get(key, []):
+            if attribute in df.columns and attribute not in group_by and attribute not in agg:
+                agg[attribute] = "first"
+
+    # Só as colunas usadas são filtradas/agrupadas
+    columns = list(dict.fromkeys(group_by + list(agg) + list(filters or {})))
+    frame = apply_filters(df, filters, index, columns)
+    return frame.groupby(group_by, observed=True, sort=False).agg(agg).reset_index()
+
+
+class RollupCubes:
+    """Conjunto de cubos de uma versão do dataset, com roteamento pelo menor cubo."""
+
+    def __init__(self, cubes: Dict[str, pd.DataFrame], version: Optional[str]):
+        self.cubes = cubes
+        self.version = version
+        self._indexes: Dict[str, DatasetIndex] = {}
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, version: Optional[str],
+              aggregate: Callable[..., pd.DataFrame] = aggregate_frame) -> "RollupCubes":
+        """Monta os cubos cujas colunas do grão existem em df (com aggregate, ex.: um paralelo)."""
+        start = time.perf_counter()
+        cubes = {}
+        for name, grain in CUBE_GRAINS.items():
+            if all(col in df.columns for col in grain):
+                # Ordenado pela última chave (codigo): buscas por produto ficam contíguas
+                cube = aggregate(df, grain).sort_values(list(grain[::-1]), kind="stable")
+                cubes[name] = cube.reset_index(drop=True)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Rollups construídos em {elapsed:.3f}s: " +
+                    ", ".join(f"{name}={len(cube)}" for name, cube in cubes.items()))
+        return cls(cubes, version)
+
+    def save(self, path: str) -> None:
+        """Grava os cubos (um parquet por cubo + manifesto), trocando o diretório atomicamente."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        try:
+            manifest = {"source_fingerprint": self.version, "format_version": ROLLUP_FORMAT_VERSION, "cubes": {}}
+            for name, cube in self.cubes.items():
+                cube.to_parquet(os.path.join(tmp_path, f"{name}.parquet"), index=False)
+                manifest["cubes"][name] = {"grain": list(CUBE_GRAINS[name]), "rows": len(cube)}
+            with open(os.path.join(tmp_path, MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+            if os.path.exists(path):
+                shutil.rmtree(path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                shutil.rmtree(tmp_path)
+        logger.info(f"Rollups gravados em {path}")
+
+    @classmethod
+    def load(cls, path: str, version: Optional[str]) -> Optional["RollupCubes"]:
+        """Carrega os cubos persistidos se foram montados a partir desta versão; senão, None."""
+        manifest_path = os.path.join(path, MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if (manifest.get("source_fingerprint") != version or
+                    manifest.get("format_version") != ROLLUP_FORMAT_VERSION):
+                logger.info(f"Rollups em {path} desatualizados")
+                return None
+            cubes = {
+                name: pd.read_parquet(os.path.join(path, f"{name}.parquet"))
+                for name in manifest["cubes"] if name in CUBE_GRAINS
+            }
+        except Exception as e:
+            logger.warning(f"Não foi possível ler rollups de {path}: {e}")
+            return None
+        logger.info(f"Rollups carregados de {path}: {list(cubes)}")
+        return cls(cubes, version)
+
+    def route(self, group_by: Sequence[str], filter_columns: Sequence[str] = ()) -> Optional[str]:
+        """
+        Nome do menor cubo cujo grão cobre group_by e as colunas filtradas, ou None
+        se nenhum cubo cobre a consulta.
+        """
+        needed = set(group_by) | set(filter_columns)
+        covering = [name for name, cube in self.cubes.items() if needed <= set(CUBE_GRAINS[name])]
+        if not covering:
+            return None
+        return min(covering, key=lambda name: len(self.cubes[name]))
+
+    def query(self, group_by: Sequence[str], measures: Optional[Sequence[str]] = None,
+              filters: Optional[Dict[str, FilterValue]] = None) -> Optional[pd.DataFrame]:
+        """
+        Resultado agregado da consulta a partir do menor cubo que a cobre, com as
+        mesmas colunas que aggregate_frame daria sobre as linhas base.
+        Retorna None se nenhum cubo cobre a consulta.
+        """
+        filters = filters or {}
+        name = self.route(group_by, filters.keys())
+        if name is None:
+            return None
+
+        cube = self.cubes[name]
+        grain = CUBE_GRAINS[name]
+        if set(grain) == set(group_by) and not filters:
+            return cube
+
+        index = None
+        if any(not callable(val) for val in filters.values()):
+            index = self._indexes.get(name)
+            if index is None:
+                index = self._indexes[name] = DatasetIndex(cube)
+        if set(grain) == set(group_by):
+            return apply_filters(cube, filters, index)
+        return aggregate_frame(cube, group_by, measures, filters, index)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Linhas e memória de cada cubo."""
+        return {
+            name: {
+                "grain": list(CUBE_GRAINS[name]),
+                "rows": len(cube),
+                "memory_mb": round(cube.memory_usage(deep=True).sum() / 1024**2, 2),
+            }
+            for name, cube in self.cubes.items()
+        }
@@ -5,32 +5,68 @@ Cache agressivo de consultas e resultados para evitar re-processamento.
 
 import json
 import hashlib
-import pickle
-import gzip
+from collections import Counter
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Iterable, Sequence
 import logging
 
+from core.utils.query_profiler import query_profiler
+from .cache_codecs import DEFAULT_CODEC, LEGACY_CODEC, decode_entry, encode_entry, get_codec
+from .cache_tiers import (DEFAULT_MEMORY_BUDGET_MB, DEFAULT_MEMORY_POLICY, DEFAULT_WRITE_BEHIND,
+                          DEFAULT_WRITE_QUEUE, DiskTier, MemoryTier, WriteBehindQueue)
+from .query_planner import QUERY_COLUMNS
+
 logger = logging.getLogger(__name__)
 
 class SmartCache:
     """Cache inteligente para consultas e gráficos - economia máxima de LLM."""
 
-    def __init__(self, cache_dir: str = "cache", max_size_mb: int = 100):
+    def __init__(self, cache_dir: str = "cache", max_size_mb: int = 100,
+                 memory_budget_mb: float = DEFAULT_MEMORY_BUDGET_MB,
+                 memory_policy: str = DEFAULT_MEMORY_POLICY,
+                 write_behind: bool = DEFAULT_WRITE_BEHIND,
+                 write_queue: int = DEFAULT_WRITE_QUEUE,
+                 codec: str = DEFAULT_CODEC):
         """
         Inicializa o cache.
 
         Args:
             cache_dir: Diretório para arquivos de cache
             max_size_mb: Tamanho máximo do cache em MB
+            memory_budget_mb: Orçamento da camada em memória em MB
+            memory_policy: Despejo da camada em memória ("lru" ou "lfu")
+            write_behind: Serializa e grava em disco num thread em segundo plano
+            write_queue: Máximo de gravações pendentes (set espera quando a fila enche)
+            codec: Codec das novas entradas ("serializador+compressor", ver cache_codecs);
+                as já gravadas são lidas pelo codec do cabeçalho de cada uma
         """
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
         self.max_size_bytes = max_size_mb * 1024 * 1024
 
-        # Cache em memória para acesso ultra-rápido
-        self._memory_cache = {}
+        # Cache em memória para acesso ultra-rápido, limitado em bytes
+        self._memory_cache = MemoryTier(int(memory_budget_mb * 1024 * 1024), memory_policy)
+
+        # Arquivos em disco indexados por manifesto: despejo LRU sem varrer o diretório.
+        # O sufixo .cache.gz fica pelos caches existentes; o codec real está no cabeçalho
+        self._disk = DiskTier(self.cache_dir, self.max_size_bytes)
+        try:
+            self.codec = get_codec(codec)
+        except ImportError as e:
+            logger.warning(f"{e} - usando {LEGACY_CODEC}")
+            self.codec = get_codec(LEGACY_CODEC)
+        # Entradas gravadas por codec (inclui as que caíram para pickle)
+        self._codec_counts = Counter()
+
+        # Gravações em disco fora do caminho da resposta (None = síncronas)
+        self._writer = WriteBehindQueue(self._persist, write_queue, name="smart-cache-writer") \
+            if write_behind else None
+
+        # Versão (fingerprint) do dataset que gerou as entradas: com a versão conhecida,
+        # uma entrada vale enquanto o dataset não muda (sem TTL) e sai assim que ele muda;
+        # sem ela, vale o TTL do tipo de consulta
+        self.data_version = None
         self._cache_stats = {
             "hits": 0,
             "misses": 0,
@@ -60,7 +96,7 @@ class SmartCache:
 
         logger.info(f"SmartCache inicializado - Diretório: {self.cache_dir}")
 
-    def _generate_cache_key(self, query_type: str, params: Dict[str, Any]) -> str:
+    def make_key(self, query_type: str, params: Dict[str, Any]) -> str:
         """Gera chave única para cache baseada no tipo e parâmetros."""
         # Serializar parâmetros de forma consistente
         params_str = json.dumps(params, sort_keys=True, ensure_ascii=False)
@@ -71,42 +107,131 @@ class SmartCache:
 
     def _get_cache_file_path(self, cache_key: str) -> Path:
         """Retorna caminho do arquivo de cache."""
-        return self.cache_dir / f"{cache_key}.cache.gz"
+        return self._disk.path(cache_key)
 
     def _get_ttl_for_query(self, query_type: str) -> timedelta:
         """Retorna TTL apropriado para o tipo de consulta."""
         return self.cache_config.get(query_type, self.cache_config["default"])
 
-    def get(self, query_type: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    def set_data_version(self, version: Optional[str],
+                         changed_columns: Optional[Iterable[str]] = None) -> None:
+        """
+        Informa a versão atual do dataset. Entradas etiquetadas com outra versão saem
+        na hora, da memória e do disco (pelo manifesto, sem listar o diretório).
+
+        Args:
+            version: Fingerprint do dataset servido
+            changed_columns: Colunas alteradas desde a versão anterior, se conhecidas
+                (ParquetAdapter.changed_columns): entradas da versão anterior que não
+                dependem delas passam para a nova versão em vez de sair
+        """
+        if version == self.data_version:
+            return
+        previous, self.data_version = self.data_version, version
+        if version is None:
+            return
+
+        carried = 0
+        if previous is not None and changed_columns is not None:
+            carried = self._carry_over(previous, version, set(changed_columns))
+        dropped = self._discard_entries(lambda item_version, columns: item_version not in (None, version))
+        if previous is not None or dropped:
+            logger.info(f"SmartCache: dataset na versão {version} (antes {previous}) - "
+                        f"{dropped} entradas invalidadas, {carried} mantidas")
+
+    def invalidate(self, version: Optional[str] = None, columns: Optional[Iterable[str]] = None) -> int:
+        """
+        Remove as entradas etiquetadas com a versão e/ou que dependem de alguma das
+        colunas (entradas sem colunas registradas dependem de todas). Sem argumentos,
+        remove todas as entradas etiquetadas. Retorna quantas saíram.
+        """
+        columns = None if columns is None else set(columns)
+
+        def matches(item_version, item_columns):
+            if item_version is None or (version is not None and item_version != version):
+                return False
+            return columns is None or item_columns is None or not columns.isdisjoint(item_columns)
+
+        return self._discard_entries(matches)
+
+    def _discard_entries(self, predicate) -> int:
+        """
+        Remove das camadas as entradas em que predicate(versão, colunas) é verdadeiro.
+        Gravações pendentes delas são canceladas e a em andamento termina antes da
+        limpeza do disco, então nenhuma volta ao disco depois da invalidação.
+        """
+        def item_matches(key, item):
+            return predicate(item.get("data_version"), item.get("columns"))
+
+        keys = set(self._memory_cache.discard_where(item_matches))
+        if self._writer is not None:
+            keys.update(self._writer.discard_where(item_matches))
+        keys.update(self._disk.discard_where(
+            lambda key, tags: tags is not None and predicate(tags.get("version"), tags.get("columns"))))
+        return len(keys)
+
+    def _carry_over(self, previous: str, version: str, changed: set) -> int:
+        """Re-etiqueta com a nova versão as entradas da anterior que não leem colunas alteradas."""
+        def unaffected(item_version, columns):
+            return item_version == previous and columns is not None and changed.isdisjoint(columns)
+
+        keys = set()
+        pending = self._writer.items() if self._writer is not None else []
+        for key, item in self._memory_cache.items() + pending:
+            if unaffected(item.get("data_version"), item.get("columns")):
+                item["data_version"] = version
+                keys.add(key)
+        for key, tags in self._disk.items():
+            if tags is not None and unaffected(tags.get("version"), tags.get("columns")):
+                self._disk.retag(key, {**tags, "version": version})
+                keys.add(key)
+        return len(keys)
+
+    def get(self, query_type: str, params: Dict[str, Any],
+            cache_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
         Recupera resultado do cache se disponível e válido.
 
+        Args:
+            cache_key: Chave já calculada (ex.: a do QueryPlan); sem ela, é gerada de query_type/params
+
         Returns:
             Resultado cached ou None se não encontrado/expirado
         """
-        cache_key = self._generate_cache_key(query_type, params)
+        cache_key = cache_key or self.make_key(query_type, params)
 
         # 1. Verificar cache em memória primeiro (mais rápido)
-        if cache_key in self._memory_cache:
-            cached_item = self._memory_cache[cache_key]
+        cached_item = self._memory_cache.get(cache_key)
+        if cached_item is not None:
             if self._is_cache_valid(cached_item, query_type):
                 self._cache_stats["hits"] += 1
                 logger.debug(f"Cache HIT (memória): {query_type}")
-                return cached_item["result"]
+                return self._result_copy(cached_item)
             else:
                 # Remover do cache em memória se expirado
-                del self._memory_cache[cache_key]
+                self._memory_cache.pop(cache_key)
+
+        # Ainda na fila de gravação (ex.: despejada da memória antes de chegar ao disco)
+        cached_item = self._writer.peek(cache_key) if self._writer is not None else None
+        if cached_item is not None and self._is_cache_valid(cached_item, query_type):
+            self._memory_cache.put(cache_key, cached_item)
+            self._cache_stats["hits"] += 1
+            logger.debug(f"Cache HIT (gravação pendente): {query_type}")
+            return self._result_copy(cached_item)
 
         # 2. Verificar cache em disco
-        cache_file = self._get_cache_file_path(cache_key)
-        if cache_file.exists():
+        data = self._disk.read(cache_key)
+        if data is not None:
             try:
-                with gzip.open(cache_file, 'rb') as f:
-                    cached_item = pickle.load(f)
+                cached_item, _ = decode_entry(data)
+                # A versão vale a do manifesto (a entrada pode ter sido re-etiquetada)
+                tags = self._disk.tags(cache_key)
+                if tags is not None:
+                    cached_item["data_version"] = tags.get("version")
 
                 if self._is_cache_valid(cached_item, query_type):
                     # Colocar de volta no cache em memória
-                    self._memory_cache[cache_key] = cached_item
+                    self._memory_cache.put(cache_key, cached_item)
                     self._cache_stats["hits"] += 1
 
                     # Adicionar tokens economizados
@@ -114,14 +239,14 @@ class SmartCache:
                     self._cache_stats["tokens_saved"] += tokens_saved
 
                     logger.debug(f"Cache HIT (disco): {query_type} - {tokens_saved} tokens economizados")
-                    return cached_item["result"]
+                    return self._result_copy(cached_item)
                 else:
                     # Remover arquivo expirado
-                    cache_file.unlink()
+                    self._disk.discard(cache_key)
 
             except Exception as e:
                 logger.warning(f"Erro ao ler cache: {e}")
-                cache_file.unlink()  # Remove arquivo corrompido
+                self._disk.discard(cache_key)  # Remove arquivo corrompido
 
         # Cache miss
         self._cache_stats["misses"] += 1
@@ -129,7 +254,8 @@ class SmartCache:
         return None
 
     def set(self, query_type: str, params: Dict[str, Any], result: Dict[str, Any],
-            tokens_would_use: int = 100) -> None:
+            tokens_would_use: int = 100, cache_key: Optional[str] = None,
+            columns: Optional[Sequence[str]] = None) -> None:
         """
         Salva resultado no cache.
 
@@ -138,34 +264,68 @@ class SmartCache:
             params: Parâmetros da consulta
             result: Resultado a ser cached
             tokens_would_use: Quantos tokens essa consulta usaria na LLM
+            cache_key: Chave já calculada (ex.: a do QueryPlan)
+            columns: Colunas do dataset de que o resultado depende; por padrão, as
+                lidas pelo tipo de consulta (QUERY_COLUMNS; tipo desconhecido = todas)
         """
-        cache_key = self._generate_cache_key(query_type, params)
+        cache_key = cache_key or self.make_key(query_type, params)
+        if columns is None:
+            columns = QUERY_COLUMNS.get(query_type)
 
         cached_item = {
-            "result": result,
+            # Cópia rasa: o chamador continua preenchendo o seu (processing_time, source...)
+            "result": dict(result) if isinstance(result, dict) else result,
             "timestamp": datetime.now(),
             "query_type": query_type,
             "params": params,
-            "tokens_would_use": tokens_would_use
+            "tokens_would_use": tokens_would_use,
+            "data_version": self.data_version,
+            "columns": list(columns) if columns is not None else None
         }
 
-        # Salvar em memória
-        self._memory_cache[cache_key] = cached_item
+        # Salvar em memória (despeja as entradas mais frias se passar do orçamento)
+        self._memory_cache.put(cache_key, cached_item)
 
-        # Salvar em disco (comprimido)
+        # Salvar em disco (comprimido), em segundo plano quando write-behind está ligado.
+        # A entrada só tem cópias (o resultado acima), então serializá-la no writer
+        # não concorre com o chamador, que segue preenchendo o próprio resultado
+        if self._writer is not None:
+            self._writer.submit(cache_key, cached_item)
+            return
         try:
-            cache_file = self._get_cache_file_path(cache_key)
-            with gzip.open(cache_file, 'wb') as f:
-                pickle.dump(cached_item, f)
-
-            self._cache_stats["saves"] += 1
-            logger.debug(f"Cache SAVE: {query_type}")
-
+            self._persist(cache_key, cached_item)
         except Exception as e:
             logger.error(f"Erro ao salvar cache: {e}")
 
-        # Limpar cache se necessário
-        self._cleanup_if_needed()
+    @staticmethod
+    def _result_copy(cached_item: Dict[str, Any]) -> Any:
+        """Resultado entregue ao chamador: cópia rasa, para que alterá-lo não mude a entrada."""
+        result = cached_item["result"]
+        return dict(result) if isinstance(result, dict) else result
+
+    def _persist(self, cache_key: str, cached_item: Dict[str, Any]) -> None:
+        """Serializa a entrada e grava no disco; o manifesto despeja as menos usadas se passar do limite."""
+        with query_profiler.span("serialize"):
+            data, codec = encode_entry(cached_item, self.codec)
+        self._codec_counts[codec] += 1
+        version = cached_item["data_version"]
+        expires = None
+        if version is None:
+            expires = (cached_item["timestamp"] + self._get_ttl_for_query(cached_item["query_type"])).timestamp()
+        self._disk.write(cache_key, data, expires, {"version": version, "columns": cached_item["columns"]})
+
+        self._cache_stats["saves"] += 1
+        logger.debug(f"Cache SAVE: {cached_item['query_type']}")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Espera as gravações em segundo plano chegarem ao disco. False se o timeout venceu antes."""
+        return self._writer.flush(timeout) if self._writer is not None else True
+
+    def close(self) -> None:
+        """Grava as entradas pendentes e encerra o writer e o journal do manifesto."""
+        if self._writer is not None:
+            self._writer.close()
+        self._disk.close()
 
     def _is_cache_valid(self, cached_item: Dict[str, Any], query_type: str) -> bool:
         """Verifica se item do cache ainda é válido."""
@@ -173,50 +333,25 @@ class SmartCache:
         if not timestamp:
             return False
 
+        # Versão conhecida: vale enquanto for a mesma (a troca de versão já remove as demais)
+        if self.data_version is not None:
+            return cached_item.get("data_version") == self.data_version
+
         ttl = self._get_ttl_for_query(query_type)
         expiry_time = timestamp + ttl
 
         return datetime.now() < expiry_time
 
-    def _cleanup_if_needed(self) -> None:
-        """Limpa cache se exceder tamanho máximo."""
-        try:
-            # Verificar tamanho do diretório de cache
-            total_size = sum(f.stat().st_size for f in self.cache_dir.glob("*.cache.gz"))
-
-            if total_size > self.max_size_bytes:
-                logger.info(f"Cache excedeu limite ({total_size/1024/1024:.1f}MB) - limpando...")
-
-                # Listar arquivos por data de modificação (mais antigos primeiro)
-                cache_files = sorted(
-                    self.cache_dir.glob("*.cache.gz"),
-                    key=lambda f: f.stat().st_mtime
-                )
-
-                # Remover arquivos mais antigos até ficar dentro do limite
-                for cache_file in cache_files:
-                    cache_file.unlink()
-                    total_size -= cache_file.stat().st_size
-
-                    if total_size <= self.max_size_bytes * 0.8:  # Deixar 20% de margem
-                        break
-
-                # Limpar cache em memória também
-                self._memory_cache.clear()
-
-                logger.info("Limpeza de cache concluída")
-
-        except Exception as e:
-            logger.error(f"Erro na limpeza de cache: {e}")
-
     def clear_all(self) -> None:
         """Limpa todo o cache."""
         # Limpar memória
         self._memory_cache.clear()
 
-        # Limpar disco
-        for cache_file in self.cache_dir.glob("*.cache.gz"):
-            cache_file.unlink()
+        # Limpar disco (gravações pendentes canceladas antes)
+        if self._writer is not None:
+            self._writer.discard_where(lambda key, item: True)
+            self._writer.flush()
+        self._disk.clear()
 
         # Resetar estatísticas
         self._cache_stats = {
@@ -239,17 +374,21 @@ class SmartCache:
             "saves": self._cache_stats["saves"],
             "hit_rate_percent": round(hit_rate, 1),
             "tokens_saved": self._cache_stats["tokens_saved"],
-            "cache_files": len(list(self.cache_dir.glob("*.cache.gz"))),
-            "memory_cache_size": len(self._memory_cache)
+            "cache_files": len(self._disk),
+            "data_version": self.data_version,
+            "memory_cache_size": len(self._memory_cache),
+            "memory_tier": self._memory_cache.get_stats(),
+            "disk_tier": self._disk.get_stats(),
+            "write_behind": self._writer.get_stats() if self._writer is not None else None,
+            "codec": self.codec.name,
+            "entries_by_codec": dict(self._codec_counts)
         }
 
     def preload_frequent_queries(self, parquet_adapter) -> None:
         """Pre-carrega consultas mais frequentes no cache."""
         logger.info("Pre-carregando consultas frequentes...")
 
-        from .direct_query_engine import DirectQueryEngine
-
-        engine = DirectQueryEngine(parquet_adapter)
+        from .dataset_registry import dataset_registry
 
         # Lista de consultas para pre-load
         frequent_queries = [
@@ -260,20 +399,28 @@ class SmartCache:
             ("estoque parado", {})
         ]
 
-        for query_text, extra_params in frequent_queries:
-            try:
-                query_type, params = engine.classify_intent_direct(query_text)
-                params.update(extra_params)
-
-                # Verificar se já está no cache
-                if self.get(query_type, params) is None:
-                    # Executar e cachear
-                    result = engine.execute_direct_query(query_type, params)
+        with dataset_registry.lease(parquet_adapter.file_path, parquet_adapter) as entry:
+            engine = entry.engine
+            self.set_data_version(entry.fingerprint, entry.adapter.changed_columns(self.data_version))
+
+            # Consultas ainda fora do cache, executadas num único lote
+            pending = []
+            for query_text, extra_params in frequent_queries:
+                try:
+                    query_type, params = engine.classify_intent_direct(query_text)
+                    params.update(extra_params)
+                    if self.get(query_type, params) is None:
+                        pending.append((query_text, query_type, params))
+                except Exception as e:
+                    logger.warning(f"Erro no pre-load de '{query_text}': {e}")
+
+            results = engine.execute_many([(query_type, params) for _, query_type, params in pending])
+            for (query_text, query_type, params), result in zip(pending, results):
+                try:
                     self.set(query_type, params, result, tokens_would_use=150)
                     logger.debug(f"Pre-load: {query_text}")
-
-            except Exception as e:
-                logger.warning(f"Erro no pre-load de '{query_text}': {e}")
+                except Exception as e:
+                    logger.warning(f"Erro no pre-load de '{query_text}': {e}")
 
         logger.info(f"Pre-load concluído: {len(frequent_queries)} consultas")
 
@@ -294,28 +441,40 @@ class SmartCache:
 
     def warm_up_cache(self, queries: List[str], parquet_adapter) -> Dict[str, Any]:
         """Aquece o cache com consultas específicas."""
-        from .direct_query_engine import DirectQueryEngine
+        from .dataset_registry import dataset_registry
 
-        engine = DirectQueryEngine(parquet_adapter)
         results = {"success": 0, "errors": 0, "skipped": 0}
 
-        for query in queries:
-            try:
-                query_type, params = engine.classify_intent_direct(query)
-
-                if self.get(query_type, params) is not None:
-                    results["skipped"] += 1
-                    continue
-
-                result = engine.execute_direct_query(query_type, params)
-                if result.get("type") != "error":
-                    self.set(query_type, params, result, tokens_would_use=120)
-                    results["success"] += 1
-                else:
+        with dataset_registry.lease(parquet_adapter.file_path, parquet_adapter) as entry:
+            engine = entry.engine
+            self.set_data_version(entry.fingerprint, entry.adapter.changed_columns(self.data_version))
+            pending = {}
+            for query in queries:
+                try:
+                    query_type, params = engine.classify_intent_direct(query)
+
+                    cache_key = self.make_key(query_type, params)
+                    if cache_key in pending or self.get(query_type, params, cache_key=cache_key) is not None:
+                        results["skipped"] += 1
+                        continue
+                    pending[cache_key] = (query, query_type, params)
+
+                except Exception as e:
+                    logger.warning(f"Erro no warm-up de '{query}': {e}")
                     results["errors"] += 1
 
-            except Exception as e:
-                logger.warning(f"Erro no warm-up de '{query}': {e}")
-                results["errors"] += 1
+            # Um lote: consultas compatíveis dividem seleções e agregações
+            batch = engine.execute_many([(query_type, params) for _, query_type, params in pending.values()])
+            for (cache_key, (query, query_type, params)), result in zip(pending.items(), batch):
+                try:
+                    if result.get("type") != "error":
+                        self.set(query_type, params, result, tokens_would_use=120, cache_key=cache_key)
+                        results["success"] += 1
+                    else:
+                        results["errors"] += 1
+
+                except Exception as e:
+                    logger.warning(f"Erro no warm-up de '{query}': {e}")
+                    results["errors"] += 1
 
         return results
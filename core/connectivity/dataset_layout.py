@@ -0,0 +1,270 @@
+"""
+Estágios de layout físico do admmat (executados a cada atualização dos dados).
+
+- write_une_partitioned_dataset: grava o admmat como dataset hive particionado
+  por UNE (une=<codigo>/), permitindo que consultas de uma única UNE leiam só
+  o diretório correspondente.
+- optimize_layout: reescreve o arquivo ordenado por (codigo, une), escolhendo
+  row group, compressão e dicionário por benchmark, com estatísticas e page
+  index, para que buscas por codigo pulem row groups pelo min/max.
+- materialize_derived_measures: grava as medidas derivadas (vendas_total,
+  últimos 3/6 meses, média mensal, receita) no arquivo lateral da versão.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .derived_measures import compute_derived_measures, write_derived_sidecar
+from .parquet_adapter import PARTITION_COLUMN, UNE_INDEX_FILENAME, MONTH_COLUMNS, compute_file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+def _swap_directory(tmp_dir: str, output_dir: str) -> None:
+    """Replaces output_dir with tmp_dir, keeping the old one until the new one is in place."""
+    old_dir = f"{output_dir}.old"
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+    if os.path.exists(output_dir):
+        os.replace(output_dir, old_dir)
+    os.replace(tmp_dir, output_dir)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+
+
+def write_une_partitioned_dataset(source_path: str, output_dir: str,
+                                  compression: str = "zstd") -> Dict[str, Any]:
+    """
+    Writes the admmat parquet as a une=<codigo> hive-partitioned dataset.
+
+    The data is streamed batch by batch (no full in-memory load). A small
+    _unes.json sidecar with the {une: une_nome} map is written next to the
+    partitions, so UNE names can be resolved without scanning the data.
+
+    Returns:
+        Summary with partitions written and total rows
+    """
+    source = ds.dataset(source_path, format="parquet")
+    if PARTITION_COLUMN not in source.schema.names:
+        raise ValueError(f"Coluna de partição '{PARTITION_COLUMN}' não encontrada em {source_path}")
+
+    tmp_dir = f"{output_dir.rstrip('/')}.tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+
+    logger.info(f"Particionando {source_path} por '{PARTITION_COLUMN}' em {output_dir}...")
+    partitioning = ds.partitioning(
+        pa.schema([source.schema.field(PARTITION_COLUMN)]), flavor="hive"
+    )
+    ds.write_dataset(
+        source,
+        tmp_dir,
+        format="parquet",
+        partitioning=partitioning,
+        file_options=ds.ParquetFileFormat().make_write_options(compression=compression),
+        basename_template="part-{i}.parquet",
+    )
+
+    pairs = source.to_table(columns=[PARTITION_COLUMN, "une_nome"]).to_pandas().drop_duplicates(PARTITION_COLUMN)
+    une_index = {str(int(row.une)): str(row.une_nome) for row in pairs.itertuples(index=False)}
+    with open(os.path.join(tmp_dir, UNE_INDEX_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(une_index, f, ensure_ascii=False, indent=2)
+
+    _swap_directory(tmp_dir, output_dir)
+
+    summary = {
+        "output_dir": output_dir,
+        "partitions": len(une_index),
+        "rows": source.count_rows(),
+    }
+    logger.info(f"Dataset particionado gravado: {summary}")
+    return summary
+
+
+# Ordenação física: buscas por produto (e produto + UNE) ficam contíguas
+LAYOUT_SORT_KEYS = [("codigo", "ascending"), ("une", "ascending")]
+
+# Grade padrão de candidatos avaliados pelo benchmark
+DEFAULT_LAYOUT_CANDIDATES = [
+    {"row_group_size": row_group_size, "compression": compression, "use_dictionary": True}
+    for row_group_size in (65536, 131072, 262144)
+    for compression in ("snappy", "zstd")
+]
+
+
+def build_probe_queries(table: pa.Table) -> Dict[str, Dict[str, Any]]:
+    """
+    Builds one representative scan (filter + projection) per DirectQueryEngine
+    query type, using a real codigo/une from the data.
+    """
+    codigos = table.column("codigo").to_pandas()
+    codigo = int(codigos.iloc[len(codigos) // 2])
+    unes = table.column(PARTITION_COLUMN).to_pandas()
+    une = int(unes.value_counts().index[0])
+
+    produto = ds.field("codigo") == codigo
+    une_filter = ds.field(PARTITION_COLUMN) == une
+    vendas_cols = ["codigo", "nome_produto", "une", "une_nome"] + MONTH_COLUMNS
+
+    return {
+        "consulta_produto_especifico": {"filter": produto, "columns": vendas_cols + ["preco_38_percent"]},
+        "evolucao_vendas_produto": {"filter": produto, "columns": vendas_cols},
+        "produto_vendas_todas_unes": {"filter": produto, "columns": vendas_cols},
+        "produto_vendas_une_barras": {"filter": produto & une_filter, "columns": vendas_cols},
+        "preco_produto_une_especifica": {"filter": produto & une_filter, "columns": vendas_cols + ["preco_38_percent"]},
+        "top_produtos_une_especifica": {"filter": une_filter, "columns": vendas_cols + ["preco_38_percent", "nomesegmento"]},
+        "vendas_une_mes_especifico": {"filter": une_filter, "columns": ["une", "une_nome", "mes_01"]},
+        "ranking_vendas_unes": {"filter": None, "columns": ["une", "une_nome"] + MONTH_COLUMNS},
+    }
+
+
+def measure_scan_cost(path: str, filter_expr: Optional[ds.Expression], columns: List[str]) -> Dict[str, Any]:
+    """
+    Measures what a filtered read costs on a parquet file or partitioned dataset:
+    row groups that survive statistics pruning, compressed bytes of the projected
+    column chunks in those row groups, and wall time of the actual read.
+    """
+    partitioning = "hive" if os.path.isdir(path) else None
+    dataset = ds.dataset(path, format="parquet", partitioning=partitioning)
+    columns = [col for col in columns if col in dataset.schema.names]
+
+    total_row_groups = sum(fragment.num_row_groups for fragment in dataset.get_fragments())
+    row_groups_read = 0
+    bytes_read = 0
+    for fragment in dataset.get_fragments(filter=filter_expr):
+        metadata = fragment.metadata
+        pieces = fragment.split_by_row_group(filter_expr) if filter_expr is not None else fragment.split_by_row_group()
+        for piece in pieces:
+            for row_group in piece.row_groups:
+                row_groups_read += 1
+                rg_metadata = metadata.row_group(row_group.id)
+                for i in range(rg_metadata.num_columns):
+                    chunk = rg_metadata.column(i)
+                    if chunk.path_in_schema in columns:
+                        bytes_read += chunk.total_compressed_size
+
+    start = time.perf_counter()
+    rows = dataset.to_table(columns=columns, filter=filter_expr).num_rows
+    seconds = time.perf_counter() - start
+
+    return {
+        "row_groups_read": row_groups_read,
+        "row_groups_total": total_row_groups,
+        "bytes_read": bytes_read,
+        "rows": rows,
+        "seconds": round(seconds, 4),
+    }
+
+
+def _write_layout(table: pa.Table, output_path: str, row_group_size: int,
+                  compression: str, use_dictionary: bool) -> None:
+    """Writes the (already sorted) table with statistics and page index."""
+    pq.write_table(
+        table,
+        output_path,
+        row_group_size=row_group_size,
+        compression=compression,
+        use_dictionary=use_dictionary,
+        write_statistics=True,
+        write_page_index=True,
+    )
+
+
+def _scan_report(path: str, probes: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    return {name: measure_scan_cost(path, probe["filter"], probe["columns"]) for name, probe in probes.items()}
+
+
+def optimize_layout(source_path: str, output_path: str,
+                    candidates: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Rewrites the admmat parquet sorted by (codigo, une) with the best layout.
+
+    Every candidate (row group size, compression, dictionary encoding) is written
+    to a temporary file and scored by the total read time of the probe queries;
+    ties go to the smaller file. The winner is written to output_path.
+
+    Returns:
+        Report with the chosen layout, the candidate scores and the before/after
+        scan cost per query type
+    """
+    candidates = candidates or DEFAULT_LAYOUT_CANDIDATES
+
+    logger.info(f"Lendo {source_path} para otimização de layout...")
+    table = ds.dataset(source_path, format="parquet").to_table()
+    probes = build_probe_queries(table)
+    before = _scan_report(source_path, probes)
+
+    table = table.sort_by(LAYOUT_SORT_KEYS)
+
+    scores = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, candidate in enumerate(candidates):
+            candidate_path = os.path.join(tmp_dir, f"candidate_{i}.parquet")
+            _write_layout(table, candidate_path, **candidate)
+            report = _scan_report(candidate_path, probes)
+            scores.append({
+                **candidate,
+                "total_seconds": round(sum(cost["seconds"] for cost in report.values()), 4),
+                "file_size_mb": round(os.path.getsize(candidate_path) / 1024**2, 2),
+            })
+            logger.info(f"Candidato {candidate}: {scores[-1]['total_seconds']}s, {scores[-1]['file_size_mb']}MB")
+
+    best = min(scores, key=lambda score: (score["total_seconds"], score["file_size_mb"]))
+    chosen = {key: best[key] for key in ("row_group_size", "compression", "use_dictionary")}
+
+    tmp_output = f"{output_path}.tmp"
+    _write_layout(table, tmp_output, **chosen)
+    os.replace(tmp_output, output_path)
+    after = _scan_report(output_path, probes)
+
+    logger.info(f"Layout otimizado gravado em {output_path}: {chosen}")
+    return {
+        "output_path": output_path,
+        "chosen": chosen,
+        "candidates": scores,
+        "scan_cost": {name: {"before": before[name], "after": after[name]} for name in probes},
+    }
+
+
+def materialize_derived_measures(source_path: str, batch_size: int = 131072) -> Dict[str, Any]:
+    """
+    Computes the derived measures batch by batch (only the month columns and
+    preco_38_percent are read) and writes them to the sidecar tagged with the
+    source fingerprint. Run once per data refresh; loaders then read the columns
+    instead of recomputing them.
+
+    Returns:
+        Summary with the sidecar path, fingerprint, columns and rows
+    """
+    fingerprint = compute_file_fingerprint(source_path)
+    partitioning = "hive" if os.path.isdir(source_path) else None
+    source = ds.dataset(source_path, format="parquet", partitioning=partitioning)
+    columns = [col for col in MONTH_COLUMNS + ["preco_38_percent"] if col in source.schema.names]
+    if not any(col in MONTH_COLUMNS for col in columns):
+        raise ValueError(f"Nenhuma coluna de vendas mensal encontrada em {source_path}")
+
+    start = time.perf_counter()
+    tables = []
+    for batch in source.to_batches(columns=columns, batch_size=batch_size):
+        derived = compute_derived_measures(batch.to_pandas())
+        tables.append(pa.Table.from_pandas(derived, preserve_index=False))
+    derived_table = pa.concat_tables(tables) if tables else pa.table({})
+
+    path = write_derived_sidecar(derived_table, source_path, fingerprint)
+    summary = {
+        "path": path,
+        "fingerprint": fingerprint,
+        "columns": derived_table.column_names,
+        "rows": derived_table.num_rows,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    logger.info(f"Medidas derivadas materializadas: {summary}")
+    return summary
@@ -0,0 +1,119 @@
+"""
+Medidas derivadas do admmat (vendas_total, janelas de meses, média e receita).
+
+São calculadas uma vez por atualização dos dados e gravadas num arquivo lateral
+(<origem>.derived.parquet), alinhado linha a linha com a origem e marcado com o
+fingerprint dela. Os loaders leem essas colunas prontas em vez de recalculá-las;
+resultados pequenos (consultas filtradas, partições) usam add_derived_measures.
+"""
+import logging
+import os
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+MONTH_COLUMNS = [f'mes_{i:02d}' for i in range(1, 13)]
+
+# mes_12 é o mês mais recente
+LAST_3_MONTHS = MONTH_COLUMNS[-3:]
+LAST_6_MONTHS = MONTH_COLUMNS[-6:]
+
+DERIVED_COLUMNS = ['vendas_total', 'vendas_ultimos_3_meses', 'vendas_ultimos_6_meses',
+                   'vendas_media_mensal', 'receita_total']
+
+DERIVED_SUFFIX = ".derived.parquet"
+DERIVED_FORMAT_VERSION = "1"
+
+
+def compute_derived_measures(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Computes the derived measures from the month columns (and preco_38_percent).
+
+    Returns a DataFrame with the same index as df holding only the derived
+    columns (float32, the dtype the memory optimizer settles on). Measures whose
+    inputs are missing are left out.
+    """
+    month_columns = [col for col in MONTH_COLUMNS if col in df.columns]
+    if not month_columns:
+        return pd.DataFrame(index=df.index)
+
+    months = df[month_columns].to_numpy(dtype=np.float64, na_value=0.0)
+    positions = {col: i for i, col in enumerate(month_columns)}
+    last_3 = [positions[col] for col in LAST_3_MONTHS if col in positions]
+    last_6 = [positions[col] for col in LAST_6_MONTHS if col in positions]
+
+    vendas_total = months.sum(axis=1)
+    derived = {
+        'vendas_total': vendas_total,
+        'vendas_ultimos_3_meses': months[:, last_3].sum(axis=1),
+        'vendas_ultimos_6_meses': months[:, last_6].sum(axis=1),
+        'vendas_media_mensal': vendas_total / len(month_columns),
+    }
+    if 'preco_38_percent' in df.columns:
+        preco = df['preco_38_percent'].to_numpy(dtype=np.float64, na_value=0.0)
+        derived['receita_total'] = vendas_total * preco
+
+    return pd.DataFrame({name: values.astype(np.float32) for name, values in derived.items()},
+                        index=df.index)
+
+
+def add_derived_measures(df: pd.DataFrame) -> pd.DataFrame:
+    """Adds the missing derived measures to a (small) query result, in place."""
+    missing = [col for col in DERIVED_COLUMNS if col not in df.columns]
+    if missing:
+        derived = compute_derived_measures(df)
+        for col in missing:
+            if col in derived.columns:
+                df[col] = derived[col]
+    return df
+
+
+def derived_sidecar_path(source_path: str) -> str:
+    """Path of the derived-measures sidecar that sits next to the source."""
+    return source_path.rstrip("/\\") + DERIVED_SUFFIX
+
+
+def write_derived_sidecar(derived: pa.Table, source_path: str, fingerprint: str) -> str:
+    """
+    Writes the derived columns tagged with the source fingerprint. Written to a
+    temporary file and renamed, so readers never see a partial sidecar.
+    """
+    path = derived_sidecar_path(source_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    metadata = dict(derived.schema.metadata or {})
+    metadata[b"source_fingerprint"] = fingerprint.encode("utf-8")
+    metadata[b"derived_version"] = DERIVED_FORMAT_VERSION.encode("utf-8")
+    try:
+        pq.write_table(derived.replace_schema_metadata(metadata), tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logger.info(f"Medidas derivadas gravadas em {path} ({derived.num_rows} linhas)")
+    return path
+
+
+def read_derived_sidecar(source_path: str, fingerprint: str,
+                         columns: Optional[List[str]] = None) -> Optional[pa.Table]:
+    """
+    Reads the derived-measures sidecar if it was built from this version of the source.
+    Returns None if it is missing, stale or unreadable.
+    """
+    path = derived_sidecar_path(source_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+        if (metadata.get(b"source_fingerprint") != fingerprint.encode("utf-8") or
+                metadata.get(b"derived_version") != DERIVED_FORMAT_VERSION.encode("utf-8")):
+            logger.info(f"Medidas derivadas em {path} desatualizadas")
+            return None
+        return pq.read_table(path, columns=columns)
+    except Exception as e:
+        logger.warning(f"Não foi possível ler medidas derivadas de {path}: {e}")
+        return None
@@ -1,60 +1,516 @@
+import hashlib
 import logging
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, Optional, Tuple
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import json
+import operator
 import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
 
 from .base import DatabaseAdapter
+from .derived_measures import (DERIVED_COLUMNS, MONTH_COLUMNS, add_derived_measures, compute_derived_measures,
+                               read_derived_sidecar, write_derived_sidecar)
 from core.utils.memory_optimizer import MemoryOptimizer
 
 logger = logging.getLogger(__name__)
 
+# Colunas carregadas por padrão (limite de memória do Streamlit Cloud)
+ESSENTIAL_COLUMNS = ['codigo', 'nome_produto', 'preco_38_percent', 'nomesegmento',
+                     'nome_categoria', 'nome_fabricante', 'mes_01', 'mes_02', 'mes_03',
+                     'mes_04', 'mes_05', 'mes_06', 'mes_07', 'mes_08', 'mes_09',
+                     'mes_10', 'mes_11', 'mes_12', 'une', 'une_nome']
+
+# Snapshot Arrow IPC (não comprimido, para memory-map sem cópia) gravado ao lado do parquet
+SNAPSHOT_SUFFIX = ".snapshot.arrow"
+SNAPSHOT_FORMAT_VERSION = "2"
+
+# Dataset particionado por UNE (diretório une=<codigo>/) e seu índice codigo -> nome
+PARTITION_COLUMN = "une"
+UNE_INDEX_FILENAME = "_unes.json"
+
+# Orçamento de memória para colunas carregadas sob demanda (fora das essenciais)
+DEFAULT_LAZY_COLUMNS_BUDGET_MB = 256
+
+# Tamanho padrão dos lotes entregues pelo modo streaming
+DEFAULT_BATCH_SIZE = 65536
+
+# Operadores aceitos nos filtros (os de dois caracteres primeiro)
+FILTER_OPERATORS = ('>=', '<=', '!=', '>', '<')
+COMPARISONS = {'>': operator.gt, '<': operator.lt, '>=': operator.ge, '<=': operator.le,
+               '!=': operator.ne, '==': operator.eq}
+
+# Colunas de que as medidas derivadas dependem (lidas a mais para filtrar por elas)
+DERIVED_INPUT_COLUMNS = MONTH_COLUMNS + ['preco_38_percent']
+
+# Intervalo mínimo (s) entre verificações de mudança do arquivo de origem
+DEFAULT_RELOAD_CHECK_INTERVAL = 5.0
+
+def compute_file_fingerprint(path: str) -> str:
+    """
+    Returns a cheap fingerprint of a parquet file or dataset directory.
+    Based on file size and modification time only (stat, no data read), so it
+    changes whenever the export rewrites the data.
+    """
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+            if name.endswith(".parquet")
+        )
+    else:
+        files = [path]
+
+    digest = hashlib.md5()
+    for file in files:
+        stat = os.stat(file)
+        name = os.path.relpath(file, path) if file != path else ""
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def parse_condition(condition: Any):
+    """
+    Splits a filter condition into (operator, value).
+    Strings like ">10" or "!=ABC" carry their operator; anything else is equality.
+    """
+    if isinstance(condition, str):
+        for op in FILTER_OPERATORS:
+            if condition.startswith(op):
+                return op, condition[len(op):].strip()
+    return "==", condition
+
+
+def frame_filter_mask(df: pd.DataFrame, query_filters: Dict[str, Any]) -> pd.Series:
+    """Boolean mask of the rows of df matching the filters (for columns that only exist after the read)."""
+    mask = pd.Series(True, index=df.index)
+    for column, condition in query_filters.items():
+        op, value = parse_condition(condition)
+        if isinstance(value, str) and pd.api.types.is_numeric_dtype(df[column]):
+            value = pd.to_numeric(value)
+        mask &= COMPARISONS[op](df[column], value)
+    return mask
+
+
+class QueryResultStream:
+    """
+    Lazy, batch-wise result of a filtered parquet scan.
+
+    Nothing is read until a consumer asks for it: total_rows only counts,
+    head(n) stops after n rows, and iter_batches/iter_frames yield Arrow record
+    batches or DataFrame chunks without building per-row dicts. There is no
+    row limit; consumers decide how much to materialize.
+
+    Filters on derived measures (derived_filters) cannot be pushed down: they are
+    applied batch by batch after the measures are computed, reading their input
+    columns along (and dropping them again if they were not requested).
+    """
+
+    def __init__(self, dataset: ds.Dataset, filter_expr: Optional[ds.Expression],
+                 columns: List[str], batch_size: int = DEFAULT_BATCH_SIZE,
+                 derived_filters: Optional[Dict[str, Any]] = None):
+        self._dataset = dataset
+        self._filter = filter_expr
+        self.columns = columns
+        self.batch_size = batch_size
+        self._derived_filters = derived_filters or {}
+        self._read_columns = columns
+        if self._derived_filters:
+            self._read_columns = columns + [col for col in DERIVED_INPUT_COLUMNS
+                                            if col in dataset.schema.names and col not in columns]
+        self._total_rows = None
+
+    def _scanner(self) -> ds.Scanner:
+        return self._dataset.scanner(columns=self._read_columns, filter=self._filter, batch_size=self.batch_size)
+
+    def _derived_mask(self, df: pd.DataFrame) -> pd.Series:
+        return frame_filter_mask(add_derived_measures(df), self._derived_filters)
+
+    @property
+    def total_rows(self) -> int:
+        """Number of matching rows (counted once, without materializing them)."""
+        if self._total_rows is None:
+            if self._derived_filters:
+                self._total_rows = sum(batch.num_rows for batch in self.iter_batches())
+            else:
+                self._total_rows = self._scanner().count_rows()
+        return self._total_rows
+
+    def __len__(self) -> int:
+        return self.total_rows
+
+    def __bool__(self) -> bool:
+        return self.total_rows > 0
+
+    def iter_batches(self) -> Iterator[pa.RecordBatch]:
+        """Yields the matching rows as Arrow record batches."""
+        for batch in self._scanner().to_batches():
+            if self._derived_filters and batch.num_rows:
+                mask = self._derived_mask(batch.to_pandas())
+                batch = batch.filter(pa.array(mask.to_numpy())).select(self.columns)
+            if batch.num_rows:
+                yield batch
+
+    def iter_frames(self) -> Iterator[pd.DataFrame]:
+        """Yields the matching rows as DataFrame chunks (with the derived measures)."""
+        if not self._derived_filters:
+            for batch in self.iter_batches():
+                yield add_derived_measures(batch.to_pandas())
+            return
+        for batch in self._scanner().to_batches():
+            df = add_derived_measures(batch.to_pandas())
+            df = df[frame_filter_mask(df, self._derived_filters)]
+            if len(df):
+                yield self._drop_inputs(df)
+
+    def _drop_inputs(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Drops the columns read only to compute the derived measures."""
+        return df.drop(columns=[col for col in self._read_columns if col not in self.columns])
+
+    def _collect(self, limit: Optional[int]) -> pd.DataFrame:
+        """Concatenates the filtered frames until limit rows (derived filters only)."""
+        frames, rows = [], 0
+        for frame in self.iter_frames():
+            frames.append(frame)
+            rows += len(frame)
+            if limit is not None and rows >= limit:
+                break
+        if not frames:
+            return self._drop_inputs(add_derived_measures(self._scanner().head(0).to_pandas()))
+        df = pd.concat(frames, ignore_index=True)
+        return df.head(limit) if limit is not None else df
+
+    def head(self, n: int) -> pd.DataFrame:
+        """Reads only the first n matching rows."""
+        if self._derived_filters:
+            return self._collect(n)
+        return add_derived_measures(self._scanner().head(n).to_pandas())
+
+    def to_pandas(self) -> pd.DataFrame:
+        """Materializes the whole result."""
+        if self._derived_filters:
+            return self._collect(None)
+        return add_derived_measures(self._scanner().to_table().to_pandas())
+
+    def to_records(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Returns up to limit rows as a list of dicts (for JSON responses)."""
+        df = self.head(limit) if limit is not None else self.to_pandas()
+        return df.to_dict(orient="records")
+
+
+@dataclass(frozen=True)
+class LoadedVersion:
+    """
+    One published version of the source: the dataset it was read from and its frame.
+    Never modified: a reload or a lazy column load publishes a new LoadedVersion, so
+    whoever holds the frame (in-flight queries, zero-copy views) keeps a consistent one.
+    """
+
+    fingerprint: str
+    dataset: ds.Dataset
+    dataframe: pd.DataFrame
+    # Colunas sob demanda presentes no frame: nome -> bytes, em ordem de uso (LRU)
+    lazy_columns: "OrderedDict[str, int]" = field(default_factory=OrderedDict)
+
+
 class ParquetAdapter(DatabaseAdapter):
-    """Concrete implementation of the adapter for Parquet files."""
+    """
+    Concrete implementation of the adapter for Parquet files.
+    file_path may be a single parquet file or a hive-partitioned directory
+    (une=<codigo>/...), in which case filters on 'une' only read that partition.
+    """
 
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, use_snapshot: bool = True,
+                 lazy_columns_budget_mb: float = DEFAULT_LAZY_COLUMNS_BUDGET_MB):
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"Parquet file not found at: {file_path}")
         self.file_path = file_path
-        self._dataframe = None
+        self.use_snapshot = use_snapshot
+        self.lazy_columns_budget_bytes = int(lazy_columns_budget_mb * 1024 * 1024)
+        # Versão publicada (dataset + DataFrame + colunas sob demanda), trocada por inteiro
+        self._version: Optional[LoadedVersion] = None
+        self._columns_lock = threading.Lock()
+        self._lazy_load_lock = threading.Lock()
+        self.is_partitioned = os.path.isdir(file_path)
+        # Dataset do arquivo em disco, para leituras com pushdown (sem o DataFrame)
+        self._dataset = None
+        self._une_index = None
+        # Recarga em segundo plano
+        self._last_update_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._reload_thread = None
+        self._reload_listeners = []
+        # Última troca de versão: (versão anterior, versão nova, colunas que mudaram)
+        self._last_change: Optional[Tuple[str, str, FrozenSet[str]]] = None
         logger.info(f"ParquetAdapter initialized with file: {file_path}")
 
+    @property
+    def _dataframe(self) -> Optional[pd.DataFrame]:
+        """DataFrame of the published version (None if nothing is loaded)."""
+        version = self._version
+        return version.dataframe if version is not None else None
+
+    @property
+    def _loaded_fingerprint(self) -> Optional[str]:
+        version = self._version
+        return version.fingerprint if version is not None else None
+
+    def loaded_version(self) -> Optional[LoadedVersion]:
+        """The published version (fingerprint and frame read together), or None."""
+        return self._version
+
     def _load_dataframe(self):
         """
         Loads the parquet file into a pandas DataFrame if not already loaded.
         Optimized for Streamlit Cloud memory limits.
         """
+        if self._version is None:
+            # Fingerprint calculado antes da leitura: se o arquivo mudar durante a carga,
+            # o snapshot gravado fica com o fingerprint antigo e é reconstruído depois.
+            fingerprint = self.get_fingerprint()
+            dataset = self._open_dataset()
+            df = self._build_dataframe(dataset, fingerprint)
+            with self._columns_lock:
+                if self._version is None:
+                    self._version = LoadedVersion(fingerprint, dataset, df)
+
+    def _build_dataframe(self, dataset: ds.Dataset, fingerprint: str) -> pd.DataFrame:
+        """
+        Builds the in-memory DataFrame for one version of the source (snapshot or
+        parquet + derived columns + dtype optimization). Does not touch adapter state,
+        so it can run in a background thread while queries keep using the old frame.
+        """
+        MemoryOptimizer.log_memory_usage("Before loading Parquet")
+
+        if self.use_snapshot:
+            snapshot_df = self._read_snapshot(fingerprint)
+            if snapshot_df is not None:
+                MemoryOptimizer.log_memory_usage("After memory-mapping Arrow snapshot")
+                return snapshot_df
+
+        logger.info(f"Loading Parquet file from {self.file_path}...")
+
+        # OTIMIZAÇÃO STREAMLIT CLOUD: Carregar apenas colunas essenciais
+        # (via dataset, o que também funciona de forma transparente sobre as partições)
+        has_essential = all(col in dataset.schema.names for col in ESSENTIAL_COLUMNS)
+        # Fallback: carregar tudo se as colunas essenciais não existirem
+        columns = ESSENTIAL_COLUMNS if has_essential else None
+        df = dataset.to_table(columns=columns).to_pandas()
+
+        logger.info(f"Parquet file loaded. Shape: {df.shape}")
+
+        # Medidas derivadas (vendas_total etc.): lidas do arquivo lateral desta versão,
+        # ou calculadas uma única vez e gravadas para as próximas cargas
+        self._attach_derived_measures(df, fingerprint)
+
+        # Otimizar uso de memória
+        df = MemoryOptimizer.optimize_dataframe_memory(df)
+        MemoryOptimizer.log_memory_usage("After loading and optimizing Parquet")
+
+        if self.use_snapshot:
+            self._write_snapshot(df, fingerprint)
+        return df
+
+    def _attach_derived_measures(self, df: pd.DataFrame, fingerprint: str) -> None:
+        """Adds the derived measures to the freshly loaded frame, in place."""
+        derived_table = read_derived_sidecar(self.file_path, fingerprint)
+        if derived_table is not None and derived_table.num_rows == len(df):
+            derived = derived_table.to_pandas()
+            derived.index = df.index
+            logger.info(f"Medidas derivadas lidas do arquivo lateral: {list(derived.columns)}")
+        else:
+            derived = compute_derived_measures(df)
+            if not len(derived.columns):
+                logger.warning("Nenhuma coluna de vendas mensal encontrada!")
+                return
+            logger.info(f"Medidas derivadas calculadas: {list(derived.columns)}")
+            try:
+                write_derived_sidecar(pa.Table.from_pandas(derived, preserve_index=False),
+                                      self.file_path, fingerprint)
+            except Exception as e:
+                # Ex.: sistema de arquivos somente leitura - seguir sem o arquivo lateral
+                logger.warning(f"Could not write derived measures sidecar: {e}")
+
+        for column in derived.columns:
+            df[column] = derived[column]
+
+    @property
+    def data_version(self) -> str:
+        """
+        Version of the data currently served: fingerprint of the loaded frame, or of
+        the file on disk if nothing is loaded yet. Derived caches are keyed on it.
+        """
+        return self._loaded_fingerprint or self.get_fingerprint()
+
+    def add_reload_listener(self, callback: Callable[[str], None]) -> None:
+        """Registers callback(new_version), called after a reloaded version is swapped in."""
+        self._reload_listeners.append(callback)
+
+    def check_for_update(self, min_interval: float = DEFAULT_RELOAD_CHECK_INTERVAL) -> bool:
+        """
+        Cheap change detection (stat-based fingerprint, at most once per min_interval
+        seconds). If the source changed since the frame was loaded, a background reload
+        is started and True is returned. Never blocks on the reload itself.
+        """
         if self._dataframe is None:
-            MemoryOptimizer.log_memory_usage("Before loading Parquet")
-            logger.info(f"Loading Parquet file from {self.file_path}...")
+            return False  # nada carregado: a próxima carga já lê a versão nova
+        now = time.monotonic()
+        if now - self._last_update_check < min_interval:
+            return False
+        self._last_update_check = now
+
+        try:
+            fingerprint = self.get_fingerprint()
+        except OSError as e:
+            # Ex.: arquivo sendo substituído pelo export - tentar na próxima verificação
+            logger.warning(f"Could not fingerprint {self.file_path}: {e}")
+            return False
+        if fingerprint == self._loaded_fingerprint:
+            return False
+
+        logger.info(f"Source {self.file_path} changed ({self._loaded_fingerprint} -> {fingerprint}) - reloading in background")
+        # Consultas com pushdown passam a ler o arquivo novo; a versão publicada
+        # (DataFrame e o dataset de que veio) continua servindo até a troca.
+        self._dataset = None
+        self._une_index = None
+        return self.reload_in_background() is not None
+
+    def reload_in_background(self) -> Optional[threading.Thread]:
+        """Starts a background reload; returns None if one is already running."""
+        with self._reload_lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return None
+            self._reload_thread = threading.Thread(target=self._reload, name="parquet-reload", daemon=True)
+            self._reload_thread.start()
+            return self._reload_thread
 
-            # OTIMIZAÇÃO STREAMLIT CLOUD: Carregar apenas colunas essenciais
-            essential_cols = ['codigo', 'nome_produto', 'preco_38_percent', 'nomesegmento',
-                            'nome_categoria', 'nome_fabricante', 'mes_01', 'mes_02', 'mes_03',
-                            'mes_04', 'mes_05', 'mes_06', 'mes_07', 'mes_08', 'mes_09',
-                            'mes_10', 'mes_11', 'mes_12', 'une', 'une_nome']
+    def wait_for_reload(self, timeout: Optional[float] = None) -> bool:
+        """Waits for a running background reload. Returns False on timeout."""
+        thread = self._reload_thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
 
+    def _reload(self) -> None:
+        """Builds the new version off the query path and swaps it in atomically."""
+        try:
+            fingerprint = self.get_fingerprint()
+            dataset = self._open_dataset()
+            df = self._build_dataframe(dataset, fingerprint)
+        except Exception as e:
+            # Mantém a versão antiga servindo; nova tentativa na próxima verificação
+            logger.error(f"Background reload of {self.file_path} failed: {e}", exc_info=True)
+            return
+
+        # Ainda fora do caminho das consultas: quais colunas a nova versão alterou
+        old = self._version
+        changed = self._diff_columns(old.dataframe, df, dataset.schema.names) if old is not None else None
+
+        with self._columns_lock:
+            # Troca de referências: quem já pegou a versão antiga termina nela
+            self._version = LoadedVersion(fingerprint, dataset, df)
+            self._dataset = dataset
+            self._une_index = None
+            self._last_change = (old.fingerprint, fingerprint, changed) if changed is not None else None
+        logger.info(f"Dataset version {fingerprint} swapped in. Shape: {df.shape}")
+
+        for callback in list(self._reload_listeners):
             try:
-                self._dataframe = pd.read_parquet(self.file_path, columns=essential_cols)
-            except:
-                # Fallback: carregar tudo se colunas específicas falharem
-                self._dataframe = pd.read_parquet(self.file_path)
+                callback(fingerprint)
+            except Exception as e:
+                logger.warning(f"Reload listener failed: {e}")
 
-            logger.info(f"Parquet file loaded. Shape: {self._dataframe.shape}")
+    @staticmethod
+    def _diff_columns(old: pd.DataFrame, new: pd.DataFrame, source_columns: List[str]) -> FrozenSet[str]:
+        """
+        Columns whose values differ between two versions. Only columns loaded in both
+        frames can be compared; any other column (e.g. a lazy column not loaded) counts
+        as changed.
+        """
+        start = time.perf_counter()
+        columns = set(old.columns) | set(new.columns) | set(source_columns)
+        if len(old) != len(new):
+            changed = columns
+        else:
+            changed = {col for col in columns
+                       if col not in old.columns or col not in new.columns or not old[col].equals(new[col])}
+        logger.info(f"Version diff: {len(changed)} of {len(columns)} columns changed "
+                    f"({time.perf_counter() - start:.3f}s)")
+        return frozenset(changed)
 
-            # CRIAR COLUNA VENDAS_TOTAL: Somar vendas de todos os meses
-            vendas_colunas = [f'mes_{i:02d}' for i in range(1, 13)]
-            vendas_colunas_existentes = [col for col in vendas_colunas if col in self._dataframe.columns]
+    def changed_columns(self, since_version: Optional[str]) -> Optional[FrozenSet[str]]:
+        """
+        Columns changed between since_version and the version currently served, or
+        None when unknown (since_version is not the one right before the last reload).
+        """
+        if since_version == self.data_version:
+            return frozenset()
+        change = self._last_change
+        if change is not None and change[0] == since_version and change[1] == self._loaded_fingerprint:
+            return change[2]
+        return None
 
-            if vendas_colunas_existentes:
-                logger.info(f"Criando coluna vendas_total com colunas: {vendas_colunas_existentes}")
-                self._dataframe['vendas_total'] = self._dataframe[vendas_colunas_existentes].fillna(0).sum(axis=1)
-                logger.info(f"Coluna vendas_total criada. Min: {self._dataframe['vendas_total'].min()}, Max: {self._dataframe['vendas_total'].max()}")
-            else:
-                logger.warning("Nenhuma coluna de vendas mensal encontrada!")
+    def _snapshot_path(self) -> str:
+        """Path of the Arrow IPC snapshot that sits next to the source."""
+        return self.file_path.rstrip("/\\") + SNAPSHOT_SUFFIX
+
+    def _read_snapshot(self, fingerprint: str) -> Optional[pd.DataFrame]:
+        """
+        Memory-maps the Arrow IPC snapshot if it matches the current source fingerprint.
+        Numeric columns are backed by the page-cached file (no copy), so several
+        worker processes share one physical copy of the data.
+        Returns None if the snapshot is missing, stale or unreadable.
+        """
+        snapshot_path = self._snapshot_path()
+        if not os.path.exists(snapshot_path):
+            return None
+
+        try:
+            reader = pa.ipc.open_file(pa.memory_map(snapshot_path, "r"))
+            metadata = reader.schema.metadata or {}
+            if (metadata.get(b"source_fingerprint") != fingerprint.encode("utf-8") or
+                    metadata.get(b"snapshot_version") != SNAPSHOT_FORMAT_VERSION.encode("utf-8")):
+                logger.info(f"Arrow snapshot {snapshot_path} is stale - rebuilding from parquet")
+                return None
+
+            df = reader.read_all().to_pandas(split_blocks=True)
+            logger.info(f"Arrow snapshot memory-mapped from {snapshot_path}. Shape: {df.shape}")
+            return df
+        except Exception as e:
+            logger.warning(f"Could not read Arrow snapshot {snapshot_path}: {e}")
+            return None
 
-            # Otimizar uso de memória
-            self._dataframe = MemoryOptimizer.optimize_dataframe_memory(self._dataframe)
-            MemoryOptimizer.log_memory_usage("After loading and optimizing Parquet")
+    def _write_snapshot(self, df: pd.DataFrame, fingerprint: str) -> None:
+        """
+        Writes the finished (derived columns + optimized dtypes) DataFrame as an
+        uncompressed Arrow IPC file. Written to a temporary file and renamed, so
+        readers in other processes never see a partial snapshot.
+        """
+        snapshot_path = self._snapshot_path()
+        tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            metadata = dict(table.schema.metadata or {})
+            metadata[b"source_fingerprint"] = fingerprint.encode("utf-8")
+            metadata[b"snapshot_version"] = SNAPSHOT_FORMAT_VERSION.encode("utf-8")
+            table = table.replace_schema_metadata(metadata)
+
+            with pa.OSFile(tmp_path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, snapshot_path)
+            logger.info(f"Arrow snapshot written to {snapshot_path}")
+        except Exception as e:
+            # Ex.: sistema de arquivos somente leitura - seguir sem snapshot
+            logger.warning(f"Could not write Arrow snapshot {snapshot_path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
     def connect(self) -> None:
         """
@@ -66,93 +522,323 @@ class ParquetAdapter(DatabaseAdapter):
         """
         For Parquet, 'disconnect' means clearing the DataFrame from memory.
         """
-        self._dataframe = None
+        self._version = None
         logger.info("Parquet DataFrame cleared from memory.")
 
-    def execute_query(self, query_filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def ensure_columns(self, columns: List[str]) -> List[str]:
         """
-        Executes a query (filters) on the Parquet DataFrame.
-        query_filters example: {"column_name": "value", "another_column": ">10"}
+        Makes sure the given columns are present in the loaded DataFrame.
+
+        Columns outside the essential set (e.g. estoque_atual, nomegrupo) are read
+        from the parquet on first access, one column at a time, dtype-optimized and
+        kept in an LRU cache bounded by lazy_columns_budget_mb. Unknown columns are
+        ignored.
+
+        Returns:
+            The requested columns that are available
         """
-        logger.info(f"Starting execute_query with filters: {query_filters}")
+        df = self.load_columns(columns)
+        return [col for col in columns if col in df.columns]
 
+    def load_columns(self, columns: List[str]) -> pd.DataFrame:
+        """
+        Returns the published frame with the given columns loaded (see ensure_columns).
+
+        Loading never modifies a published frame: the columns are attached to a new
+        frame (sharing the existing column buffers) that is published as the new state
+        of the same version. Columns are only read from the file of that version: if
+        the source changed and a reload is pending, the load waits for the new version.
+        """
         self._load_dataframe()
-        if self._dataframe is None:
-            logger.error("DataFrame not loaded, returning error")
-            return [{"error": "DataFrame not loaded."}]
+        while True:
+            version = self._version
+            if version is None:
+                self._load_dataframe()
+                continue
+            schema_names = version.dataset.schema.names
+            missing = [col for col in columns if col not in version.dataframe.columns and col in schema_names]
+            if not missing:
+                self._touch_lazy_columns(version, columns)
+                return version.dataframe
+
+            if self.get_fingerprint() != version.fingerprint:
+                # O arquivo já é outra versão: as colunas não ficariam alinhadas ao frame
+                self._wait_for_new_version(version)
+                continue
+
+            with self._lazy_load_lock:
+                loaded = {column: self._read_lazy_column(version, column) for column in missing}
+            if self.get_fingerprint() != version.fingerprint:
+                continue  # trocado durante a leitura
+            with self._columns_lock:
+                if self._version is not version:
+                    continue
+                self._version = self._with_lazy_columns(version, loaded, protected=set(columns))
+                return self._version.dataframe
+
+    def _wait_for_new_version(self, version: LoadedVersion) -> None:
+        """Starts (or joins) the reload of a changed source and waits until it is swapped in."""
+        logger.info(f"Source changed since version {version.fingerprint} - waiting for the reload to load columns")
+        self.check_for_update(min_interval=0)
+        self.wait_for_reload()
+        if self._version is version:
+            raise ValueError(f"Source {self.file_path} changed and the reload failed; "
+                             f"columns of version {version.fingerprint} are no longer available")
+
+    def _touch_lazy_columns(self, version: LoadedVersion, columns: List[str]) -> None:
+        """Marks the requested lazy columns as recently used (LRU order)."""
+        if not any(col in version.lazy_columns for col in columns):
+            return
+        with self._columns_lock:
+            if self._version is not version:
+                return
+            lazy_columns = OrderedDict(version.lazy_columns)
+            for column in columns:
+                if column in lazy_columns:
+                    lazy_columns.move_to_end(column)
+            self._version = replace(version, lazy_columns=lazy_columns)
+
+    def _read_lazy_column(self, version: LoadedVersion, column: str) -> pd.Series:
+        """Reads one column of the given version from its parquet, aligned to its frame."""
+        table = version.dataset.to_table(columns=[column])
+        if table.num_rows != len(version.dataframe):
+            raise ValueError(f"Column '{column}' has {table.num_rows} rows, expected {len(version.dataframe)}")
+
+        column_df = MemoryOptimizer.optimize_dataframe_memory(table.to_pandas())
+        column_df.index = version.dataframe.index
+        return column_df[column]
+
+    def _with_lazy_columns(self, version: LoadedVersion, loaded: Dict[str, pd.Series],
+                           protected: set) -> LoadedVersion:
+        """
+        New state of the version with the loaded columns attached and least recently
+        used lazy columns dropped while over the memory budget. The published frame is
+        left untouched; the new one shares its column buffers.
+        """
+        df = version.dataframe.copy(deep=False)
+        lazy_columns = OrderedDict(version.lazy_columns)
+        for column, values in loaded.items():
+            df[column] = values
+            lazy_columns[column] = int(values.memory_usage(deep=True, index=False))
+            logger.info(f"Lazy column '{column}' loaded: {lazy_columns[column] / 1024**2:.2f} MB")
+        for column in protected:
+            if column in lazy_columns:
+                lazy_columns.move_to_end(column)
+
+        evicted = []
+        total_bytes = sum(lazy_columns.values())
+        for column in list(lazy_columns):
+            if total_bytes <= self.lazy_columns_budget_bytes:
+                break
+            if column in protected:
+                continue
+            total_bytes -= lazy_columns.pop(column)
+            evicted.append(column)
+            logger.info(f"Lazy column '{column}' evicted (budget {self.lazy_columns_budget_bytes / 1024**2:.0f} MB)")
+        if evicted:
+            df = df.drop(columns=evicted)
+        return replace(version, dataframe=df, lazy_columns=lazy_columns)
+
+    def get_column_memory_stats(self) -> Dict[str, Any]:
+        """Memory accounting of the loaded DataFrame: essential vs lazily loaded columns."""
+        version = self._version
+        if version is None:
+            return {"loaded": False, "lazy_columns": {}, "lazy_columns_mb": 0.0, "total_mb": 0.0}
+        total_bytes = int(version.dataframe.memory_usage(deep=True).sum())
+        lazy_bytes = sum(version.lazy_columns.values())
+        return {
+            "loaded": True,
+            "lazy_columns": {col: round(size / 1024**2, 3) for col, size in version.lazy_columns.items()},
+            "lazy_columns_mb": round(lazy_bytes / 1024**2, 3),
+            "lazy_budget_mb": round(self.lazy_columns_budget_bytes / 1024**2, 3),
+            "total_mb": round(total_bytes / 1024**2, 3),
+        }
+
+    def get_fingerprint(self) -> str:
+        """Returns the current fingerprint of the underlying parquet file."""
+        return compute_file_fingerprint(self.file_path)
+
+    def _get_dataset(self) -> ds.Dataset:
+        """
+        Returns the pyarrow dataset for the file on disk, opening it lazily (for
+        pushdown reads; columns aligned to the loaded frame come from its version).
+        Opening only reads the footer metadata, not the data.
+        """
+        if self._dataset is None:
+            self._dataset = self._open_dataset()
+        return self._dataset
+
+    def _open_dataset(self) -> ds.Dataset:
+        partitioning = "hive" if self.is_partitioned else None
+        return ds.dataset(self.file_path, format="parquet", partitioning=partitioning)
+
+    def get_une_index(self) -> Dict[int, str]:
+        """
+        Returns the {une: une_nome} map. For partitioned datasets it comes from the
+        sidecar written by the partitioning stage; otherwise from the two columns.
+        """
+        if self._une_index is None:
+            index_path = os.path.join(self.file_path, UNE_INDEX_FILENAME)
+            if self.is_partitioned and os.path.exists(index_path):
+                with open(index_path, "r", encoding="utf-8") as f:
+                    self._une_index = {int(code): name for code, name in json.load(f).items()}
+            else:
+                pairs = self._get_dataset().to_table(columns=["une", "une_nome"]).to_pandas().drop_duplicates()
+                self._une_index = {int(row.une): str(row.une_nome) for row in pairs.itertuples(index=False)}
+        return self._une_index
+
+    def resolve_une_code(self, une: Any) -> Optional[int]:
+        """Resolves a UNE code or UNE name (case insensitive) to its numeric code."""
+        index = self.get_une_index()
+        if isinstance(une, (int, float)) or (isinstance(une, str) and une.strip().isdigit()):
+            code = int(une)
+            if code in index:
+                return code
+        name = str(une).strip().upper()
+        for code, une_nome in index.items():
+            if une_nome.upper() == name:
+                return code
+        return None
+
+    def load_partition(self, une_code: int, extra_columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Loads the essential columns (plus extra_columns) of a single UNE as a DataFrame.
+        On a partitioned dataset only the une=<code> directory is read.
+        """
+        dataset = self._get_dataset()
+        columns = [col for col in ESSENTIAL_COLUMNS + (extra_columns or []) if col in dataset.schema.names]
+        table = dataset.to_table(columns=columns, filter=ds.field(PARTITION_COLUMN) == int(une_code))
+        logger.info(f"UNE {une_code} partition loaded: {table.num_rows} rows, {table.nbytes / 1024**2:.2f} MB")
+        return add_derived_measures(table.to_pandas())
+
+    _parse_condition = staticmethod(parse_condition)
+
+    @staticmethod
+    def _coerce_value(value: Any, field_type: pa.DataType) -> Any:
+        """Converts a filter value to the column type so pyarrow can compare it."""
+        if pa.types.is_dictionary(field_type):
+            field_type = field_type.value_type
+        if isinstance(value, str) and (pa.types.is_integer(field_type) or pa.types.is_floating(field_type)):
+            return pd.to_numeric(value)
+        if (pa.types.is_string(field_type) or pa.types.is_large_string(field_type)) and not isinstance(value, str):
+            return str(value)
+        return value
+
+    def _split_filters(self, query_filters: Dict[str, Any], schema: pa.Schema) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        Splits the filters into (physical, derived): filters on parquet columns are
+        pushed down; filters on derived measures (vendas_total etc.), which only exist
+        after the read, are applied to the result. Raises KeyError for any other column.
+        """
+        physical, derived = {}, {}
+        for column, condition in query_filters.items():
+            if column in schema.names:
+                physical[column] = condition
+            elif column in DERIVED_COLUMNS:
+                derived[column] = condition
+            else:
+                raise KeyError(column)
+        return physical, derived
+
+    def _build_filter_expression(self, query_filters: Dict[str, Any], schema: pa.Schema) -> Optional[ds.Expression]:
+        """
+        Translates the filter dict into a pyarrow dataset expression.
+        The expression is pushed down to the parquet reader, so row groups whose
+        min/max statistics cannot match are skipped without being decoded.
+        Raises KeyError if a filtered column does not exist.
+        """
+        expression = None
+        for column, condition in query_filters.items():
+            logger.info(f"Processing filter - Column: {column}, Condition: {condition}")
+            if column not in schema.names:
+                raise KeyError(column)
+
+            op, value = self._parse_condition(condition)
+            value = self._coerce_value(value, schema.field(column).type)
+            term = COMPARISONS[op](ds.field(column), value)
+            expression = term if expression is None else expression & term
+        return expression
+
+    def _project_columns(self, schema: pa.Schema, columns: Optional[List[str]]) -> List[str]:
+        """Requested columns that exist (essential columns by default; all if none match)."""
+        requested_columns = columns if columns is not None else ESSENTIAL_COLUMNS
+        projected_columns = [col for col in requested_columns if col in schema.names]
+        return projected_columns or schema.names
+
+    def execute_query_stream(self, query_filters: Dict[str, Any], columns: Optional[List[str]] = None,
+                             batch_size: int = DEFAULT_BATCH_SIZE) -> QueryResultStream:
+        """
+        Streaming version of execute_query: returns a lazy QueryResultStream
+        (filters and projection pushed down, no 5000-row truncation, no per-row dicts).
+        Empty filters stream the whole table.
+        Raises KeyError if a filtered column does not exist.
+        """
+        logger.info(f"Starting execute_query_stream with filters: {query_filters}")
+        dataset = self._get_dataset()
+        physical, derived = self._split_filters(query_filters or {}, dataset.schema)
+        expression = self._build_filter_expression(physical, dataset.schema) if physical else None
+        return QueryResultStream(dataset, expression, self._project_columns(dataset.schema, columns),
+                                 batch_size, derived_filters=derived)
+
+    def execute_query(self, query_filters: Dict[str, Any], columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Executes a query (filters) on the Parquet file.
+        query_filters example: {"column_name": "value", "another_column": ">10"}
 
-        logger.info(f"DataFrame shape: {self._dataframe.shape}, Memory usage: {self._dataframe.memory_usage(deep=True).sum() / 1024**2:.2f} MB")
+        Filters and the column projection are pushed down to pyarrow, so only the
+        matching row groups and the requested columns are read from disk. Filters on
+        derived measures (e.g. {"vendas_total": ">100"}) are applied batch by batch
+        after the measures are computed.
+        If columns is None, the essential columns are returned.
+        """
+        logger.info(f"Starting execute_query with filters: {query_filters}")
+
+        try:
+            dataset = self._get_dataset()
+        except Exception as e:
+            logger.error(f"Error opening Parquet dataset: {e}", exc_info=True)
+            return [{"error": "Falha ao abrir o arquivo Parquet.", "details": str(e)}]
 
-        # ✅ FIX CRÍTICO: Evitar cópia completa para economizar memória
-        # filtered_df = self._dataframe.copy()  # REMOVIDO: Causa erro de memória
-        filtered_df = self._dataframe  # Trabalhar diretamente no DataFrame
-        logger.info(f"Applying filters: {query_filters}")
+        schema = dataset.schema
+        available_columns = schema.names
+        projected_columns = self._project_columns(schema, columns)
 
         # Se não há filtros, retorna uma amostra dos dados para análise
         if not query_filters:
             logger.info("Sem filtros específicos. Retornando amostra de dados.")
-            # ✅ OTIMIZAÇÃO: Reduzir tamanho da amostra para evitar problemas de memória
-            sample_size = min(500, len(filtered_df))  # Máximo 500 linhas
-            sample_df = filtered_df.head(sample_size)
+            # ✅ OTIMIZAÇÃO: Ler apenas as primeiras linhas necessárias (máximo 500)
+            sample_df = add_derived_measures(dataset.head(500, columns=projected_columns).to_pandas())
             results = sample_df.to_dict(orient="records")
-            logger.info(f"Amostra retornada com sucesso. {len(results)} linhas de {len(filtered_df)} total.")
+            logger.info(f"Amostra retornada com sucesso. {len(results)} linhas de {dataset.count_rows()} total.")
             return results
 
         try:
-            logger.info(f"Available columns: {list(filtered_df.columns)}")
-
-            for column, condition in query_filters.items():
-                logger.info(f"Processing filter - Column: {column}, Condition: {condition}")
-
-                # ✅ VALIDAÇÃO: Verificar se a coluna existe
-                if column not in filtered_df.columns:
-                    logger.error(f"Column '{column}' not found in DataFrame. Available columns: {list(filtered_df.columns)}")
-                    return [{"error": f"Coluna '{column}' não encontrada. Colunas disponíveis: {list(filtered_df.columns)}"}]
-                if isinstance(condition, str) and (condition.startswith(">") or condition.startswith("<") or condition.startswith(">=") or condition.startswith("<=") or condition.startswith("!=")):
-                    # Handle comparison operators
-                    op = condition[0]
-                    if condition.startswith(">="): op = ">="
-                    elif condition.startswith("<="): op = "<="
-                    elif condition.startswith("!="): op = "!="
-                    
-                    value = condition[len(op):].strip()
-                    
-                    # Try to convert value to numeric if column is numeric
-                    if pd.api.types.is_numeric_dtype(filtered_df[column]):
-                        value = pd.to_numeric(value)
-
-                    if op == ">":
-                        filtered_df = filtered_df[filtered_df[column] > value]
-                    elif op == "<":
-                        filtered_df = filtered_df[filtered_df[column] < value]
-                    elif op == ">=":
-                        filtered_df = filtered_df[filtered_df[column] >= value]
-                    elif op == "<=":
-                        filtered_df = filtered_df[filtered_df[column] <= value]
-                    elif op == "!=":
-                        filtered_df = filtered_df[filtered_df[column] != value]
-                    else:
-                        # Default to equality if operator not recognized or simple string
-                        filtered_df = filtered_df[filtered_df[column] == condition]
-                else:
-                    # Simple equality - with automatic type conversion
-                    # Se a coluna é numérica e a condição é string numérica, converta
-                    if pd.api.types.is_numeric_dtype(filtered_df[column]) and isinstance(condition, str) and condition.isdigit():
-                        condition = pd.to_numeric(condition)
-                    filtered_df = filtered_df[filtered_df[column] == condition]
-
+            logger.info(f"Applying filters: {query_filters}")
+            physical, derived = self._split_filters(query_filters, schema)
+            expression = self._build_filter_expression(physical, schema) if physical else None
             # ✅ OTIMIZAÇÃO: Limitar resultados para evitar problemas de memória
             max_results = 5000  # Limite máximo de resultados
-            if len(filtered_df) > max_results:
-                logger.warning(f"Query returned {len(filtered_df)} rows, limiting to {max_results} for performance")
-                filtered_df = filtered_df.head(max_results)
+
+            if derived:
+                # Medidas derivadas só existem depois da leitura: filtradas lote a lote
+                stream = QueryResultStream(dataset, expression, projected_columns, derived_filters=derived)
+                filtered_df = stream.head(max_results)
+                logger.info(f"Filtered on derived measures {list(derived)}: {len(filtered_df)} rows")
+            else:
+                table = dataset.to_table(columns=projected_columns, filter=expression)
+                logger.info(f"Filtered table read: {table.num_rows} rows, {table.nbytes / 1024**2:.2f} MB")
+
+                if table.num_rows > max_results:
+                    logger.warning(f"Query returned {table.num_rows} rows, limiting to {max_results} for performance")
+                    table = table.slice(0, max_results)
+                filtered_df = add_derived_measures(table.to_pandas())
 
             results = filtered_df.to_dict(orient="records")
-            logger.info(f"Query executed successfully. {len(results)} rows returned from {len(self._dataframe)} total.")
+            logger.info(f"Query executed successfully. {len(results)} rows returned.")
             return results
         except KeyError as e:
-            logger.error(f"Column not found in DataFrame: {e}. Available columns: {list(filtered_df.columns)}", exc_info=True)
-            return [{"error": f"Coluna não encontrada: {e}. Colunas disponíveis: {list(filtered_df.columns)}."}]
+            logger.error(f"Column not found in Parquet file: {e}. Available columns: {available_columns}", exc_info=True)
+            return [{"error": f"Coluna {e} não encontrada. Colunas disponíveis: {available_columns}"}]
         except MemoryError as e:
             logger.error(f"Memory error during query execution: {e}", exc_info=True)
             return [{"error": "Erro de memória. Tente usar filtros mais específicos para reduzir o volume de dados.", "details": str(e)}]
@@ -3,26 +3,30 @@ Módulo de ferramentas de dados para o Agent_BI.
 Estas ferramentas são componentes simples e reutilizáveis que os agentes podem executar.
 """
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 
 from langchain_core.tools import tool
 
-from core.connectivity.parquet_adapter import ParquetAdapter # Corrected Import
+from core.connectivity.parquet_adapter import ParquetAdapter, QueryResultStream # Corrected Import
 
 logger = logging.getLogger(__name__)
 
 @tool
-def fetch_data_from_query(query_filters: Dict[str, Any], parquet_adapter: ParquetAdapter) -> List[Dict[str, Any]]:
+def fetch_data_from_query(query_filters: Dict[str, Any], parquet_adapter: ParquetAdapter) -> Union[QueryResultStream, List[Dict[str, Any]]]:
     """
     Ferramenta que recebe um dicionário de filtros, os executa usando o ParquetAdapter injetado,
-    e retorna os dados brutos como uma lista de dicionários.
+    e retorna um QueryResultStream (lido em lotes, sob demanda) com o total de linhas.
+    Em caso de erro, retorna uma lista com um dicionário de erro.
     query_filters exemplo: {"column_name": "value", "another_column": ">10"}
     """
     logger.info(f"Executando consulta com filtros: {query_filters}")
     try:
-        results = parquet_adapter.execute_query(query_filters)
-        logger.info(f"Consulta executada com sucesso. {len(results)} linhas retornadas.")
+        results = parquet_adapter.execute_query_stream(query_filters)
+        logger.info(f"Consulta executada com sucesso. {results.total_rows} linhas encontradas.")
         return results
+    except KeyError as e:
+        logger.error(f"Coluna não encontrada: {e}")
+        return [{"error": f"Coluna {e} não encontrada."}]
     except Exception as e:
         logger.error(f"Erro ao executar a consulta na ferramenta: {e}", exc_info=True)
         return [{"error": "Falha ao executar a consulta no arquivo Parquet.", "details": str(e)}]
@@ -0,0 +1,179 @@
+"""
+Perfil de Consultas por Etapa - Onde foi o tempo de cada resposta
+Spans de tempo (classificação, carga do dataset, seleção de linhas, agregação,
+método _query_*, gráficos, serialização) acumulados num trace por consulta. O
+trace vai para os metadados do resultado ("timings") e para um buffer circular
+por tipo de consulta, de onde saem count, p50, p95 e p99.
+
+Desligado (o padrão), span() e trace() devolvem um contexto nulo compartilhado:
+o custo é um teste de atributo por chamada. Liga com QUERY_PROFILING=1 ou
+query_profiler.enable().
+"""
+
+import functools
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import nullcontext
+from typing import Any, Callable, Deque, Dict, Optional
+
+import numpy as np
+
+# Execuções mantidas por tipo de consulta para os percentis
+DEFAULT_WINDOW = 512
+
+_NULL = nullcontext()
+
+
+class QueryTrace:
+    """
+    Tempos (ms) das etapas de uma consulta. Os tempos são inclusivos: "query"
+    contém "aggregate" e "chart"; uma etapa repetida (ex.: duas agregações) soma.
+    """
+
+    __slots__ = ("query_type", "stages", "_start")
+
+    def __init__(self, query_type: Optional[str]):
+        self.query_type = query_type
+        self.stages: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    def add(self, stage: str, elapsed_ms: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + elapsed_ms
+
+    def timings(self) -> Dict[str, float]:
+        """Etapas e o total até agora, em ms arredondados."""
+        timings = {stage: round(ms, 3) for stage, ms in self.stages.items()}
+        timings["total"] = round((time.perf_counter() - self._start) * 1000, 3)
+        return timings
+
+
+class _Span:
+    __slots__ = ("trace", "stage", "start")
+
+    def __init__(self, trace: QueryTrace, stage: str):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.stage, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+class _TraceScope:
+    """Abre o trace da thread (ou junta-se ao já aberto) e, no mais externo, registra as estatísticas."""
+
+    __slots__ = ("profiler", "query_type", "trace", "owner")
+
+    def __init__(self, profiler: "QueryProfiler", query_type: Optional[str]):
+        self.profiler = profiler
+        self.query_type = query_type
+
+    def __enter__(self) -> QueryTrace:
+        current = getattr(self.profiler._local, "trace", None)
+        self.owner = current is None
+        if self.owner:
+            current = self.profiler._local.trace = QueryTrace(self.query_type)
+        elif current.query_type is None:
+            current.query_type = self.query_type
+        self.trace = current
+        return current
+
+    def __exit__(self, *exc):
+        if self.owner:
+            self.profiler._local.trace = None
+            self.profiler._record(self.trace)
+        return False
+
+
+class QueryProfiler:
+    """
+    Spans de tempo por etapa e estatísticas por tipo de consulta.
+
+    Args:
+        enabled: Liga a instrumentação
+        window: Execuções mantidas por tipo de consulta (buffer circular)
+    """
+
+    def __init__(self, enabled: bool = False, window: int = DEFAULT_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[Dict[str, float]]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts: Dict[str, int] = defaultdict(int)
+
+    def enable(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+
+    def trace(self, query_type: Optional[str] = None):
+        """
+        Contexto de uma consulta. Aninhado (ex.: process_query -> execute_direct_query)
+        junta-se ao trace externo, que é o registrado. Desligado, devolve None.
+        """
+        if not self.enabled:
+            return _NULL
+        return _TraceScope(self, query_type)
+
+    def span(self, stage: str):
+        """Contexto que soma o tempo da etapa ao trace aberto na thread (se houver)."""
+        if not self.enabled:
+            return _NULL
+        trace = getattr(self._local, "trace", None)
+        return _NULL if trace is None else _Span(trace, stage)
+
+    def _record(self, trace: QueryTrace) -> None:
+        query_type = trace.query_type or "desconhecida"
+        timings = trace.timings()
+        with self._lock:
+            self._samples[query_type].append(timings)
+            self._counts[query_type] += 1
+
+    def get_stats(self, query_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Por tipo de consulta: execuções registradas e p50/p95/p99 (ms) de cada etapa
+        e do total, sobre as últimas `window` execuções.
+        """
+        with self._lock:
+            samples = {qt: list(buffer) for qt, buffer in self._samples.items()
+                       if query_type is None or qt == query_type}
+            counts = dict(self._counts)
+
+        stats = {}
+        for qt, rows in samples.items():
+            stages = {}
+            for stage in dict.fromkeys(stage for row in rows for stage in row):
+                values = np.array([row[stage] for row in rows if stage in row])
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                stages[stage] = {"count": len(values), "p50": round(float(p50), 3),
+                                 "p95": round(float(p95), 3), "p99": round(float(p99), 3)}
+            stats[qt] = {"count": counts.get(qt, 0), "window": len(rows), "stages": stages}
+        return stats
+
+    def reset(self) -> None:
+        """Descarta as estatísticas acumuladas."""
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+
+def profiled(stage: str) -> Callable:
+    """Decorator: a chamada inteira vira um span da etapa no profiler do processo."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not query_profiler.enabled:
+                return fn(*args, **kwargs)
+            with query_profiler.span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Instância única do processo
+query_profiler = QueryProfiler(enabled=os.getenv("QUERY_PROFILING", "0") == "1")
@@ -11,6 +11,8 @@ import numpy as np
 from typing import Dict, List, Any, Optional
 import logging
 
+from core.utils.query_profiler import profiled
+
 logger = logging.getLogger(__name__)
 
 class AdvancedChartGenerator:
@@ -70,6 +72,7 @@ class AdvancedChartGenerator:
             }
         }
 
+    @profiled("chart")
     def create_product_ranking_chart(self, df: pd.DataFrame, limit: int = 10,
                                    chart_type: str = 'horizontal_bar') -> go.Figure:
         """
@@ -135,6 +138,7 @@ class AdvancedChartGenerator:
             logger.error(f"Erro ao criar gráfico de ranking de produtos: {e}")
             raise
 
+    @profiled("chart")
     def create_filial_performance_chart(self, df: pd.DataFrame,
                                       chart_type: str = 'bar') -> go.Figure:
         """
@@ -191,6 +195,7 @@ class AdvancedChartGenerator:
             logger.error(f"Erro ao criar gráfico de performance de filiais: {e}")
             raise
 
+    @profiled("chart")
     def create_temporal_comparison_chart(self, df: pd.DataFrame,
                                        period_columns: List[str],
                                        chart_type: str = 'line') -> go.Figure:
@@ -274,6 +279,7 @@ class AdvancedChartGenerator:
             logger.error(f"Erro ao criar gráfico temporal: {e}")
             raise
 
+    @profiled("chart")
     def create_segmentation_chart(self, df: pd.DataFrame, segment_column: str,
                                 value_column: str, chart_type: str = 'pie') -> go.Figure:
         """
@@ -334,6 +340,7 @@ class AdvancedChartGenerator:
             logger.error(f"Erro ao criar gráfico de segmentação: {e}")
             raise
 
+    @profiled("chart")
     def create_kpi_dashboard(self, kpis: Dict[str, Any]) -> go.Figure:
         """
         Cria dashboard com KPIs principais.
@@ -396,6 +403,7 @@ class AdvancedChartGenerator:
             logger.error(f"Erro ao criar dashboard de KPIs: {e}")
             raise
 
+    @profiled("chart")
     def create_advanced_comparison_chart(self, df: pd.DataFrame,
                                        comparison_type: str = 'month_over_month') -> go.Figure:
         """
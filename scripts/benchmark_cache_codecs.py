@@ -0,0 +1,101 @@
+# scripts/benchmark_cache_codecs.py
+"""
+Compara os codecs do SmartCache (serializador+compressor) nas entradas reais:
+resultados do DirectQueryEngine para cada tipo de consulta, embrulhados como o
+SmartCache os grava. Para cada codec: tempo de codificação, de decodificação e
+bytes em disco, somados sobre as entradas sem gráfico e sobre as com gráfico
+(nestas domina recriar a figura plotly, igual em todos os codecs), e quantas
+entradas caíram para pickle.
+
+    python scripts/benchmark_cache_codecs.py --repeat 20
+
+Só entram os codecs com as bibliotecas instaladas (orjson, msgpack, zstandard, lz4).
+Sem o admmat real, um admmat sintético de --rows linhas é gerado em --source.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import logging
+import time
+from datetime import datetime
+
+import numpy as np
+
+from core.connectivity.parquet_adapter import ParquetAdapter
+from core.business_intelligence.cache_codecs import LEGACY_CODEC, available_codecs, decode_entry, encode_entry, get_codec
+from core.business_intelligence.direct_query_engine import DirectQueryEngine
+from benchmark_direct_queries import build_benchmark_queries
+from synthetic_admmat import ensure_benchmark_parquet
+
+
+def cache_entries(engine, queries):
+    """Entradas como o SmartCache grava: resultado + metadados da consulta."""
+    entries = []
+    for (query_type, params), result in zip(queries, engine.execute_many(queries)):
+        entries.append({"result": result, "timestamp": datetime.now(), "query_type": query_type,
+                        "params": params, "tokens_would_use": 100, "data_version": engine._data_version,
+                        "columns": None})
+    return entries
+
+
+def median_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(float(np.median(timings)), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos codecs do SmartCache.")
+    parser.add_argument("--source", default="data/parquet/admmat.parquet", help="Parquet do admmat.")
+    parser.add_argument("--rows", type=int, default=1_100_000, help="Linhas do admmat sintético (se --source não existir).")
+    parser.add_argument("--repeat", type=int, default=20, help="Execuções por codec.")
+    parser.add_argument("--output", help="Arquivo JSON para salvar os resultados.")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    source = ensure_benchmark_parquet(args.source, args.rows)
+    engine = DirectQueryEngine(ParquetAdapter(source))
+    entries = cache_entries(engine, build_benchmark_queries(engine._get_cached_base_data()))
+    charts = sum(entry["result"].get("chart") is not None for entry in entries)
+    print(f"Dataset: {source} | {len(entries)} entradas ({charts} com gráfico)")
+
+    groups = {
+        "sem_grafico": [entry for entry in entries if entry["result"].get("chart") is None],
+        "com_grafico": [entry for entry in entries if entry["result"].get("chart") is not None],
+    }
+    results = {}
+    for name in available_codecs():
+        codec = get_codec(name)
+        results[name] = {"bytes": 0, "pickle_fallbacks": 0}
+        for group, group_entries in groups.items():
+            encoded = [encode_entry(entry, codec) for entry in group_entries]
+            results[name][f"encode_ms_{group}"] = median_ms(
+                lambda: [encode_entry(entry, codec) for entry in group_entries], args.repeat)
+            results[name][f"decode_ms_{group}"] = median_ms(
+                lambda: [decode_entry(data) for data, _ in encoded], args.repeat)
+            results[name]["bytes"] += sum(len(data) for data, _ in encoded)
+            results[name]["pickle_fallbacks"] += sum(used != name for _, used in encoded)
+
+    baseline = results[LEGACY_CODEC]
+    print(f"{'':<16}{'sem gráfico (ms)':>20}{'com gráfico (ms)':>20}")
+    print(f"{'codec':<16}{'codif.':>10}{'decod.':>10}{'codif.':>10}{'decod.':>10}{'bytes':>9}{'x tam.':>8}{'pickle':>8}")
+    for name, stats in sorted(results.items(), key=lambda item: item[1]["encode_ms_sem_grafico"]
+                              + item[1]["decode_ms_sem_grafico"]):
+        print(f"{name:<16}{stats['encode_ms_sem_grafico']:>10.2f}{stats['decode_ms_sem_grafico']:>10.2f}"
+              f"{stats['encode_ms_com_grafico']:>10.2f}{stats['decode_ms_com_grafico']:>10.2f}"
+              f"{stats['bytes']:>9}{stats['bytes'] / baseline['bytes']:>8.2f}{stats['pickle_fallbacks']:>8}")
+    print(f"(somas sobre as entradas de cada grupo; x tam. relativo a {LEGACY_CODEC})")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# scripts/benchmark_direct_queries.py
+"""
+Mede a latência por consulta do DirectQueryEngine sobre o dataset completo,
+depois do aquecimento (dataset, índice e rollups já em memória), isolando o
+custo de montar cada resultado.
+
+    python scripts/benchmark_direct_queries.py --output antes.json
+    (aplicar a mudança)
+    python scripts/benchmark_direct_queries.py --compare antes.json
+
+Mede também o lote completo: as consultas uma a uma contra execute_many.
+
+Sem o admmat real, um admmat sintético de --rows linhas é gerado em --source.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import logging
+import time
+
+import numpy as np
+
+from core.connectivity.parquet_adapter import ParquetAdapter
+from core.business_intelligence.direct_query_engine import DirectQueryEngine
+from synthetic_admmat import ensure_benchmark_parquet
+
+
+def build_benchmark_queries(df):
+    """Consultas de cada tipo, com parâmetros que existem no dataset."""
+    produto = int(df['codigo'].iloc[0])
+    une_nome = str(df['une_nome'].iloc[0])
+    une = int(df['une'].iloc[0])
+    segmento = str(df['nomesegmento'].iloc[0]).lower()
+    return [
+        ("produto_mais_vendido", {}),
+        ("filial_mais_vendeu", {}),
+        ("segmento_campao", {}),
+        ("produtos_sem_vendas", {}),
+        ("estoque_parado", {}),
+        ("consulta_produto_especifico", {"produto_codigo": produto}),
+        ("preco_produto_une_especifica", {"produto_codigo": produto, "une_nome": une_nome}),
+        ("top_produtos_une_especifica", {"limite": 10, "une_nome": une_nome}),
+        ("vendas_une_mes_especifico", {"une_nome": une_nome, "mes_nome": "janeiro"}),
+        ("ranking_vendas_unes", {}),
+        ("produto_mais_vendido_cada_une", {}),
+        ("top_produtos_por_segmento", {"segmento": segmento, "limit": 10}),
+        ("top_produtos_por_segmento", {"segmento": "todos", "limit": 10}),
+        ("evolucao_vendas_produto", {"produto_codigo": produto}),
+        ("produto_vendas_une_barras", {"produto_codigo": produto, "une_codigo": une}),
+        ("produto_vendas_todas_unes", {"produto_codigo": produto}),
+    ]
+
+
+def run_benchmark(engine, queries, repeat):
+    results = {}
+    for query_type, params in queries:
+        name = query_type if query_type not in results else f"{query_type}[{list(params.values())[0]}]"
+        engine.execute_direct_query(query_type, params)  # aquecimento
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = engine.execute_direct_query(query_type, params)
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = {
+            "median_ms": round(float(np.median(timings)), 3),
+            "p95_ms": round(float(np.percentile(timings, 95)), 3),
+            "ok": result.get("type") != "error",
+        }
+    return results
+
+
+def run_batch_benchmark(engine, queries, repeat):
+    """Mediana (ms) do lote inteiro: consultas uma a uma contra execute_many."""
+    sequential, batch = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for query_type, params in queries:
+            engine.execute_direct_query(query_type, params)
+        sequential.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        engine.execute_many(queries)
+        batch.append((time.perf_counter() - start) * 1000)
+    return float(np.median(sequential)), float(np.median(batch))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de latência por consulta do DirectQueryEngine.")
+    parser.add_argument("--source", default="data/parquet/admmat.parquet", help="Parquet do admmat.")
+    parser.add_argument("--rows", type=int, default=1_100_000, help="Linhas do admmat sintético (se --source não existir).")
+    parser.add_argument("--repeat", type=int, default=20, help="Execuções por consulta.")
+    parser.add_argument("--output", help="Arquivo JSON para salvar os resultados.")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar.")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    source = ensure_benchmark_parquet(args.source, args.rows)
+    adapter = ParquetAdapter(source)
+    engine = DirectQueryEngine(adapter)
+    df = engine._get_cached_base_data()
+    print(f"Dataset: {source} ({len(df)} linhas)")
+
+    results = run_benchmark(engine, build_benchmark_queries(df), args.repeat)
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print(f"{'consulta':<44}{'mediana ms':>12}{'p95 ms':>10}" + (f"{'antes ms':>12}{'ganho':>9}" if baseline else ""))
+    for name, stats in results.items():
+        line = f"{name:<44}{stats['median_ms']:>12.3f}{stats['p95_ms']:>10.3f}"
+        if name in baseline:
+            before = baseline[name]["median_ms"]
+            line += f"{before:>12.3f}{before / max(stats['median_ms'], 1e-6):>8.1f}x"
+        if not stats["ok"]:
+            line += "  (erro)"
+        print(line)
+
+    queries = build_benchmark_queries(df)
+    sequential_ms, batch_ms = run_batch_benchmark(engine, queries, max(1, args.repeat // 4))
+    print(f"\nLote de {len(queries)} consultas: uma a uma {sequential_ms:.1f} ms | "
+          f"execute_many {batch_ms:.1f} ms ({sequential_ms / max(batch_ms, 1e-6):.1f}x)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# scripts/benchmark_execution_backends.py
+"""
+Compara os backends de execução nas agregações das consultas de ranking e
+agrupamento: pandas (referência, com o dataset já em memória) contra DuckDB
+sobre o parquet com 1, 2, 4 e 8 threads.
+
+    python scripts/benchmark_execution_backends.py --threads 1 2 4 8
+
+O ganho com mais threads é limitado pelos núcleos da máquina (impressos no
+início). Sem o admmat real, um admmat sintético de --rows linhas é gerado em --source.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import logging
+import time
+
+import numpy as np
+
+from core.connectivity.parquet_adapter import ParquetAdapter
+from core.business_intelligence.execution_backends import DUCKDB_AVAILABLE, DuckDBBackend, PandasBackend
+from synthetic_admmat import ensure_benchmark_parquet
+
+# Agregações feitas pelas consultas do backend: nome -> (group_by, measures, filters)
+AGGREGATIONS = {
+    "produto_mais_vendido (codigo)": (["codigo"], ["vendas_total"], None),
+    "ranking_vendas_unes (une)": (["une"], ["vendas_total"], None),
+    "segmento_campao (nomesegmento)": (["nomesegmento"], ["vendas_total"], None),
+    "cada_une (une, codigo)": (["une", "codigo"], ["vendas_total"], None),
+    "top_por_segmento (filtro)": (["codigo"], ["vendas_total"],
+                                  {"nomesegmento": lambda s: s.astype(str).str.lower().str.contains("papel")}),
+}
+
+
+def median_ms(backend, group_by, measures, filters, repeat):
+    backend.aggregate(group_by, measures, filters)  # aquecimento
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        backend.aggregate(group_by, measures, filters)
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(float(np.median(timings)), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos backends de execução (pandas x DuckDB).")
+    parser.add_argument("--source", default="data/parquet/admmat.parquet", help="Parquet do admmat.")
+    parser.add_argument("--rows", type=int, default=1_100_000, help="Linhas do admmat sintético (se --source não existir).")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8], help="Threads do DuckDB a medir.")
+    parser.add_argument("--repeat", type=int, default=5, help="Execuções por agregação.")
+    parser.add_argument("--output", help="Arquivo JSON para salvar os resultados.")
+    args = parser.parse_args()
+
+    if not DUCKDB_AVAILABLE:
+        sys.exit("DuckDB não instalado (pip install duckdb)")
+
+    logging.disable(logging.INFO)
+    source = ensure_benchmark_parquet(args.source, args.rows)
+    adapter = ParquetAdapter(source)
+    reference = PandasBackend(adapter)
+    adapter._load_dataframe()
+    print(f"Dataset: {source} ({len(adapter._dataframe)} linhas) | núcleos: {os.cpu_count()}")
+
+    results = {}
+    for name, (group_by, measures, filters) in AGGREGATIONS.items():
+        results[name] = {"pandas": median_ms(reference, group_by, measures, filters, args.repeat)}
+    for threads in args.threads:
+        backend = DuckDBBackend(adapter, threads=threads)
+        for name, (group_by, measures, filters) in AGGREGATIONS.items():
+            results[name][f"duckdb_{threads}"] = median_ms(backend, group_by, measures, filters, args.repeat)
+        backend.close()
+
+    header = f"{'agregação (mediana ms)':<34}{'pandas':>10}" + "".join(f"{f'duckdb x{t}':>12}" for t in args.threads)
+    print(header)
+    for name, stats in results.items():
+        line = f"{name:<34}{stats['pandas']:>10.1f}"
+        line += "".join(f"{stats[f'duckdb_{t}']:>12.1f}" for t in args.threads)
+        single = stats[f"duckdb_{args.threads[0]}"]
+        best = min(stats[f"duckdb_{t}"] for t in args.threads)
+        print(line + f"   ({single / max(best, 1e-6):.1f}x entre threads)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# scripts/benchmark_intent_matcher.py
+"""
+Mede consultas por segundo da classificação de intenção sobre as sample_queries
+(e perguntas) de business_question_templates_expanded.json: regras testadas uma
+a uma (referência) contra o matcher compilado, e classify_intent_direct completo.
+
+    python scripts/benchmark_intent_matcher.py --repeat 2000
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import logging
+import time
+
+from core.business_intelligence.intent_matcher import IntentMatcher
+
+
+def template_queries(node):
+    """Todas as sample_queries e perguntas dos templates."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "sample_queries":
+                yield from value
+            elif key == "question":
+                yield value
+            else:
+                yield from template_queries(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from template_queries(value)
+
+
+def measure_qps(classify, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            classify(query)
+    return repeat * len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de consultas/s da classificação de intenção.")
+    parser.add_argument("--templates", default="data/business_question_templates_expanded.json")
+    parser.add_argument("--repeat", type=int, default=2000, help="Passadas sobre as consultas.")
+    parser.add_argument("--source", help="Parquet do admmat, para medir também classify_intent_direct.")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    with open(args.templates, "r", encoding="utf-8") as f:
+        templates = json.load(f)
+    matcher = IntentMatcher.from_templates(templates)
+    queries = [q.lower() for q in template_queries(templates)]
+    print(f"{len(queries)} consultas, {len(matcher.rules)} regras, {args.repeat} passadas")
+
+    results = {
+        "regras uma a uma": measure_qps(matcher.classify_sequential, queries, args.repeat),
+        "matcher compilado": measure_qps(matcher.classify, queries, args.repeat),
+    }
+    if args.source:
+        from core.connectivity.parquet_adapter import ParquetAdapter
+        from core.business_intelligence.direct_query_engine import DirectQueryEngine
+        engine = DirectQueryEngine(ParquetAdapter(args.source))
+        results["classify_intent_direct"] = measure_qps(engine.classify_intent_direct, queries,
+                                                        max(1, args.repeat // 10))
+
+    baseline = results["regras uma a uma"]
+    for name, qps in results.items():
+        print(f"{name:<28}{qps:>14,.0f} consultas/s{qps / baseline:>8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# scripts/benchmark_parallel_aggregation.py
+"""
+Mede a agregação paralela por fatias contra o groupby num único processo,
+com 1, 2, 4 e 8 workers: os groupbys pesados das consultas de ranking e a
+construção completa dos cubos (o custo da primeira consulta de cada versão).
+
+    python scripts/benchmark_parallel_aggregation.py --workers 1 2 4 8
+
+1 worker é o groupby no próprio processo (a referência). O pool é aquecido
+antes das medições (processos criados e snapshot mapeado em cada um). O ganho
+é limitado pelos núcleos da máquina (impressos no início). Sem o admmat real,
+um admmat sintético de --rows linhas é gerado em --source.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import logging
+import time
+
+import numpy as np
+
+from core.connectivity.parquet_adapter import ParquetAdapter
+from core.business_intelligence.parallel_aggregation import ParallelAggregator
+from core.business_intelligence.rollup_cubes import RollupCubes, aggregate_frame
+from synthetic_admmat import ensure_benchmark_parquet
+
+# Agregações das consultas pesadas: nome -> (group_by, measures)
+AGGREGATIONS = {
+    "ranking_vendas_unes (une)": (["une"], ["vendas_total"]),
+    "produto_mais_vendido (codigo)": (["codigo"], ["vendas_total"]),
+    "cada_une (une, codigo)": (["une", "codigo"], ["vendas_total"]),
+    "cubo completo (une, codigo)": (["une", "codigo"], None),
+}
+
+
+def median_ms(fn, repeat):
+    fn()  # aquecimento
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(float(np.median(timings)), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da agregação paralela por fatias.")
+    parser.add_argument("--source", default="data/parquet/admmat.parquet", help="Parquet do admmat.")
+    parser.add_argument("--rows", type=int, default=1_100_000, help="Linhas do admmat sintético (se --source não existir).")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="Números de workers a medir.")
+    parser.add_argument("--repeat", type=int, default=5, help="Execuções por agregação.")
+    parser.add_argument("--output", help="Arquivo JSON para salvar os resultados.")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    source = ensure_benchmark_parquet(args.source, args.rows)
+    adapter = ParquetAdapter(source)
+    adapter._load_dataframe()
+    df = adapter._dataframe
+    print(f"Dataset: {source} ({len(df)} linhas) | núcleos: {os.cpu_count()}")
+
+    results = {name: {} for name in list(AGGREGATIONS) + ["RollupCubes.build"]}
+    for workers in args.workers:
+        aggregator = ParallelAggregator(adapter, workers)
+        aggregate = aggregator.aggregate if workers > 1 else aggregate_frame
+        if workers > 1:
+            aggregator.warm_up()
+        for name, (group_by, measures) in AGGREGATIONS.items():
+            results[name][workers] = median_ms(lambda: aggregate(df, group_by, measures), args.repeat)
+        results["RollupCubes.build"][workers] = median_ms(
+            lambda: RollupCubes.build(df, None, aggregate), max(1, args.repeat // 2))
+        aggregator.close()
+
+    print(f"{'agregação (mediana ms)':<32}" + "".join(f"{f'{w} worker(s)':>14}" for w in args.workers))
+    for name, stats in results.items():
+        line = f"{name:<32}" + "".join(f"{stats[w]:>14.1f}" for w in args.workers)
+        baseline = stats[args.workers[0]]
+        print(line + "   (" + " ".join(f"{baseline / max(stats[w], 1e-6):.1f}x" for w in args.workers) + ")")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
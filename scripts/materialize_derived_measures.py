@@ -0,0 +1,33 @@
+# scripts/materialize_derived_measures.py
+"""
+Grava as medidas derivadas do admmat (vendas_total, últimos 3/6 meses, média
+mensal e receita a preco_38_percent) no arquivo lateral <origem>.derived.parquet.
+Executar após cada exportação do SQL Server (e após particionar/otimizar o layout):
+
+    python scripts/materialize_derived_measures.py --source data/parquet/admmat.parquet
+
+Se o passo não for executado, o ParquetAdapter grava o arquivo na primeira carga.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import logging
+
+from core.connectivity.dataset_layout import materialize_derived_measures
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Materializa as medidas derivadas do admmat.")
+    parser.add_argument("--source", default="data/parquet/admmat.parquet", help="Parquet (ou diretório particionado) de origem.")
+    args = parser.parse_args()
+
+    summary = materialize_derived_measures(args.source)
+    print(f"Colunas: {', '.join(summary['columns'])} | Linhas: {summary['rows']} | Arquivo: {summary['path']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+# scripts/partition_admmat.py
+"""
+Grava o admmat.parquet como dataset particionado por UNE (une=<codigo>/).
+Executar após cada exportação do SQL Server:
+
+    python scripts/partition_admmat.py --source data/parquet/admmat.parquet --output data/parquet/admmat_une
+
+Depois aponte o ParquetAdapter para o diretório gerado.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import logging
+
+from core.connectivity.dataset_layout import write_une_partitioned_dataset
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Particiona o admmat por UNE.")
+    parser.add_argument("--source", default="data/parquet/admmat.parquet", help="Parquet de origem.")
+    parser.add_argument("--output", default="data/parquet/admmat_une", help="Diretório do dataset particionado.")
+    parser.add_argument("--compression", default="zstd", help="Compressão dos arquivos parquet.")
+    args = parser.parse_args()
+
+    summary = write_une_partitioned_dataset(args.source, args.output, compression=args.compression)
+    print(f"Partições: {summary['partitions']} | Linhas: {summary['rows']} | Saída: {summary['output_dir']}")
+
+
+if __name__ == '__main__':
+    main()
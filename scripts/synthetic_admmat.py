@@ -0,0 +1,79 @@
+# scripts/synthetic_admmat.py
+"""
+Gera um admmat sintético (mesmo esquema do export do SQL Server) para os benchmarks,
+quando o data/parquet/admmat.parquet real não está disponível.
+
+    python scripts/synthetic_admmat.py --rows 1100000 --output data/parquet/admmat_sintetico.parquet
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+SEGMENTOS = ["TECIDOS", "PAPELARIA", "ARMARINHO", "FESTAS", "CAMA MESA E BANHO",
+             "ARTES", "INFORMATICA", "UTILIDADES", "BRINQUEDOS", "AVIAMENTOS"]
+N_UNES = 36
+
+
+def make_synthetic_admmat(rows: int = 1_100_000, seed: int = 42) -> pd.DataFrame:
+    """Um registro por produto x UNE, com vendas mensais esparsas (cauda longa)."""
+    rng = np.random.default_rng(seed)
+    n_produtos = max(1, rows // N_UNES)
+    codigos = 100000 + np.arange(n_produtos)
+    une_codes = np.array([1, 2, 3] + list(range(261, 261 + N_UNES - 3)))
+    une_names = np.array(["SCR", "MAD", "TIJ"] + [f"U{code}" for code in une_codes[3:]])
+
+    produto = np.repeat(np.arange(n_produtos), N_UNES)
+    une_pos = np.tile(np.arange(N_UNES), n_produtos)
+    total = len(produto)
+
+    df = pd.DataFrame({
+        "codigo": codigos[produto],
+        "nome_produto": np.char.add("PRODUTO ", codigos.astype(str))[produto],
+        "preco_38_percent": np.round(rng.uniform(1, 200, n_produtos), 2)[produto],
+        "nomesegmento": np.array(SEGMENTOS)[produto % len(SEGMENTOS)],
+        "nome_categoria": np.char.add("CATEGORIA ", (produto % 60).astype(str)),
+        "nome_fabricante": np.char.add("FABRICANTE ", (produto % 400).astype(str)),
+        "une": une_codes[une_pos],
+        "une_nome": une_names[une_pos],
+        "estoque_atual": rng.integers(0, 200, total).astype(np.float64),
+        "nomegrupo": np.char.add("GRUPO ", (produto % 25).astype(str)),
+    })
+    popularidade = rng.pareto(2.0, n_produtos)[produto]
+    sem_vendas = rng.random(total) < 0.3
+    for m in range(1, 13):
+        vendas = np.floor(rng.poisson(1.0, total) * popularidade)
+        vendas[sem_vendas] = 0.0
+        df[f"mes_{m:02d}"] = vendas
+    return df
+
+
+def ensure_benchmark_parquet(source: str, rows: int, seed: int = 42) -> str:
+    """Retorna source se existir; senão grava (uma vez) um admmat sintético em seu lugar."""
+    if os.path.exists(source):
+        return source
+    os.makedirs(os.path.dirname(os.path.abspath(source)), exist_ok=True)
+    print(f"{source} não encontrado - gerando admmat sintético com {rows} linhas...")
+    make_synthetic_admmat(rows, seed).to_parquet(source, index=False, row_group_size=131072)
+    return source
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um admmat sintético.")
+    parser.add_argument("--rows", type=int, default=1_100_000, help="Número aproximado de linhas.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="data/parquet/admmat_sintetico.parquet")
+    args = parser.parse_args()
+
+    if os.path.exists(args.output):
+        os.remove(args.output)
+    ensure_benchmark_parquet(args.output, args.rows, args.seed)
+    print(f"Gravado: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -130,7 +130,11 @@ else:
                 os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
                 mock_data.to_parquet(parquet_path)
                 debug_info.append("⚠️ Arquivo parquet não encontrado - criado dados mock")
-            parquet_adapter = ParquetAdapter(file_path=parquet_path)
+            # Entrada compartilhada do registro: o grafo e o DirectQueryEngine usam o
+            # mesmo adapter, e o parquet é carregado uma única vez no processo
+            from core.business_intelligence.dataset_registry import dataset_registry
+            dataset_entry = dataset_registry.acquire(parquet_path)
+            parquet_adapter = dataset_entry.adapter
             debug_info.append("✅ Parquet OK")
 
             # Debug 6: Inicializar CodeGen
@@ -153,6 +157,7 @@ else:
             return {
                 "llm_adapter": llm_adapter,
                 "parquet_adapter": parquet_adapter,
+                "dataset_entry": dataset_entry,
                 "code_gen_agent": code_gen_agent,
                 "agent_graph": agent_graph
             }
@@ -245,12 +250,14 @@ else:
             try:
                 # 🚀 PRIORIDADE: Tentar DirectQueryEngine primeiro (mais rápido e eficiente)
                 # Tentar usar o DirectQueryEngine primeiro
-                from core.business_intelligence.direct_query_engine import DirectQueryEngine
-                from core.connectivity.parquet_adapter import ParquetAdapter
+                # Engine da entrada do registro aberta na inicialização (mesmo adapter do grafo)
+                if backend_components and backend_components.get("dataset_entry"):
+                    direct_result = backend_components["dataset_entry"].engine.process_query(user_input)
+                else:
+                    from core.business_intelligence.dataset_registry import dataset_registry
 
-                adapter = ParquetAdapter('data/parquet/admmat.parquet')
-                engine = DirectQueryEngine(adapter)
-                direct_result = engine.process_query(user_input)
+                    with dataset_registry.lease('data/parquet/admmat.parquet') as entry:
+                        direct_result = entry.engine.process_query(user_input)
 
                 # Verificar se o DirectQueryEngine conseguiu processar ou se precisa de fallback
                 if direct_result and direct_result.get("type") != "fallback":
@@ -443,7 +450,11 @@ else:
 
                 if content:
                     st.dataframe(pd.DataFrame(content))
-                    st.info(f"📊 {len(content)} registros encontrados")
+                    total_rows = response_data.get("total_rows", len(content))
+                    if total_rows > len(content):
+                        st.info(f"📊 {total_rows} registros encontrados (exibindo {len(content)})")
+                    else:
+                        st.info(f"📊 {total_rows} registros encontrados")
                 else:
                     st.warning("⚠️ Nenhum dado encontrado para a consulta.")
             elif response_type == "clarification":
@@ -22,8 +22,7 @@ st.set_page_config(
 
 # Importações do sistema otimizado
 try:
-    from core.connectivity.parquet_adapter import ParquetAdapter
-    from core.business_intelligence.direct_query_engine import DirectQueryEngine
+    from core.business_intelligence.dataset_registry import dataset_registry
     from core.business_intelligence.smart_cache import SmartCache
     SYSTEM_AVAILABLE = True
 except Exception as e:
@@ -210,22 +209,25 @@ def init_system():
             "./data/parquet/admmat.parquet"
         ]
 
-        parquet_adapter = None
+        # Entrada compartilhada do registro: adapter e engine (índice, cubos) únicos
+        # no processo, mantida enquanto o recurso do Streamlit existir
+        entry = None
         for path in parquet_paths:
             try:
-                parquet_adapter = ParquetAdapter(path)
+                entry = dataset_registry.acquire(path)
                 st.success(f"✅ Dataset carregado: {path}")
                 break
             except FileNotFoundError:
                 continue
 
-        if parquet_adapter is None:
+        if entry is None:
             st.error("❌ Arquivo parquet não encontrado")
             return None, None, None
 
         # Inicializar componentes
+        parquet_adapter = entry.adapter
+        query_engine = entry.engine
         cache = SmartCache(cache_dir="cache", max_size_mb=50)
-        query_engine = DirectQueryEngine(parquet_adapter)
 
         # Pre-carregar cache
         cache.preload_frequent_queries(parquet_adapter)
@@ -338,7 +340,9 @@ def main():
     if query_input:
         with st.spinner("🔍 Processando consulta (sem usar LLM)..."):
             try:
-                # Verificar cache primeiro
+                # Verificar cache primeiro (entradas de outra versão do dataset saem antes)
+                cache.set_data_version(parquet_adapter.data_version,
+                                       parquet_adapter.changed_columns(cache.data_version))
                 query_type, params = query_engine.classify_intent_direct(query_input)
                 cached_result = cache.get(query_type, params)
 
@@ -447,7 +451,7 @@ def create_simple_chart(result: Dict[str, Any]):
             )
         ])
         fig.update_layout(
-            title="🏆 Produto Mais Vendido",
+            title="🏆 Produto Mais Vendido (Total de Todas as UNEs)",
             xaxis_title="Produto",
             yaxis_title="Vendas",
             height=400,
@@ -0,0 +1,59 @@
+# tests/conftest.py
+"""Fixtures compartilhadas: um admmat sintético pequeno, com o mesmo esquema do real."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+UNES = [(1, "SCR"), (2, "MAD"), (3, "TIJ"), (261, "261")]
+SEGMENTOS = ["TECIDOS", "PAPELARIA", "ARMARINHO"]
+
+
+def make_admmat_frame(n_produtos: int = 200, seed: int = 42) -> pd.DataFrame:
+    """Gera um DataFrame no formato do admmat.parquet (um registro por produto x UNE)."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n_produtos):
+        codigo = 100000 + i
+        segmento = SEGMENTOS[i % len(SEGMENTOS)]
+        for une, une_nome in UNES:
+            row = {
+                "codigo": codigo,
+                "nome_produto": f"PRODUTO {codigo}",
+                "preco_38_percent": float(round(rng.uniform(1, 100), 2)),
+                "nomesegmento": segmento,
+                "nome_categoria": f"CATEGORIA {i % 7}",
+                "nome_fabricante": f"FABRICANTE {i % 5}",
+                "une": une,
+                "une_nome": une_nome,
+                "estoque_atual": float(rng.integers(0, 50)),
+                "nomegrupo": f"GRUPO {i % 4}",
+            }
+            for m in range(1, 13):
+                row[f"mes_{m:02d}"] = float(rng.integers(0, 30)) if i % 10 else 0.0
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def admmat_frame():
+    return make_admmat_frame()
+
+
+@pytest.fixture
+def admmat_parquet(tmp_path, admmat_frame):
+    """Grava o admmat sintético em vários row groups e retorna o caminho."""
+    path = tmp_path / "admmat.parquet"
+    admmat_frame.to_parquet(path, index=False, row_group_size=100)
+    return str(path)
+
+
+@pytest.fixture
+def replace_parquet():
+    """Regrava o parquet (como faz o export do SQL Server) com um mtime garantidamente novo."""
+    def _replace(path, df):
+        df.to_parquet(path, index=False, row_group_size=100)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    return _replace
@@ -0,0 +1,55 @@
+# tests/test_cache_codecs.py
+import gzip
+import pickle
+from datetime import datetime
+
+import pytest
+
+from core.business_intelligence.cache_codecs import (LEGACY_CODEC, available_codecs, decode_entry,
+                                                     encode_entry, get_codec)
+from core.business_intelligence.direct_query_engine import DirectQueryEngine
+from core.business_intelligence.smart_cache import SmartCache
+from core.connectivity.parquet_adapter import ParquetAdapter
+
+
+def test_every_codec_round_trips_real_results(admmat_parquet):
+    engine = DirectQueryEngine(ParquetAdapter(admmat_parquet))
+    result = engine.process_query("produto mais vendido")
+    item = {"result": result, "timestamp": datetime.now(), "columns": ["codigo", "vendas_total"]}
+
+    for name in available_codecs():
+        data, used = encode_entry(item, get_codec(name))
+        decoded, header = decode_entry(data)
+        assert used == header == name
+        assert decoded["timestamp"] == item["timestamp"]
+        assert {k: v for k, v in decoded["result"].items() if k != "chart"} == \
+               {k: v for k, v in result.items() if k != "chart"}
+        if result.get("chart") is not None:
+            assert type(decoded["result"]["chart"]) is type(result["chart"])
+
+
+def test_entries_the_serializer_cannot_represent_fall_back_to_pickle():
+    item = {"result": {1: {"a", "b"}}}
+    for name in available_codecs():
+        data, used = encode_entry(item, get_codec(name))
+        assert used.split("+")[1] == name.split("+")[1]
+        assert decode_entry(data) == (item, used)
+
+    # Arquivos antigos (pickle com gzip, sem cabeçalho)
+    assert decode_entry(gzip.compress(pickle.dumps(item))) == (item, LEGACY_CODEC)
+
+    with pytest.raises(ValueError):
+        get_codec("yaml+gzip")
+
+
+def test_smart_cache_reads_entries_written_by_other_codecs(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    for i, name in enumerate(available_codecs()):
+        cache = SmartCache(cache_dir=cache_dir, codec=name, write_behind=False)
+        cache.set("ranking_geral", {"i": i}, {"type": "text", "result": i})
+        assert cache.get_stats()["entries_by_codec"] == {name: 1}
+        cache.close()
+
+    reader = SmartCache(cache_dir=cache_dir, memory_budget_mb=0)
+    for i, _ in enumerate(available_codecs()):
+        assert reader.get("ranking_geral", {"i": i}) == {"type": "text", "result": i}
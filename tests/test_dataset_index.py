@@ -0,0 +1,38 @@
+# tests/test_dataset_index.py
+import pandas as pd
+
+from core.business_intelligence.dataset_index import DatasetIndex, select_rows
+from core.business_intelligence.direct_query_engine import DirectQueryEngine
+from core.connectivity.parquet_adapter import ParquetAdapter
+
+
+def test_index_matches_boolean_masks(admmat_frame):
+    df = admmat_frame
+    index = DatasetIndex(df)
+
+    pd.testing.assert_frame_equal(index.select(df, codigo=100007), df[df["codigo"] == 100007])
+    pd.testing.assert_frame_equal(index.select(df, une=261), df[df["une"] == 261])
+    pd.testing.assert_frame_equal(
+        index.select(df, codigo=100007, une_nome="MAD"),
+        df[(df["codigo"] == 100007) & (df["une_nome"] == "MAD")],
+    )
+    assert index.select(df, codigo=999999).empty
+
+
+def test_index_ignored_for_other_frames(admmat_frame):
+    index = DatasetIndex(admmat_frame)
+    other = admmat_frame.head(8)
+    assert len(select_rows(other, index, une=1)) == 2
+
+
+def test_engine_queries_use_index(admmat_parquet):
+    engine = DirectQueryEngine(ParquetAdapter(admmat_parquet))
+
+    result = engine.execute_direct_query("produto_vendas_une_barras", {"produto_codigo": "100011", "une_codigo": "3"})
+    assert result["type"] == "chart"
+    assert engine._dataset_index is not None
+
+    result = engine.execute_direct_query("preco_produto_une_especifica", {"produto_codigo": "100011", "une_nome": "XYZ"})
+    assert result["type"] == "error"
+    assert "SCR" in result["suggestion"]
+
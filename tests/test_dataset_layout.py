@@ -0,0 +1,62 @@
+# tests/test_dataset_layout.py
+import os
+
+from core.connectivity.dataset_layout import write_une_partitioned_dataset
+from core.connectivity.parquet_adapter import ParquetAdapter
+from core.business_intelligence.direct_query_engine import DirectQueryEngine
+
+
+def test_partitioned_dataset_round_trip(admmat_parquet, admmat_frame, tmp_path):
+    output_dir = str(tmp_path / "admmat_une")
+    summary = write_une_partitioned_dataset(admmat_parquet, output_dir)
+
+    assert summary["partitions"] == admmat_frame["une"].nunique()
+    assert os.path.isdir(os.path.join(output_dir, "une=261"))
+
+    adapter = ParquetAdapter(output_dir)
+    assert adapter.is_partitioned
+    assert adapter.resolve_une_code("mad") == 2
+    assert adapter.resolve_une_code("261") == 261
+
+    results = adapter.execute_query({"une": 2, "codigo": 100005})
+    assert len(results) == 1
+
+    adapter.connect()
+    assert len(adapter._dataframe) == len(admmat_frame)
+    assert adapter._dataframe["vendas_total"].sum() == admmat_frame[[f"mes_{m:02d}" for m in range(1, 13)]].sum().sum()
+
+
+def test_une_scoped_query_reads_only_partition(admmat_parquet, tmp_path):
+    output_dir = str(tmp_path / "admmat_une")
+    write_une_partitioned_dataset(admmat_parquet, output_dir)
+
+    params = {"limite": 5, "une_nome": "TIJ"}
+    expected = DirectQueryEngine(ParquetAdapter(admmat_parquet)).execute_direct_query("top_produtos_une_especifica", params)
+
+    adapter = ParquetAdapter(output_dir)
+    result = DirectQueryEngine(adapter).execute_direct_query("top_produtos_une_especifica", params)
+
+    assert adapter._dataframe is None  # nenhum carregamento completo
+    # O carregamento completo otimiza preços para float32; comparar código e vendas
+    assert [(p["codigo"], p["vendas"]) for p in result["result"]["produtos"]] == \
+        [(p["codigo"], p["vendas"]) for p in expected["result"]["produtos"]]
+
+
+def test_optimize_layout_sorts_and_prunes_row_groups(admmat_parquet, admmat_frame, tmp_path):
+    import pyarrow.parquet as pq
+    from core.connectivity.dataset_layout import optimize_layout
+
+    # Embaralhar para que o arquivo de origem não tenha ordem útil
+    shuffled = admmat_frame.sample(frac=1, random_state=1)
+    shuffled.to_parquet(admmat_parquet, index=False, row_group_size=100)
+
+    output_path = str(tmp_path / "admmat_sorted.parquet")
+    candidates = [{"row_group_size": 100, "compression": "zstd", "use_dictionary": True}]
+    report = optimize_layout(admmat_parquet, output_path, candidates=candidates)
+
+    codigos = pq.read_table(output_path, columns=["codigo"]).column("codigo").to_pylist()
+    assert codigos == sorted(codigos)
+
+    lookup = report["scan_cost"]["consulta_produto_especifico"]
+    assert lookup["after"]["row_groups_read"] < lookup["before"]["row_groups_read"]
+    assert lookup["after"]["rows"] == lookup["before"]["rows"]
@@ -0,0 +1,39 @@
+# tests/test_dataset_registry.py
+from core.business_intelligence.dataset_registry import DatasetRegistry
+
+
+def test_same_file_shares_adapter_and_engine(admmat_parquet):
+    registry = DatasetRegistry()
+
+    with registry.lease(admmat_parquet) as first:
+        with registry.lease(admmat_parquet) as second:
+            assert first is second
+            assert first.engine is second.engine
+            assert first.ref_count == 2
+    assert first.ref_count == 0
+
+
+def test_changed_file_reloads_same_entry(admmat_parquet, admmat_frame, replace_parquet):
+    registry = DatasetRegistry()
+    first = registry.acquire(admmat_parquet)
+    first.adapter.connect()
+    old_version = first.fingerprint
+    registry.release(first)
+
+    replace_parquet(admmat_parquet, admmat_frame.head(40))
+
+    second = registry.acquire(admmat_parquet)
+    assert second is first
+    assert second.adapter.wait_for_reload(timeout=30)
+    assert second.fingerprint != old_version
+    assert len(second.adapter._dataframe) == 40
+
+
+def test_evict_respects_references(admmat_parquet):
+    registry = DatasetRegistry()
+    entry = registry.acquire(admmat_parquet)
+
+    assert registry.evict(admmat_parquet) is False
+    registry.release(entry)
+    assert registry.evict(admmat_parquet) is True
+    assert registry.get_stats() == {}
@@ -0,0 +1,50 @@
+# tests/test_derived_measures.py
+import os
+
+import numpy as np
+
+from core.business_intelligence.direct_query_engine import DirectQueryEngine
+from core.connectivity.dataset_layout import materialize_derived_measures
+from core.connectivity.derived_measures import (DERIVED_COLUMNS, compute_derived_measures,
+                                                derived_sidecar_path, read_derived_sidecar)
+from core.connectivity.parquet_adapter import ParquetAdapter, compute_file_fingerprint
+
+
+def test_compute_derived_measures(admmat_frame):
+    derived = compute_derived_measures(admmat_frame)
+    months = admmat_frame[[f"mes_{m:02d}" for m in range(1, 13)]]
+
+    assert list(derived.columns) == DERIVED_COLUMNS
+    np.testing.assert_allclose(derived["vendas_total"], months.sum(axis=1), rtol=1e-6)
+    np.testing.assert_allclose(derived["vendas_ultimos_3_meses"], months.iloc[:, -3:].sum(axis=1), rtol=1e-6)
+    np.testing.assert_allclose(derived["vendas_ultimos_6_meses"], months.iloc[:, -6:].sum(axis=1), rtol=1e-6)
+    np.testing.assert_allclose(derived["vendas_media_mensal"], months.mean(axis=1), rtol=1e-6)
+    np.testing.assert_allclose(derived["receita_total"],
+                               months.sum(axis=1) * admmat_frame["preco_38_percent"], rtol=1e-6)
+
+
+def test_materialized_sidecar_is_read_by_the_adapter(admmat_parquet, admmat_frame, monkeypatch):
+    summary = materialize_derived_measures(admmat_parquet)
+    assert summary["rows"] == len(admmat_frame)
+    sidecar = read_derived_sidecar(admmat_parquet, compute_file_fingerprint(admmat_parquet))
+    np.testing.assert_allclose(sidecar.column("vendas_total").to_numpy(),
+                               compute_derived_measures(admmat_frame)["vendas_total"])
+
+    def fail(df):
+        raise AssertionError("derived measures recomputed despite a valid sidecar")
+    monkeypatch.setattr("core.connectivity.parquet_adapter.compute_derived_measures", fail)
+
+    adapter = ParquetAdapter(admmat_parquet, use_snapshot=False)
+    adapter.connect()
+    assert set(DERIVED_COLUMNS) <= set(adapter._dataframe.columns)
+
+
+def test_adapter_writes_sidecar_once_and_engine_shares_frame(admmat_parquet):
+    adapter = ParquetAdapter(admmat_parquet, use_snapshot=False)
+    engine = DirectQueryEngine(adapter)
+
+    df = engine._get_cached_base_data()
+    assert os.path.exists(derived_sidecar_path(admmat_parquet))
+    # Sem cópia do DataFrame completo
+    assert df is adapter._dataframe
+    assert "vendas_ultimos_3_meses" in df.columns
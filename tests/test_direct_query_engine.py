@@ -0,0 +1,87 @@
+# tests/test_direct_query_engine.py
+from core.business_intelligence.direct_query_engine import DirectQueryEngine
+from core.connectivity.parquet_adapter import ParquetAdapter
+
+
+def test_stock_queries_load_estoque_on_demand(admmat_parquet):
+    adapter = ParquetAdapter(admmat_parquet)
+    engine = DirectQueryEngine(adapter)
+
+    result = engine.execute_direct_query("estoque_parado", {})
+    assert result["type"] == "estoque_parado"
+
+    result = engine.execute_direct_query("preco_produto_une_especifica", {"produto_codigo": "100011", "une_nome": "MAD"})
+    assert result["result"]["estoque"] is not None
+    assert "estoque_atual" in adapter.get_column_memory_stats()["lazy_columns"]
+
+
+def test_new_dataset_version_invalidates_cached_data(admmat_parquet, admmat_frame, replace_parquet):
+    adapter = ParquetAdapter(admmat_parquet)
+    engine = DirectQueryEngine(adapter)
+
+    old_df = engine._get_cached_base_data()
+    assert len(old_df) == len(admmat_frame)
+
+    replace_parquet(admmat_parquet, admmat_frame.head(40))
+    adapter._last_update_check = 0.0
+    engine._get_cached_base_data()
+    assert adapter.wait_for_reload(timeout=30)
+
+    df = engine._get_cached_base_data()
+    assert len(df) == 40
+    assert engine._dataset_index is None or engine._dataset_index.source is df
+
+
+def _without_charts(result):
+    return {key: value for key, value in result.items() if key != "chart"}
+
+
+def test_execute_many_matches_one_by_one_in_input_order(admmat_parquet):
+    engine = DirectQueryEngine(ParquetAdapter(admmat_parquet))
+    queries = [
+        ("consulta_produto_especifico", {"produto_codigo": "100011"}),
+        ("filial_mais_vendeu", {}),
+        ("evolucao_vendas_produto", {"produto_codigo": "100012"}),
+        ("consulta_produto_especifico", {"produto_codigo": "999"}),
+        ("ranking_vendas_unes", {}),
+        ("estoque_parado", {}),
+        ("consulta_produto_especifico", {"produto_codigo": "100011"}),
+        ("consulta_produto_especifico", {"produto_codigo": "abc"}),
+    ]
+
+    expected = [engine.execute_direct_query(query_type, params) for query_type, params in queries]
+    results = engine.execute_many(queries)
+
+    assert [_without_charts(r) for r in results] == [_without_charts(r) for r in expected]
+    assert results[0] is not results[6]
+
+
+def test_execute_many_aggregates_each_grain_once(admmat_parquet, monkeypatch):
+    engine = DirectQueryEngine(ParquetAdapter(admmat_parquet))
+    engine._get_cached_base_data()
+    rollups = engine._get_rollups()
+    calls = []
+    query = rollups.query
+    monkeypatch.setattr(rollups, "query", lambda *args, **kwargs: calls.append(args) or query(*args, **kwargs))
+
+    engine.execute_many([("filial_mais_vendeu", {}), ("ranking_vendas_unes", {}), ("produto_mais_vendido", {})])
+    assert len(calls) == 2
+
+    engine.execute_many([("filial_mais_vendeu", {})])
+    assert len(calls) == 3
+
+
+def test_produto_mais_vendido_ranks_totals_across_unes(tmp_path, admmat_frame):
+    # 100000 tem a maior linha (uma UNE); 100001 vende menos por UNE, mas mais no total
+    df = admmat_frame[admmat_frame["codigo"].isin([100000, 100001])].copy()
+    months = [f"mes_{m:02d}" for m in range(1, 13)]
+    df[months] = 0.0
+    df.loc[(df["codigo"] == 100000) & (df["une"] == 1), "mes_01"] = 100.0
+    df.loc[df["codigo"] == 100001, "mes_01"] = 60.0
+    path = tmp_path / "admmat.parquet"
+    df.to_parquet(path, index=False)
+
+    result = DirectQueryEngine(ParquetAdapter(str(path))).execute_direct_query("produto_mais_vendido", {})
+    assert result["result"]["codigo"] == 100001 and result["result"]["vendas"] == 240.0
+    assert result["result"]["escopo"] == "total_todas_unes"
+    assert "Todas as UNEs" in result["title"] and "todas as UNEs" in result["summary"]
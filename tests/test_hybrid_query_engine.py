@@ -0,0 +1,113 @@
+# tests/test_hybrid_query_engine.py
+import dataclasses
+
+import pytest
+
+from core.business_intelligence.hybrid_query_engine import HybridQueryEngine
+from core.business_intelligence.query_plan import ROUTE_DIRECT, ROUTE_LLM
+from core.connectivity.parquet_adapter import ParquetAdapter
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def get_completion(self, messages, max_tokens, temperature):
+        self.calls += 1
+        return {"content": "resposta", "usage": {"total_tokens": 42}}
+
+
+@pytest.fixture
+def hybrid(admmat_parquet, tmp_path):
+    engine = HybridQueryEngine(ParquetAdapter(admmat_parquet),
+                               cache_dir=str(tmp_path / "cache"))
+    yield engine
+    engine.close()
+
+
+def _count_classifications(engine, monkeypatch):
+    calls = []
+    classify = engine.direct_engine.classify_intent_direct
+
+    def counting(user_query):
+        calls.append(user_query)
+        return classify(user_query)
+
+    monkeypatch.setattr(engine.direct_engine, "classify_intent_direct", counting)
+    return calls
+
+
+def test_query_is_classified_once_per_request(hybrid, monkeypatch):
+    calls = _count_classifications(hybrid, monkeypatch)
+
+    first = hybrid.process_query("Qual o produto mais vendido?")
+    assert first["source"] == "direct"
+    assert len(calls) == 1
+
+    second = hybrid.process_query("Qual o produto mais vendido?")
+    assert second["source"] == "cache"
+    assert len(calls) == 2
+
+
+def test_plan_is_immutable(hybrid):
+    plan = hybrid.plan_query("Top 10 produtos do segmento tecidos")
+    assert plan.query_type == "top_produtos_por_segmento"
+    assert plan.route == ROUTE_DIRECT
+    assert plan.cache_key == hybrid.cache.make_key(plan.query_type, plan.params_dict())
+
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        plan.query_type = "outro"
+    with pytest.raises(TypeError):
+        plan.params["segmento"] = "outro"
+
+
+def test_unsupported_interpretive_query_goes_to_llm(admmat_parquet, tmp_path, monkeypatch):
+    llm = FakeLLM()
+    engine = HybridQueryEngine(ParquetAdapter(admmat_parquet), llm_adapter=llm, enable_llm_fallback=True,
+                               cache_dir=str(tmp_path / "cache"))
+    monkeypatch.setattr(engine.direct_engine, "process_query",
+                        lambda *args, **kwargs: pytest.fail("consulta direta não deveria rodar"))
+
+    plan = engine.plan_query("Por que as vendas caíram?")
+    assert plan.route == ROUTE_LLM
+
+    result = engine.process_query("Por que as vendas caíram?")
+    assert result["source"] == "llm"
+    assert llm.calls == 1
+
+
+def test_warm_up_runs_pending_queries_in_one_batch(hybrid, monkeypatch):
+    from core.business_intelligence.dataset_registry import dataset_registry
+
+    with dataset_registry.lease(hybrid.parquet_adapter.file_path, hybrid.parquet_adapter) as entry:
+        engine = entry.engine
+    batches = []
+    execute_many = engine.execute_many
+    monkeypatch.setattr(engine, "execute_many", lambda queries: batches.append(queries) or execute_many(queries))
+
+    queries = ["produto mais vendido", "filial mais vendeu", "produto mais vendido"]
+    assert hybrid.cache.warm_up_cache(queries, hybrid.parquet_adapter) == {"success": 2, "errors": 0, "skipped": 1}
+    assert len(batches) == 1 and len(batches[0]) == 2
+
+    assert hybrid.cache.warm_up_cache(queries, hybrid.parquet_adapter)["skipped"] == 3
+
+
+def test_existing_registry_entry_supplies_the_adapter_and_is_released_on_close(admmat_parquet, tmp_path):
+    from core.business_intelligence.dataset_registry import dataset_registry
+
+    registered = ParquetAdapter(admmat_parquet)
+    entry = dataset_registry.acquire(admmat_parquet, registered)
+    try:
+        engine = HybridQueryEngine(ParquetAdapter(admmat_parquet),
+                                   cache_dir=str(tmp_path / "cache"))
+        # Versão e recarga acompanham o adapter que responde as consultas
+        assert engine.parquet_adapter is registered
+        assert engine.direct_engine.parquet_adapter is registered
+        assert entry.ref_count == 2
+
+        engine.close()
+        engine.close()
+        assert entry.ref_count == 1
+    finally:
+        dataset_registry.release(entry)
+    assert dataset_registry.evict(admmat_parquet) is True
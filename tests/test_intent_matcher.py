@@ -0,0 +1,82 @@
+# tests/test_intent_matcher.py
+import json
+import random
+
+import pytest
+
+from core.business_intelligence.intent_matcher import IntentMatcher, IntentRule
+
+TEMPLATES_PATH = "data/business_question_templates_expanded.json"
+
+
+@pytest.fixture(scope="module")
+def templates():
+    with open(TEMPLATES_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def matcher(templates):
+    return IntentMatcher.from_templates(templates)
+
+
+def _template_queries(node):
+    """Todas as sample_queries e perguntas dos templates."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "sample_queries":
+                yield from value
+            elif key == "question":
+                yield value
+            else:
+                yield from _template_queries(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _template_queries(value)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("qual o preço do produto 369947 na une scr?",
+     ("preco_produto_une_especifica", {"produto_codigo": "369947", "une_nome": "SCR"})),
+    ("quais são os 5 produtos mais vendidos na une nig?",
+     ("top_produtos_une_especifica", {"limite": 5, "une_nome": "NIG"})),
+    ("vendas da une tij em março", ("vendas_une_mes_especifico", {"une_nome": "TIJ", "mes_nome": "março"})),
+    ("top 10 produtos do segmento tecidos", ("top_produtos_por_segmento", {"segmento": "tecidos", "limit": 10})),
+    ("quais os top 10 produtos?", ("top_produtos_por_segmento", {"segmento": "todos", "limit": 10})),
+    ("top produto", ("produto_mais_vendido", {"matched_keywords": "top produto"})),
+    ("faturamento mês", ("faturamento_mensal", {"matched_keywords": "faturamento"})),
+    ("informações do 1234567", ("consulta_produto_especifico", {"produto_codigo": "1234567"})),
+    ("como está a scr une", ("consulta_une_especifica", {"une_nome": "SCR"})),
+    ("bom dia", ("analise_geral", {"tipo": "geral"})),
+])
+def test_classify_extracts_params(matcher, query, expected):
+    assert matcher.classify(query) == expected
+
+
+def test_compiled_matches_sequential_rules(matcher, templates):
+    queries = [q.lower() for q in _template_queries(templates)]
+    fragments = ["preço do produto 123456 na une abc", "vendas totais por une", "produto mais vendido em cada une",
+                 "gráfico de barras do produto 12345 na une 22", "histórico 99999", "segmento tecidos",
+                 "produtos estoque parado", "top produtos segmento", "receita", "une scr", "\n", "nada"]
+    rnd = random.Random(7)
+    queries += [" ".join(rnd.sample(fragments, rnd.randint(1, 4))) for _ in range(1000)]
+
+    for query in queries:
+        assert matcher.classify(query) == matcher.classify_sequential(query), query
+
+
+def test_overlapping_keywords_keep_priority():
+    # "top produto" é prefixo de "top produtos segmento" e tem prioridade maior
+    matcher = IntentMatcher([
+        IntentRule("a", keyword="top produto"),
+        IntentRule("b", keyword="top produtos segmento"),
+        IntentRule("c", keyword="produtos"),
+    ])
+    assert matcher.classify("top produtos segmento x") == ("a", {"matched_keywords": "top produto"})
+    assert matcher.classify("os produtos") == ("c", {"matched_keywords": "produtos"})
+
+
+def test_templates_without_rules_fall_back_to_keywords():
+    matcher = IntentMatcher.from_templates({}, fallback_keywords={"faturamento": "faturamento_mensal"})
+    assert matcher.classify("faturamento do mês") == ("faturamento_mensal", {"matched_keywords": "faturamento"})
+    assert matcher.classify("outra coisa") == ("analise_geral", {"tipo": "geral"})
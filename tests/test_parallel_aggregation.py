@@ -0,0 +1,73 @@
+# tests/test_parallel_aggregation.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.business_intelligence import parallel_aggregation
+from core.business_intelligence.direct_query_engine import DirectQueryEngine
+from core.business_intelligence.parallel_aggregation import ParallelAggregator
+from core.business_intelligence.rollup_cubes import RollupCubes, aggregate_frame
+from core.connectivity.parquet_adapter import ParquetAdapter
+
+
+@pytest.fixture
+def loaded_adapter(admmat_parquet, monkeypatch):
+    monkeypatch.setattr(parallel_aggregation, "MIN_PARALLEL_ROWS", 0)
+    adapter = ParquetAdapter(admmat_parquet)
+    adapter._load_dataframe()
+    return adapter
+
+
+def test_shard_aggregates_merge_to_the_single_pass_result(loaded_adapter):
+    df = loaded_adapter._dataframe
+    aggregator = ParallelAggregator(loaded_adapter, workers=3)
+    papelaria = {"nomesegmento": lambda s: s.astype(str).str.lower().str.contains("papel")}
+    try:
+        assert aggregator.warm_up() >= 1
+        for group_by, measures, filters in ((["codigo"], ["vendas_total"], None), (["une"], None, None),
+                                            (["une", "codigo"], ["vendas_total"], None),
+                                            (["codigo"], ["vendas_total"], papelaria)):
+            result = aggregator.aggregate(df, group_by, measures, filters)
+            pd.testing.assert_frame_equal(result, aggregate_frame(df, group_by, measures, filters), rtol=1e-6)
+        assert aggregator.get_stats()["parallel"] == 4
+    finally:
+        aggregator.close()
+    assert not aggregator.get_stats()["pool_active"]
+
+
+def test_shards_are_cut_where_a_contiguous_key_changes(loaded_adapter):
+    df = loaded_adapter._dataframe
+    aggregator = ParallelAggregator(loaded_adapter, workers=3)
+
+    bounds, disjoint = aggregator._shard_bounds(df, ["une", "codigo"], "v1")
+    codigos = df["codigo"].to_numpy()
+    assert disjoint and bounds[0] == 0 and bounds[-1] == len(df)
+    assert all(codigos[b] != codigos[b - 1] for b in bounds[1:-1])
+
+    # une se repete ao longo do dataset (ordenado por codigo): fatias iguais e junção por grupo
+    bounds, disjoint = aggregator._shard_bounds(df, ["une"], "v1")
+    assert not disjoint
+    assert np.array_equal(bounds, np.linspace(0, len(df), 4, dtype=np.int64))
+
+    # Limites em cache por versão e chave: a mesma versão não varre a coluna de novo
+    cached, _ = aggregator._shard_bounds(df, ["codigo"], "v1")
+    shuffled = df.assign(codigo=np.random.default_rng(0).permutation(codigos))
+    assert np.array_equal(aggregator._shard_bounds(shuffled, ["codigo"], "v1")[0], cached)
+    # Versão nova: recalculados (codigo embaralhado deixa de ser contíguo) e os antigos saem
+    assert not aggregator._shard_bounds(shuffled, ["codigo"], "v2")[1]
+    assert {version for version, _ in aggregator._key_bounds} == {"v2"}
+
+
+def test_engine_builds_cubes_in_parallel(admmat_parquet, monkeypatch):
+    monkeypatch.setattr(parallel_aggregation, "MIN_PARALLEL_ROWS", 0)
+    engine = DirectQueryEngine(ParquetAdapter(admmat_parquet), workers=2)
+    try:
+        result = engine.execute_direct_query("produto_mais_vendido_cada_une", {})
+        assert result["type"] == "chart"
+        assert engine.parallel.get_stats()["parallel"] > 0
+
+        expected = RollupCubes.build(engine.parquet_adapter._dataframe, None)
+        for name, cube in expected.cubes.items():
+            pd.testing.assert_frame_equal(engine._rollups.cubes[name], cube, rtol=1e-6)
+    finally:
+        engine.close()
@@ -0,0 +1,240 @@
+# tests/test_parquet_adapter.py
+from core.connectivity.parquet_adapter import ParquetAdapter
+
+
+def test_execute_query_equality_filter(admmat_parquet, admmat_frame):
+    adapter = ParquetAdapter(admmat_parquet)
+    results = adapter.execute_query({"codigo": 100005})
+
+    assert len(results) == len(admmat_frame[admmat_frame["codigo"] == 100005])
+    assert all(row["codigo"] == 100005 for row in results)
+    assert "vendas_total" in results[0]
+    # A consulta filtrada não deve carregar o DataFrame completo
+    assert adapter._dataframe is None
+
+
+def test_execute_query_comparison_operators(admmat_parquet, admmat_frame):
+    adapter = ParquetAdapter(admmat_parquet)
+
+    results = adapter.execute_query({"codigo": ">=100190", "une": "!=1"})
+    expected = admmat_frame[(admmat_frame["codigo"] >= 100190) & (admmat_frame["une"] != 1)]
+    assert len(results) == len(expected)
+
+    results = adapter.execute_query({"une_nome": "MAD", "preco_38_percent": "<10"})
+    expected = admmat_frame[(admmat_frame["une_nome"] == "MAD") & (admmat_frame["preco_38_percent"] < 10)]
+    assert len(results) == len(expected)
+
+
+def test_execute_query_string_value_on_numeric_column(admmat_parquet):
+    adapter = ParquetAdapter(admmat_parquet)
+    assert len(adapter.execute_query({"codigo": "100005"})) == 4
+
+
+def test_execute_query_projection(admmat_parquet):
+    adapter = ParquetAdapter(admmat_parquet)
+    results = adapter.execute_query({"codigo": 100005}, columns=["codigo", "une", "estoque_atual"])
+    assert set(results[0].keys()) == {"codigo", "une", "estoque_atual"}
+
+
+def test_execute_query_unknown_column(admmat_parquet):
+    adapter = ParquetAdapter(admmat_parquet)
+    results = adapter.execute_query({"coluna_inexistente": 1})
+    assert "error" in results[0]
+
+
+def test_execute_query_without_filters_returns_sample(admmat_parquet):
+    adapter = ParquetAdapter(admmat_parquet)
+    results = adapter.execute_query({})
+    assert len(results) == 500
+    assert "vendas_total" in results[0]
+
+
+def test_snapshot_written_and_reused(admmat_parquet):
+    import os
+
+    adapter = ParquetAdapter(admmat_parquet)
+    adapter.connect()
+    snapshot_path = admmat_parquet + ".snapshot.arrow"
+    assert os.path.exists(snapshot_path)
+
+    reloaded = ParquetAdapter(admmat_parquet)
+    snapshot_df = reloaded._read_snapshot(reloaded.get_fingerprint())
+    assert snapshot_df is not None
+    reloaded.connect()
+    assert list(reloaded._dataframe.columns) == list(adapter._dataframe.columns)
+    assert reloaded._dataframe["vendas_total"].sum() == adapter._dataframe["vendas_total"].sum()
+    assert str(reloaded._dataframe["une_nome"].dtype) == str(adapter._dataframe["une_nome"].dtype)
+
+
+def test_snapshot_rebuilt_when_source_changes(admmat_parquet, admmat_frame):
+    import os
+
+    adapter = ParquetAdapter(admmat_parquet)
+    adapter.connect()
+    old_fingerprint = adapter.get_fingerprint()
+
+    admmat_frame.head(8).to_parquet(admmat_parquet, index=False)
+    stat = os.stat(admmat_parquet)
+    os.utime(admmat_parquet, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    reloaded = ParquetAdapter(admmat_parquet)
+    assert reloaded._read_snapshot(reloaded.get_fingerprint()) is None
+    reloaded.connect()
+    assert len(reloaded._dataframe) == 8
+    assert reloaded._read_snapshot(reloaded.get_fingerprint()) is not None
+    assert reloaded.get_fingerprint() != old_fingerprint
+
+
+def test_execute_query_stream_has_no_row_limit(admmat_parquet, admmat_frame):
+    adapter = ParquetAdapter(admmat_parquet)
+    stream = adapter.execute_query_stream({"une": "!=261"}, batch_size=64)
+
+    expected = int((admmat_frame["une"] != 261).sum())
+    assert stream.total_rows == expected
+    assert sum(batch.num_rows for batch in stream.iter_batches()) == expected
+    assert all(len(frame) <= 64 for frame in stream.iter_frames())
+    assert len(stream.head(10)) == 10
+    assert "vendas_total" in stream.to_records(limit=3)[0]
+
+
+def test_fetch_data_from_query_returns_stream(admmat_parquet):
+    from core.tools.data_tools import fetch_data_from_query
+
+    adapter = ParquetAdapter(admmat_parquet)
+    stream = fetch_data_from_query.invoke({"query_filters": {"codigo": 100005}, "parquet_adapter": adapter})
+    assert stream.total_rows == 4
+
+    error = fetch_data_from_query.invoke({"query_filters": {"nao_existe": 1}, "parquet_adapter": adapter})
+    assert "error" in error[0]
+
+
+def test_ensure_columns_loads_lazily_and_aligned(admmat_parquet, admmat_frame):
+    adapter = ParquetAdapter(admmat_parquet)
+    adapter.connect()
+    assert "estoque_atual" not in adapter._dataframe.columns
+
+    assert adapter.ensure_columns(["estoque_atual", "nao_existe"]) == ["estoque_atual"]
+    assert (adapter._dataframe["estoque_atual"].to_numpy() == admmat_frame["estoque_atual"].to_numpy()).all()
+    assert "estoque_atual" in adapter.get_column_memory_stats()["lazy_columns"]
+
+
+def test_lazy_columns_respect_memory_budget(admmat_parquet):
+    adapter = ParquetAdapter(admmat_parquet, lazy_columns_budget_mb=0)
+    adapter.ensure_columns(["estoque_atual"])
+    adapter.ensure_columns(["nomegrupo"])
+
+    # Só a coluna em uso permanece carregada
+    assert "nomegrupo" in adapter._dataframe.columns
+    assert "estoque_atual" not in adapter._dataframe.columns
+    assert list(adapter.get_column_memory_stats()["lazy_columns"]) == ["nomegrupo"]
+
+
+def test_hot_reload_swaps_version_in_background(admmat_parquet, admmat_frame, replace_parquet):
+    adapter = ParquetAdapter(admmat_parquet)
+    adapter.connect()
+    old_df = adapter._dataframe
+    old_version = adapter.data_version
+    swapped = []
+    adapter.add_reload_listener(swapped.append)
+
+    assert adapter.check_for_update(min_interval=0) is False
+
+    replace_parquet(admmat_parquet, admmat_frame.head(40))
+    assert adapter.check_for_update(min_interval=0) is True
+    assert adapter.wait_for_reload(timeout=30)
+
+    # Quem já tinha a referência continua na versão antiga
+    assert len(old_df) == len(admmat_frame)
+    assert len(adapter._dataframe) == 40
+    assert adapter.data_version != old_version
+    assert swapped == [adapter.data_version]
+
+
+def test_reload_reports_the_columns_that_changed(admmat_parquet, admmat_frame, replace_parquet):
+    adapter = ParquetAdapter(admmat_parquet)
+    adapter.connect()
+    old_version = adapter.data_version
+    assert adapter.changed_columns(old_version) == frozenset()
+
+    refreshed = admmat_frame.copy()
+    refreshed["une_nome"] = refreshed["une_nome"] + " (nova)"
+    replace_parquet(admmat_parquet, refreshed)
+    assert adapter.check_for_update(min_interval=0) is True
+    assert adapter.wait_for_reload(timeout=30)
+
+    changed = adapter.changed_columns(old_version)
+    assert "une_nome" in changed
+    assert "vendas_total" not in changed and "codigo" not in changed
+    # Colunas sob demanda não carregadas não podem ser comparadas: contam como alteradas
+    assert "nomegrupo" in changed
+    assert adapter.changed_columns("outra-versao") is None
+
+
+def test_execute_query_filters_on_derived_measures(admmat_parquet, admmat_frame):
+    adapter = ParquetAdapter(admmat_parquet)
+    vendas_total = admmat_frame[[f"mes_{m:02d}" for m in range(1, 13)]].sum(axis=1)
+
+    results = adapter.execute_query({"vendas_total": ">200", "une": 1})
+    expected = admmat_frame[(vendas_total > 200) & (admmat_frame["une"] == 1)]
+    assert "error" not in results[0]
+    assert sorted(row["codigo"] for row in results) == sorted(expected["codigo"])
+    assert all(row["vendas_total"] > 200 for row in results)
+
+    # Colunas lidas só para calcular a medida não vazam para a projeção
+    results = adapter.execute_query({"vendas_total": "<=0"}, columns=["codigo", "une"])
+    assert len(results) == int((vendas_total <= 0).sum())
+    assert {"codigo", "une", "vendas_total"} <= set(results[0])
+    assert not any(col.startswith("mes_") or col == "preco_38_percent" for col in results[0])
+
+    stream = adapter.execute_query_stream({"vendas_total": ">200"}, batch_size=64)
+    assert stream.total_rows == int((vendas_total > 200).sum())
+    assert sum(batch.num_rows for batch in stream.iter_batches()) == stream.total_rows
+    assert adapter._dataframe is None
+
+
+def test_lazy_columns_never_modify_a_published_frame(admmat_parquet):
+    adapter = ParquetAdapter(admmat_parquet, lazy_columns_budget_mb=0)
+    base = adapter.load_columns([])
+    with_estoque = adapter.load_columns(["estoque_atual"])
+    adapter.ensure_columns(["nomegrupo"])   # despeja estoque_atual
+
+    assert "estoque_atual" not in base.columns
+    assert "estoque_atual" in with_estoque.columns and "nomegrupo" not in with_estoque.columns
+    assert "estoque_atual" not in adapter._dataframe.columns
+    # As colunas existentes são compartilhadas, não copiadas
+    assert adapter._dataframe["codigo"].to_numpy().__array_interface__ == base["codigo"].to_numpy().__array_interface__
+
+
+def test_lazy_column_requested_during_reload_comes_from_the_new_version(admmat_parquet, admmat_frame,
+                                                                         replace_parquet):
+    import threading
+
+    adapter = ParquetAdapter(admmat_parquet)
+    adapter.connect()
+    old_df = adapter._dataframe
+    release = threading.Event()
+    build = adapter._build_dataframe
+
+    def held_build(dataset, fingerprint):
+        release.wait(10)
+        return build(dataset, fingerprint)
+
+    adapter._build_dataframe = held_build
+    refreshed = admmat_frame.copy()
+    refreshed["estoque_atual"] = refreshed["estoque_atual"] + 1000
+    replace_parquet(admmat_parquet, refreshed)
+    assert adapter.check_for_update(min_interval=0) is True
+
+    loaded = []
+    requester = threading.Thread(target=lambda: loaded.append(adapter.load_columns(["estoque_atual"])))
+    requester.start()
+    requester.join(0.2)
+    # Recarga em andamento: a coluna do arquivo novo não é anexada ao frame antigo
+    assert requester.is_alive() and adapter._dataframe is old_df
+
+    release.set()
+    requester.join(30)
+    df = loaded[0]
+    assert df is adapter._dataframe and df is not old_df
+    assert (df["estoque_atual"].to_numpy() == refreshed["estoque_atual"].to_numpy()).all()
+    assert "estoque_atual" not in old_df.columns
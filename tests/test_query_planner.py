@@ -0,0 +1,63 @@
+# tests/test_query_planner.py
+import numpy as np
+import pandas as pd
+
+from core.business_intelligence.dataset_index import DatasetIndex
+from core.business_intelligence.direct_query_engine import DirectQueryEngine
+from core.business_intelligence.query_planner import plan_query_data, project_view, shared_row_views
+from core.connectivity.parquet_adapter import ParquetAdapter
+
+
+def test_view_projects_columns_without_copying(admmat_frame):
+    plan = plan_query_data("filial_mais_vendeu", {})
+    source = admmat_frame.assign(vendas_total=0.0)
+    view = project_view(source, plan)
+
+    assert list(view.columns) == ["une", "une_nome", "vendas_total"]
+    assert np.shares_memory(view["vendas_total"].to_numpy(), source["vendas_total"].to_numpy())
+
+
+def test_index_is_valid_for_projections_only(admmat_frame):
+    index = DatasetIndex(admmat_frame)
+    view = project_view(admmat_frame, plan_query_data("produto_vendas_une_barras", {}))
+
+    assert index.aligned_with(view)
+    assert not index.aligned_with(admmat_frame.copy())
+    assert not index.aligned_with(admmat_frame.iloc[::-1])
+
+
+def test_product_queries_get_only_the_product_rows(admmat_frame):
+    plan = plan_query_data("consulta_produto_especifico", {"produto_codigo": "100011"})
+    assert dict(plan.row_filters) == {"codigo": 100011}
+
+    view = project_view(admmat_frame, plan, DatasetIndex(admmat_frame))
+    assert set(view["codigo"]) == {100011}
+    assert len(view) == (admmat_frame["codigo"] == 100011).sum()
+
+
+def test_answers_use_every_row(admmat_parquet, admmat_frame):
+    engine = DirectQueryEngine(ParquetAdapter(admmat_parquet))
+
+    result = engine.execute_direct_query("produtos_sem_vendas", {})
+    sem_vendas = (admmat_frame[[f"mes_{m:02d}" for m in range(1, 13)]].sum(axis=1) == 0).sum()
+    assert result["result"]["total_produtos"] == sem_vendas
+
+    result = engine.execute_direct_query("consulta_produto_especifico", {"produto_codigo": "999"})
+    assert result["error"] == "Produto 999 não encontrado"
+
+
+def test_row_filtered_plans_share_one_selection(admmat_frame):
+    index = DatasetIndex(admmat_frame)
+    plans = [
+        plan_query_data("consulta_produto_especifico", {"produto_codigo": "100011"}),
+        plan_query_data("filial_mais_vendeu", {}),
+        plan_query_data("produto_vendas_todas_unes", {"produto_codigo": "100012"}),
+        plan_query_data("consulta_produto_especifico", {"produto_codigo": "999"}),
+    ]
+
+    views = shared_row_views(admmat_frame, plans, index)
+
+    assert sorted(views) == [0, 2, 3]
+    for position in views:
+        expected = project_view(admmat_frame, plans[position], index)
+        pd.testing.assert_frame_equal(views[position], expected)
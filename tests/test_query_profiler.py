@@ -0,0 +1,60 @@
+# tests/test_query_profiler.py
+import pytest
+
+from core.business_intelligence.direct_query_engine import DirectQueryEngine
+from core.connectivity.parquet_adapter import ParquetAdapter
+from core.utils.query_profiler import QueryProfiler, query_profiler
+
+
+@pytest.fixture
+def profiling():
+    query_profiler.reset()
+    query_profiler.enable()
+    yield query_profiler
+    query_profiler.enable(False)
+    query_profiler.reset()
+
+
+def test_disabled_profiler_adds_nothing(admmat_parquet):
+    assert not query_profiler.enabled
+    assert query_profiler.trace("x") is query_profiler.span("y")
+
+    result = DirectQueryEngine(ParquetAdapter(admmat_parquet)).process_query("produto mais vendido")
+    assert "timings" not in result
+    assert query_profiler.get_stats() == {}
+
+
+def test_stage_timings_go_to_the_result_and_the_stats(admmat_parquet, profiling):
+    engine = DirectQueryEngine(ParquetAdapter(admmat_parquet))
+    for _ in range(3):
+        result = engine.process_query("produto mais vendido")
+
+    timings = result["timings"]
+    assert {"classify", "aggregate", "query", "chart", "total"} <= set(timings)
+    assert timings["query"] >= timings["chart"] and timings["total"] >= timings["query"]
+
+    # process_query -> execute_direct_query: um único registro por pergunta
+    stats = profiling.get_stats("produto_mais_vendido")["produto_mais_vendido"]
+    assert stats["count"] == stats["window"] == 3
+    assert stats["stages"]["load_data"]["count"] >= 1
+    total = stats["stages"]["total"]
+    assert total["p50"] <= total["p95"] <= total["p99"]
+
+
+def test_percentiles_over_a_rolling_window():
+    profiler = QueryProfiler(enabled=True, window=10)
+    for i in range(30):
+        with profiler.trace("consulta") as trace:
+            with profiler.span("etapa"):
+                pass
+            trace.add("etapa", float(i))
+
+    stats = profiler.get_stats()["consulta"]
+    assert (stats["count"], stats["window"]) == (30, 10)
+    assert 24 <= stats["stages"]["etapa"]["p50"] <= 25
+    assert stats["stages"]["etapa"]["p99"] <= 29.1
+
+    # Spans fora de um trace são ignorados
+    with profiler.span("solta"):
+        pass
+    assert profiler.get_stats()["consulta"]["count"] == 30
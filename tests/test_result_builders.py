@@ -0,0 +1,26 @@
+# tests/test_result_builders.py
+import pandas as pd
+
+from core.business_intelligence.result_builders import (bar_chart_data, performance_colors,
+                                                        top_per_group, truncate_labels)
+
+
+def test_performance_colors_buckets():
+    assert performance_colors([100, 70, 69, 30, 29, 0]) == [
+        '#2E8B57', '#2E8B57', '#FFD700', '#FFD700', '#CD5C5C', '#CD5C5C']
+    assert performance_colors([]) == []
+
+
+def test_top_per_group_and_labels():
+    df = pd.DataFrame({"une_nome": ["A", "A", "B", "B"], "codigo": [1, 2, 3, 4],
+                       "vendas_total": [5.0, 9.0, 7.0, 1.0]})
+    top = top_per_group(df, "une_nome", "vendas_total")
+    assert sorted(top["codigo"].tolist()) == [2, 3]
+
+    labels = truncate_labels(pd.Series(["curto", "x" * 12]), 10)
+    assert labels.tolist() == ["curto", "x" * 10 + "..."]
+
+    chart = bar_chart_data(labels, [10, 2], colors=True, bar_height=60)
+    assert chart["y"] == [10.0, 2.0]
+    assert chart["colors"] == ['#2E8B57', '#CD5C5C']
+    assert chart["height"] == 400
@@ -0,0 +1,63 @@
+# tests/test_rollup_cubes.py
+import numpy as np
+
+from core.business_intelligence.direct_query_engine import DirectQueryEngine
+from core.business_intelligence.rollup_cubes import RollupCubes, aggregate_frame, rollup_path
+from core.connectivity.derived_measures import add_derived_measures
+from core.connectivity.parquet_adapter import ParquetAdapter
+
+
+def test_router_picks_smallest_covering_cube(admmat_frame):
+    rollups = RollupCubes.build(add_derived_measures(admmat_frame), version="v1")
+
+    assert rollups.route(["une"]) == "une"
+    assert rollups.route(["codigo"]) == "codigo"
+    assert rollups.route(["codigo"], filter_columns=["nomesegmento"]) == "nomesegmento_codigo"
+    assert rollups.route(["une"], filter_columns=["codigo"]) == "une_codigo"
+    assert rollups.route(["nome_fabricante"]) is None
+
+
+def test_rollup_answers_match_base_rows(admmat_frame):
+    base = add_derived_measures(admmat_frame)
+    rollups = RollupCubes.build(base, version="v1")
+
+    por_une = rollups.query(["une"]).set_index("une")["vendas_total"].sort_index()
+    np.testing.assert_allclose(por_une, base.groupby("une")["vendas_total"].sum().sort_index(), rtol=1e-5)
+
+    filtered = rollups.query(["codigo"], ["vendas_total"], filters={"nomesegmento": lambda s: s == "PAPELARIA"})
+    expected = aggregate_frame(base, ["codigo"], ["vendas_total"], filters={"nomesegmento": lambda s: s == "PAPELARIA"})
+    assert set(filtered["codigo"]) == set(expected["codigo"])
+    assert set(filtered.columns) == set(expected.columns)
+
+    produto = rollups.query(["une"], ["mes_01", "vendas_total"], filters={"codigo": 100011})
+    assert len(produto) == base["une"].nunique()
+    assert "une_nome" in produto.columns
+
+
+def test_rollups_persisted_per_version(admmat_parquet):
+    adapter = ParquetAdapter(admmat_parquet)
+    engine = DirectQueryEngine(adapter)
+
+    result = engine.execute_direct_query("ranking_vendas_unes", {})
+    assert result["type"] == "chart"
+    expected = adapter._dataframe.groupby("une_nome", observed=True)["vendas_total"].sum().max()
+    assert np.isclose(result["result"]["vendas_melhor"], expected, rtol=1e-5)
+
+    version = adapter.data_version
+    assert RollupCubes.load(rollup_path(admmat_parquet), version) is not None
+    assert RollupCubes.load(rollup_path(admmat_parquet), "outra-versao") is None
+
+
+def test_ranking_queries_use_rollups(admmat_parquet):
+    engine = DirectQueryEngine(ParquetAdapter(admmat_parquet))
+
+    for query_type, params in [("produto_mais_vendido", {}), ("filial_mais_vendeu", {}),
+                               ("segmento_campao", {}), ("produto_mais_vendido_cada_une", {}),
+                               ("top_produtos_por_segmento", {"segmento": "papelaria", "limit": 5}),
+                               ("produto_vendas_todas_unes", {"produto_codigo": "100011"})]:
+        result = engine.execute_direct_query(query_type, params)
+        assert result["type"] != "error", (query_type, result)
+
+    assert engine._rollups is not None
+    result = engine.execute_direct_query("top_produtos_por_segmento", {"segmento": "inexistente", "limit": 5})
+    assert result["type"] == "error"
@@ -0,0 +1,266 @@
+# tests/test_smart_cache.py
+import threading
+import time
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+from core.business_intelligence.cache_tiers import (MANIFEST_FILE, DiskTier, MemoryTier, WriteBehindQueue,
+                                                     estimate_size)
+from core.business_intelligence.smart_cache import SmartCache
+
+
+def test_lru_tier_keeps_the_most_recently_used_within_budget():
+    tier = MemoryTier(max_bytes=300, policy="lru")
+    for key in "abc":
+        tier.put(key, key, size=100)
+    tier.get("a")
+    tier.put("d", "d", size=100)
+
+    assert "b" not in tier and {"a", "c", "d"} <= {k for k in "abcd" if k in tier}
+    assert tier.bytes == 300
+    assert not tier.put("huge", "x", size=301)
+    stats = tier.get_stats()
+    assert (stats["hits"], stats["evictions"], stats["rejected"]) == (1, 1, 1)
+
+
+def test_lfu_tier_evicts_the_least_used_oldest_first():
+    tier = MemoryTier(max_bytes=300, policy="lfu")
+    for key in "abc":
+        tier.put(key, key, size=100)
+    for _ in range(3):
+        tier.get("a")
+    tier.get("c")
+    tier.put("d", "d", size=100)   # b: 1 uso
+    tier.put("e", "e", size=100)   # d: 1 uso, mais novo que c (2 usos)
+
+    assert [k for k in "abcde" if k in tier] == ["a", "c", "e"]
+    tier.pop("e")
+    tier.put("f", "f", size=200)   # despeja c (2 usos) e mantém a (4 usos)
+    assert [k for k in "acf" if k in tier] == ["a", "f"]
+    assert tier.bytes == 300
+
+    with pytest.raises(ValueError):
+        MemoryTier(100, policy="fifo")
+
+
+def test_estimate_size_counts_frames_and_shared_objects_once():
+    frame = pd.DataFrame({"x": range(10_000)})
+    assert estimate_size(frame) >= 80_000
+    shared = list(range(1000))
+    assert estimate_size([shared, shared]) < 2 * estimate_size(shared)
+
+
+def test_smart_cache_memory_tier_evicts_instead_of_growing(tmp_path):
+    cache = SmartCache(cache_dir=str(tmp_path / "cache"), memory_budget_mb=0.05)
+    payload = {"type": "chart", "data": list(range(1000))}
+    for i in range(20):
+        cache.set("ranking_geral", {"i": i}, payload)
+
+    stats = cache.get_stats()
+    assert stats["memory_tier"]["bytes"] <= 0.05 * 1024 * 1024
+    assert 0 < stats["memory_cache_size"] < 20
+    assert stats["memory_tier"]["evictions"] > 0
+
+    # Entradas despejadas da memória continuam no disco e voltam a ela
+    assert cache.get("ranking_geral", {"i": 0}) == payload
+    assert cache.get("ranking_geral", {"i": 0}) == payload
+    assert cache.get_stats()["memory_tier"]["hits"] >= 1
+
+
+def test_disk_tier_evicts_least_recently_used_without_listing_the_directory(tmp_path, monkeypatch):
+    disk = DiskTier(tmp_path / "cache", max_bytes=1000)
+
+    def no_glob(*args):
+        raise AssertionError("o diretório não deve ser listado")
+
+    monkeypatch.setattr(type(disk.directory), "glob", no_glob)
+    for key in "abcd":
+        disk.write(key, b"x" * 200)
+    assert disk.read("a") == b"x" * 200
+    evicted = disk.write("e", b"x" * 300)   # 1100 > 1000: despeja até 800
+
+    assert evicted == ["b", "c"]
+    assert disk.keys() == ["d", "a", "e"]
+    assert disk.bytes == 700 and not disk.path("b").exists()
+    assert disk.get_stats()["evictions"] == 2
+
+
+def test_disk_tier_manifest_survives_restart_and_is_rebuilt_only_if_missing(tmp_path):
+    directory = tmp_path / "cache"
+    disk = DiskTier(directory, max_bytes=10_000)
+    disk.write("a", b"1" * 10)
+    disk.write("b", b"2" * 20, expires=time.time() - 1)
+    disk.write("c", b"3" * 30)
+    disk.read("a")
+    disk.discard("c")
+    disk.close()
+
+    reopened = DiskTier(directory, max_bytes=10_000)
+    assert not reopened.get_stats()["rebuilt"]
+    assert reopened.keys() == ["b", "a"] and reopened.bytes == 30
+    assert reopened.read("b") is None            # expirada pelo manifesto
+    assert reopened.get_stats()["expired"] == 1
+    reopened.close()
+
+    (directory / MANIFEST_FILE).unlink()
+    rebuilt = DiskTier(directory, max_bytes=10_000)
+    assert rebuilt.get_stats()["rebuilt"]
+    assert rebuilt.keys() == ["a"] and rebuilt.bytes == 10
+
+
+def test_smart_cache_stats_come_from_the_manifest(tmp_path):
+    cache = SmartCache(cache_dir=str(tmp_path / "cache"))
+    for i in range(5):
+        cache.set("ranking_geral", {"i": i}, {"type": "text", "result": i})
+    assert cache.flush(timeout=10)
+
+    stats = cache.get_stats()
+    assert stats["cache_files"] == 5
+    assert stats["disk_tier"]["bytes"] == sum(p.stat().st_size for p in (tmp_path / "cache").glob("*.cache.gz"))
+
+    restarted = SmartCache(cache_dir=str(tmp_path / "cache"))
+    assert restarted.get("ranking_geral", {"i": 3}) == {"type": "text", "result": 3}
+    restarted.clear_all()
+    assert restarted.get_stats()["cache_files"] == 0
+    assert not list((tmp_path / "cache").glob("*.cache.gz"))
+
+
+def test_versioned_entries_outlive_the_ttl_and_leave_when_the_data_changes(tmp_path):
+    cache = SmartCache(cache_dir=str(tmp_path / "cache"))
+    cache.cache_config["default"] = timedelta(0)
+    cache.set_data_version("v1")
+    cache.set("ranking_geral", {}, {"type": "text", "result": 1})
+
+    assert cache.get("ranking_geral", {}) == {"type": "text", "result": 1}
+    cache.close()
+    restarted = SmartCache(cache_dir=str(tmp_path / "cache"))
+    restarted.set_data_version("v1")
+    assert restarted.get("ranking_geral", {}) == {"type": "text", "result": 1}
+
+    restarted.set_data_version("v2")
+    assert restarted.get_stats()["cache_files"] == 0
+    assert not list((tmp_path / "cache").glob("*.cache.gz"))
+    assert restarted.get("ranking_geral", {}) is None
+
+
+def test_entries_not_reading_changed_columns_carry_over_to_the_new_version(tmp_path):
+    cache = SmartCache(cache_dir=str(tmp_path / "cache"))
+    cache.set_data_version("v1")
+    cache.set("produto_mais_vendido", {}, {"result": "vendas"})
+    cache.set("estoque_parado", {}, {"result": "estoque"})
+    cache.set("consulta_livre", {}, {"result": "todas as colunas"})
+
+    cache.set_data_version("v2", changed_columns={"estoque_atual"})
+    assert cache.get("produto_mais_vendido", {}) == {"result": "vendas"}
+    assert cache.get("estoque_parado", {}) is None
+    assert cache.get("consulta_livre", {}) is None
+
+    # A nova etiqueta está no manifesto: vale depois de reiniciar
+    cache.close()
+    restarted = SmartCache(cache_dir=str(tmp_path / "cache"))
+    restarted.set_data_version("v2")
+    assert restarted.get("produto_mais_vendido", {}) == {"result": "vendas"}
+    assert restarted.invalidate(columns=["vendas_total"]) == 1
+    assert restarted.get("produto_mais_vendido", {}) is None
+
+
+def test_write_behind_coalesces_and_reports_backpressure():
+    written, release = [], threading.Event()
+
+    def slow_write(key, value):
+        release.wait(10)
+        written.append((key, value))
+
+    queue = WriteBehindQueue(slow_write, max_pending=1)
+    queue.submit("a", 1)
+    deadline = time.time() + 10
+    while queue.items() and time.time() < deadline:
+        time.sleep(0.01)   # "a" sai da fila e fica em gravação, presa no release
+    queue.submit("b", 1)
+    queue.submit("b", 2)   # coalescida com a pendente
+    producer = threading.Thread(target=queue.submit, args=("c", 1))
+    producer.start()       # fila cheia: espera o writer
+    time.sleep(0.05)
+    assert producer.is_alive() and queue.peek("b") == 2
+
+    release.set()
+    producer.join(10)
+    assert queue.flush(timeout=10)
+    assert written == [("a", 1), ("b", 2), ("c", 1)]
+    stats = queue.get_stats()
+    assert (stats["queued"], stats["coalesced"], stats["written"], stats["waits"]) == (3, 1, 3, 1)
+    assert stats["depth"] == 0 and stats["wait_ms"] > 0
+
+    queue.close()
+    queue.submit("d", 1)   # depois de close, grava na hora
+    assert written[-1] == ("d", 1)
+
+
+def test_smart_cache_answers_before_the_write_and_drains_on_close(tmp_path):
+    cache = SmartCache(cache_dir=str(tmp_path / "cache"), memory_budget_mb=0)
+    release = threading.Event()
+    persist = cache._persist
+
+    def held_persist(key, item):
+        release.wait(10)
+        persist(key, item)
+
+    cache._writer._write = held_persist
+    cache.set("ranking_geral", {}, {"result": 1})
+    assert cache.get("ranking_geral", {}) == {"result": 1}   # da fila: memória com orçamento zero
+    assert not list((tmp_path / "cache").glob("*.cache.gz"))
+
+    release.set()
+    cache.close()
+    assert len(list((tmp_path / "cache").glob("*.cache.gz"))) == 1
+    assert cache.get_stats()["write_behind"]["written"] == 1
+
+
+def test_entries_are_snapshotted_at_set_and_copied_on_hit(tmp_path):
+    cache = SmartCache(cache_dir=str(tmp_path / "cache"))
+    release = threading.Event()
+    persist = cache._persist
+    cache._writer._write = lambda key, item: release.wait(10) and persist(key, item)
+
+    result = {"type": "text", "result": 1}
+    cache.set("ranking_geral", {}, result)
+    # O chamador segue preenchendo o resultado (como o HybridQueryEngine) e o que recebe do cache
+    result.update(processing_time=0.1, source="direct")
+    hit = cache.get("ranking_geral", {})
+    hit["source"] = "cache"
+    assert cache.get("ranking_geral", {}) == {"type": "text", "result": 1}
+
+    release.set()
+    cache.close()
+    restarted = SmartCache(cache_dir=str(tmp_path / "cache"))
+    assert restarted.get("ranking_geral", {}) == {"type": "text", "result": 1}
+
+
+def test_invalidation_waits_for_the_write_in_flight(tmp_path):
+    cache = SmartCache(cache_dir=str(tmp_path / "cache"))
+    cache.set_data_version("v1")
+    started, release = threading.Event(), threading.Event()
+    persist = cache._persist
+
+    def held_persist(key, item):
+        started.set()
+        release.wait(10)
+        persist(key, item)
+
+    cache._writer._write = held_persist
+    cache.set("ranking_geral", {}, {"result": 1})
+    assert started.wait(10)   # gravação em andamento, presa no release
+
+    invalidation = threading.Thread(target=cache.set_data_version, args=("v2",))
+    invalidation.start()
+    invalidation.join(0.1)
+    assert invalidation.is_alive()
+    release.set()
+    invalidation.join(10)
+
+    assert cache.flush(timeout=10)
+    assert cache.get_stats()["cache_files"] == 0
+    assert not list((tmp_path / "cache").glob("*.cache.gz"))
+    cache.close()